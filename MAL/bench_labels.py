@@ -0,0 +1,36 @@
+"""
+Benchmarks SyntaxChecker.check on programs with a growing number of labels
+"""
+import os
+import tempfile
+import time
+from mal import SyntaxChecker
+from mal_corpus import label_name
+
+LABEL_COUNTS = [1000, 10000, 100000]
+
+
+def write_program(mal_file, label_count):
+    """
+    Write a MAL program with a labelled instruction and a branch for each label.
+        Input: str(mal_file), int(label_count)
+    """
+    with open(mal_file, 'w') as file:
+        for number in range(label_count):
+            label = label_name(number)
+            file.write(label + ": INC R0\n")
+            file.write("BLT R0, R1, " + label.lower() + "\n")
+        file.write("END\n")
+
+
+if __name__ == "__main__":
+    CHECKER = SyntaxChecker()
+    with tempfile.TemporaryDirectory() as directory:
+        for count in LABEL_COUNTS:
+            program = os.path.join(directory, "labels.mal")
+            write_program(program, count)
+            start = time.perf_counter()
+            CHECKER.check(program)
+            elapsed = time.perf_counter() - start
+            print(("{:>7} labels: {:8.3f} s, {:6.2f} us per label").format(
+                count, elapsed, elapsed / count * 1e6))
@@ -2,8 +2,21 @@
 MAL Syntax Checker
 """
 __author__ = "Kenneth Berry"
+__version__ = "1.4"
 
 import datetime
+import gc
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import accumulate, islice, repeat
+from operator import add
+from mal_lexer import COMMA, IDENTIFIER, LABEL_DEF, LITERAL, OPCODE, REGISTER, Lexer
+from mal_stats import CheckStats, no_phase
 
 #########################################################################################
 #                                   Module Constants                                    #
@@ -27,6 +40,22 @@ MAL = {"LOAD": ['R', 'S'],
 # Registers R0-R7
 REGISTERS = ['R' + str(n) for n in range(8)]
 
+# Opcodes in a fixed order, and the index of each opcode
+OPCODES = tuple(MAL)
+OPCODE_IDS = {opcode: index for index, opcode in enumerate(OPCODES)}
+
+# Kind of operand expected for a label, which the lexer reads as an identifier
+LABEL = "label"
+
+# Kinds of operands expected by each MAL instruction, {str(opcode): tuple(kinds)}
+OPERAND_KINDS = {opcode: tuple(REGISTER if 'R' in operand else
+                               LITERAL if 'V' in operand else
+                               IDENTIFIER if 'S' in operand or 'D' in operand else
+                               LABEL for operand in MAL[opcode]) for opcode in MAL}
+
+# Tokenizer for MAL program lines
+LEXER = Lexer(MAL, REGISTERS)
+
 # Error messages
 ERRORS = {"invalid opcode":
           "\n    ** error: invalid opcode {} **",
@@ -51,45 +80,154 @@ ERRORS = {"invalid opcode":
 WARNINGS = {"branch to missing label":
             "    ** warning: branch to missing label {} **",
             "label not branched to":
-            "\n    ** warning: label {} is not branched to **"}
+            "\n    ** warning: label {} is not branched to **",
+            "uninitialized register":
+            "    ** warning: register {} may be read before it is written **",
+            "dead store":
+            "    ** warning: value stored in {} is overwritten before it is read **",
+            "unreachable instruction":
+            "    ** warning: instruction {} can never be run **"}
+
+# Kinds of errors and warnings in a fixed order; the index of each is its code
+DIAGNOSTICS = tuple(ERRORS) + tuple(WARNINGS)
+DIAGNOSTIC_CODES = {key: code for code, key in enumerate(DIAGNOSTICS)}
+
+# Errors whose message gives the number of operands expected
+OPERAND_COUNT_ERRORS = ("too few operands", "too many operands")
+
+# Severities of diagnostics
+ERROR = "error"
+WARNING = "warning"
+
+# Number of distinct instructions whose evaluation a SyntaxChecker remembers
+MEMO_SIZE = 4096
+
+# Number of distinct original lines whose stripped text is remembered while
+# stripping a program
+STRIP_TABLE_SIZE = 4096
+
+# Number of distinct stripped lines whose label and operands are remembered
+# while listing the instructions of an InstructionTable
+LISTING_TABLE_SIZE = 4096
+
+# Programs with no more lines than this are checked in one process even when
+# workers are given
+PARALLEL_LINES = 1 << 16
+
+# Chunks of a program checked in parallel for each worker, so workers that
+# finish early take more chunks, and fewest lines in a chunk
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_LINES = 1 << 12
+
+# Size of the write buffer used for .log files
+REPORT_BUFFER_SIZE = 1 << 16
+
+# Output formats, the .log report and the machine readable formats of mal_emit
+LOG_FORMAT = "log"
+OUTPUT_FORMATS = (LOG_FORMAT, "ndjson", "binary")
+
+# Line endings of a program read with universal newlines, as bytes
+NEWLINE_BYTES = re.compile(rb'\r\n|\r|\n')
+
+# Byte of a semicolon, which starts a comment
+SEMICOLON = ord(';')
 
 #########################################################################################
 #                                   Module Functions                                    #
 #########################################################################################
 
 
-def main(arg):
+def main(arg, stream=False, dataflow=False, stats=False, prometheus_file=None,
+         mapped=False, output_format=LOG_FORMAT, workers=None, memory=False):
     """
     Main function.  Takes mal file argument, checks mal program syntax, and makes
-    a detailed report.
-        Input: str(arg)
+    a detailed report.  In stream mode the program is never held in memory; the
+    file is re-read for each listing in the report.  With data flow checks valid
+    programs are also checked for uninitialized registers, dead stores, and
+    unreachable instructions, and their labels are checked from the control
+    flow graph.  With
+    stats, the time of each phase and the counts are printed, and they are
+    written to the Prometheus file if one is given; with memory, the peak memory
+    of each phase is measured as well, in a second run of the phases.  In mapped
+    mode the file is memory mapped rather than read.  Other output formats write
+    machine readable records in place of the .log report.  With workers, a large
+    program is checked in chunks by that many worker processes.
+        Input: str(arg), bool(stream), bool(dataflow), bool(stats),
+               str(prometheus_file) or None, bool(mapped), str(output_format),
+               int(workers) or None, bool(memory)
     """
     if ".mal" not in arg.lower():
         # ADD .mal suffix to ARG
         arg += ".mal"
-    syntax_checker = SyntaxChecker()
-    report = SyntaxReport(arg, syntax_checker.check(arg))
-    report.write_to_file()
+    syntax_checker = SyntaxChecker(dataflow)
+    if not stats and not memory and prometheus_file is None:
+        write_output(arg, syntax_checker.check(arg, stream, mapped=mapped,
+                                               workers=workers), output_format)
+        return
+
+    checker_output = syntax_checker.check(arg, stream, stats=True, mapped=mapped,
+                                          workers=workers, memory=memory)
+    check_stats = checker_output[2]
+    with check_stats.phase("report"):
+        write_output(arg, checker_output, output_format)
+    if memory:
+        # Writing the same output again only measures its memory
+        check_stats.start_memory()
+        try:
+            with check_stats.phase("report"):
+                write_output(arg, checker_output, output_format)
+        finally:
+            check_stats.stop_memory()
+    if stats or memory:
+        print(check_stats)
+    if prometheus_file is not None:
+        check_stats.write_prometheus(prometheus_file)
     # report.print_to_console()
 
 
+def write_output(mal_file, checker_output, output_format=LOG_FORMAT):
+    """
+    Write the output of a check, as the .log report or as the records of an
+    output format in mal_emit, to a file named for the program with the format's
+    extension.
+        Input: str(mal_file), tuple(checker_output), str(output_format)
+    """
+    if output_format == LOG_FORMAT:
+        SyntaxReport(mal_file, checker_output).write_to_file()
+        return
+    # Imported here since mal_emit imports this module
+    from mal_emit import EMITTERS
+    emitter_class = EMITTERS[output_format]
+    output_file = mal_file.replace(".mal".casefold(), emitter_class.extension)
+    if emitter_class.binary:
+        file = open(output_file, 'wb', buffering=REPORT_BUFFER_SIZE)
+    else:
+        file = open(output_file, 'w', buffering=REPORT_BUFFER_SIZE, encoding="utf-8")
+    with file:
+        emitter_class(file).emit(mal_file, checker_output)
+
+
 def find_labels(lines):
     """
     Find all labels in a dictionary of lines from a mal program
         Input: dict({str(line_num): str(line)})
         Output: dict({str(line_num): str(label_name)})
     """
-    # Look for labels in program
-    labels = dict()
-    for line_num in lines:
-        first_token = lines[line_num].split()[0]
+    return dict(iter_labels(lines.items()))
+
+
+def iter_labels(lines):
+    """
+    Generate the labels defined in a stream of stripped mal program lines.
+        Input: iter((str(line_num), str(line)))
+        Output: iter((str(line_num), str(label_name)))
+    """
+    for line_num, line in lines:
+        first_token = line.split()[0]
         # Check if first token is a label
         if ':' in first_token:
             # Remove colon from label
-            first_token = first_token.replace(':', '')
-            # Add label to labels dictionary
-            labels.update({line_num: first_token})
-    return labels
+            yield line_num, first_token.replace(':', '')
 
 
 def is_octal_number(number):
@@ -114,17 +252,72 @@ def read_file(mal_file):
         Input: str(mal_file)
         Output: dict({str(line_num): str(line)})
     """
-    lines = dict()
     with open(mal_file, 'r') as file:
-        # Add lines to dictionary: {line_num: line}
-        for index, line in enumerate(file):
-            # Remove newline characters
-            line = line.replace('\n', '')
-            # Remove return characters
-            line = line.replace('\r', '')
-            lines.update(
-                {str(index + 1): line})
-    return lines
+        # Newlines are already translated to '\n' in text mode
+        lines = file.read().split('\n')
+    # Drop the empty string after a final newline
+    if lines[-1] == '':
+        lines.pop()
+    return dict(zip(map(str, range(1, len(lines) + 1)), lines))
+
+
+def read_source(mal_file):
+    """
+    Opens and reads MAL program file into a compact SourceLines listing.
+        Input: str(mal_file)
+        Output: SourceLines
+    """
+    with open(mal_file, 'r') as file:
+        return SourceLines(file.read())
+
+
+def read_mapped(mal_file):
+    """
+    Memory map a MAL program file into a MappedLines listing, so the program is
+    never copied into memory as a whole.  Only ASCII files are mapped; any other
+    file, and an empty file, is read with read_source instead.
+        Input: str(mal_file)
+        Output: MappedLines or SourceLines
+    """
+    with open(mal_file, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return SourceLines('')
+        # The mapping stays open after the file is closed
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    # Text mode decodes with the locale's encoding, which only reads ASCII
+    # bytes as ASCII if it is ASCII compatible
+    with open(os.devnull, 'r') as null:
+        encoding = null.encoding
+    ascii = all(mapping[start:start + MappedLines.CHUNK_BYTES].isascii()
+                for start in range(0, len(mapping), MappedLines.CHUNK_BYTES))
+    if not ascii or "\n;:".encode(encoding) != b"\n;:":
+        mapping.close()
+        return read_source(mal_file)
+    return MappedLines(mapping)
+
+
+def iter_file(mal_file):
+    """
+    Opens and reads MAL program file one line at a time.
+        Input: str(mal_file)
+        Output: iter((int(line_num), str(line)))
+    """
+    with open(mal_file, 'r') as file:
+        yield from iter_lines(file)
+
+
+def iter_lines(file):
+    """
+    Read MAL program lines one at a time from an open text file.
+        Input: file
+        Output: iter((int(line_num), str(line)))
+    """
+    for index, line in enumerate(file):
+        # Remove newline characters
+        line = line.replace('\n', '')
+        # Remove return characters
+        line = line.replace('\r', '')
+        yield index + 1, line
 
 
 def strip_program(original_lines):
@@ -133,208 +326,983 @@ def strip_program(original_lines):
         Input: dict({str(line_num): str(original_line)})
         Output: dict({str(line_num): str(stripped_line)})
     """
-    stripped_lines = dict()
-    for line in original_lines:
-        stripped_line = original_lines[line].replace('\t', '')  # Remove tab characters
-        # Check if line contains a comment
-        if ";" in stripped_line:
-            index = stripped_line.find(';')
-            # Check if comment takes up entire line or is in-line comment
-            if index == 0:
-                stripped_line = ''
-            else:
-                stripped_line = stripped_line[:index - 1]
-        # Remove spaces from ends of line
-        stripped_line = stripped_line.strip()
-        # Add line to stripped lines dictionary if not blank
+    return dict(iter_stripped(original_lines.items()))
+
+
+def iter_stripped(original_lines):
+    """
+    Strip blank lines, tabs, and comments from a stream of MAL program lines.
+    The first STRIP_TABLE_SIZE distinct lines are only stripped once.
+        Input: iter((line_num, str(original_line)))
+        Output: iter((line_num, str(stripped_line)))
+    """
+    stripped_lines = dict()  # {str(original_line): str(stripped_line)}
+    for line, original_line in original_lines:
+        # Lines that are only a comment are the most common kind of blank line
+        if original_line[:1] == ';':
+            continue
+        stripped_line = stripped_lines.get(original_line)
+        if stripped_line is None:
+            stripped_line = strip_line(original_line)
+            if len(stripped_lines) < STRIP_TABLE_SIZE:
+                stripped_lines[original_line] = stripped_line
+        # Only pass the line on if it is not blank
         if stripped_line != '':
-            stripped_lines.update({line: stripped_line})
-    return stripped_lines
+            yield line, stripped_line
+
+
+def strip_line(line):
+    """
+    Strip tabs, comments, and surrounding spaces from a single MAL program line.
+        Input: str(line)
+        Output: str(stripped_line)
+    """
+    stripped_line = line.replace('\t', '')  # Remove tab characters
+    # Check if line contains a comment
+    index = stripped_line.find(';')
+    # Check if comment takes up entire line or is in-line comment
+    if index == 0:
+        return ''
+    elif index > 0:
+        stripped_line = stripped_line[:index - 1]
+    # Remove spaces from ends of line
+    return stripped_line.strip()
+
+
+def iter_chunks(original_lines, chunk_lines):
+    """
+    Split MAL program lines into chunks of lines to be checked in parallel.
+        Input: iter(str(original_line)), int(chunk_lines)
+        Output: iter((int(first_line_num), str(text))) with the lines of each
+                chunk joined by '\n'
+    """
+    lines = iter(original_lines)
+    first_line = 1
+    while True:
+        chunk = list(islice(lines, chunk_lines))
+        if not chunk:
+            return
+        yield first_line, '\n'.join(chunk)
+        first_line += len(chunk)
+
+
+def check_chunk(chunk):
+    """
+    Evaluate a chunk of a MAL program's lines, in a worker process.  The
+    instructions are packed to be sent back, and the pending branches of the
+    context are given by the index of their instruction in the chunk.
+        Input: tuple(int(first_line_num), str(text)) from iter_chunks
+        Output: tuple(packed_instructions), CheckContext of the chunk
+    """
+    first_line, text = chunk
+    instructions, context = SyntaxChecker().evaluate_chunk(
+        enumerate(text.split('\n'), first_line))
+    pending = {instruction.line: label for instruction, label in context.pending}
+    context.pending = [(index, pending[instruction.line])
+                       for index, instruction in enumerate(instructions)
+                       if instruction.line in pending]
+    return pack_instructions(instructions), context
+
+
+def pack_instructions(instructions):
+    """
+    Pack Instruction records into a few flat values, which are much faster to
+    send to another process than the records themselves.
+        Input: list(Instruction)
+        Output: tuple(packed_instructions) for unpack_instructions
+    """
+    line_numbers = array('Q', [instruction.line for instruction in instructions])
+    texts = '\n'.join([instruction.text for instruction in instructions])
+    labels = [(index, instruction.label) for index, instruction in enumerate(instructions)
+              if instruction.label is not None]
+    opcodes = bytes([len(OPCODES) if instruction.opcode is None else instruction.opcode
+                     for instruction in instructions])
+    operands = [instruction.operands for instruction in instructions]
+    diagnostics = [(index, diagnostic.code, diagnostic.column, diagnostic.operand)
+                   for index, instruction in enumerate(instructions)
+                   if instruction.diagnostics
+                   for diagnostic in instruction.diagnostics]
+    return line_numbers, texts, labels, opcodes, operands, diagnostics
+
+
+def unpack_instructions(packed):
+    """
+    Make Instruction records from the values packed by pack_instructions.
+        Input: tuple(packed_instructions)
+        Output: list(Instruction)
+    """
+    line_numbers, texts, labels, opcodes, operands, diagnostics = packed
+    instruction_labels = [None] * len(line_numbers)
+    for index, label in labels:
+        instruction_labels[index] = label
+    # An opcode of len(OPCODES) is a line with no instruction
+    opcode_ids = tuple(range(len(OPCODES))) + (None,)
+    instructions = list(map(Instruction, line_numbers, texts.split('\n'),
+                            instruction_labels, map(opcode_ids.__getitem__, opcodes),
+                            operands))
+    for index, code, column, operand in diagnostics:
+        instruction = instructions[index]
+        if instruction.diagnostics is None:
+            instruction.diagnostics = list()
+        instruction.diagnostics.append(Diagnostic(code, instruction.line, column,
+                                                  operand))
+    return instructions
 
 #########################################################################################
 #                                   Module Classes                                      #
 #########################################################################################
 
 
-class SyntaxChecker:
+class LazyListing:
     """
-    Syntax Checker that evaluates a MAL program file for syntax errors and warnings.
+    Re-iterable listing of MAL program lines or instructions.  Rather than storing
+    the listing, it calls its source function for a fresh generator on every pass,
+    so a whole program never needs to be held in memory.
     """
 
-    def __init__(self):
-        self.__labels = dict()  # Stores labels in the MAL program
-        self.__error_count = dict()  # Stores count of each type of error
-        self.__warning_count = dict()  # Stores count of each type of warning
+    def __init__(self, source):
+        self.__source = source  # Function returning a generator of the listing
 
-    def __evaluate_program(self, stripped):
+    def __iter__(self):
+        return self.__source()
+
+    def __len__(self):
+        return sum(1 for _ in self.__source())
+
+
+class SourceLines:
+    """
+    Original lines of a MAL program.  The lines are kept as the program text and
+    an array of line offsets, rather than as a string for each line.
+    """
+    __slots__ = ("__text", "__offsets")
+
+    # Number of lines split from the text at a time when iterating
+    CHUNK_LINES = 4096
+
+    def __init__(self, text):
+        self.__text = text  # Program text, with newlines translated to '\n'
+        lines = text.split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        # Total length of the lines before each line, not counting newlines, and
+        # of all the lines.  Line n starts at offset n plus its total.
+        typecode = 'I' if len(text) < 1 << 32 else 'Q'
+        self.__offsets = array(typecode, accumulate(map(len, lines), initial=0))
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("line index out of range")
+        return self.__text[self.__offsets[index] + index:
+                           self.__offsets[index + 1] + index]
+
+    def __iter__(self):
+        # Split the text a chunk of lines at a time, which is much faster than
+        # slicing out each line, without making a string for every line at once
+        text = self.__text
+        offsets = self.__offsets
+        line_count = len(offsets) - 1
+        for start in range(0, line_count, self.CHUNK_LINES):
+            end = min(start + self.CHUNK_LINES, line_count)
+            yield from text[offsets[start] + start:offsets[end] + end - 1].split('\n')
+
+
+class InstructionTable:
+    """
+    Checked instructions of a MAL program, kept in columns rather than as a
+    record for each line: an array of line numbers, a byte for each opcode, the
+    stripped lines as SourceLines, and columns of the errors and warnings in line
+    order.  Labels and operands are read again from the tokens of the stripped
+    line, and the Instruction and Diagnostic records are only made when an
+    instruction is listed, so each instruction takes a few bytes beyond its
+    stripped text.
+    """
+    __slots__ = ("__lines", "__opcodes", "__texts", "__diagnostic_indices",
+                 "__codes", "__columns", "__operands")
+
+    def __init__(self, instructions):
+        typecode = 'I' if not instructions or instructions[-1].line < 1 << 32 else 'Q'
+        self.__lines = array(typecode, [instruction.line for instruction in instructions])
+        # An opcode of len(OPCODES) is a line with no instruction
+        self.__opcodes = bytes([len(OPCODES) if instruction.opcode is None
+                                else instruction.opcode for instruction in instructions])
+        self.__texts = SourceLines(''.join([instruction.text + '\n'
+                                            for instruction in instructions]))
+        # Index of the instruction each diagnostic is on, and its code, column,
+        # and operand
+        self.__diagnostic_indices = array(typecode)
+        self.__codes = bytearray()
+        self.__columns = array('I')
+        self.__operands = list()
+        for index, instruction in enumerate(instructions):
+            if instruction.diagnostics:
+                for diagnostic in instruction.diagnostics:
+                    self.__diagnostic_indices.append(index)
+                    self.__codes.append(diagnostic.code)
+                    self.__columns.append(diagnostic.column)
+                    self.__operands.append(diagnostic.operand)
+
+    def __len__(self):
+        return len(self.__lines)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("instruction index out of range")
+        return self.__make(index, self.__texts[index],
+                           bisect_left(self.__diagnostic_indices, index), dict())
+
+    def __iter__(self):
+        # Label and operands of the first distinct stripped lines listed,
+        # {str(text): (str(label), tuple(operands))}
+        parsed = dict()
+        diagnostic = 0
+        for index, text in enumerate(self.__texts):
+            instruction = self.__make(index, text, diagnostic, parsed)
+            if instruction.diagnostics:
+                diagnostic += len(instruction.diagnostics)
+            yield instruction
+
+    def __make(self, index, text, diagnostic, parsed):
         """
-        Evaluate a stripped MAL program line by line and make new dictionary of
-        evaluated program lines, which include errors below the original lines.
-            Input: dict({str(line_num): str(strippled_line)})
-            Output: dict({str(line_num): str(evaluated_line)})
+        Make the Instruction record of one instruction.
+            Input: int(index), str(text) of its stripped line, int(diagnostic)
+                   index of its first diagnostic if it has any, dict(parsed)
+                   labels and operands of lines already made
+            Output: Instruction
         """
-        evaluated = dict() # Stores evaluated lines, {str(line_num): str(line)}
+        line = self.__lines[index]
+        opcode = self.__opcodes[index]
+        if opcode == len(OPCODES):
+            opcode = None
+        label_operands = parsed.get(text)
+        if label_operands is None:
+            tokens = LEXER.tokenize(text)
+            label = tokens[0].text if tokens[0].kind is LABEL_DEF else None
+            operands = tuple()
+            if opcode is not None:
+                # The instruction's tokens come after the label, if there is one
+                operands = tuple([token.text for token in tokens[1 + (label is not None):]
+                                  if token.kind is not COMMA])
+            label_operands = (label, operands)
+            if len(parsed) < LISTING_TABLE_SIZE:
+                parsed[text] = label_operands
+        instruction = Instruction(line, text, label_operands[0], opcode, label_operands[1])
+        indices = self.__diagnostic_indices
+        if diagnostic < len(indices) and indices[diagnostic] == index:
+            instruction.diagnostics = list()
+            while diagnostic < len(indices) and indices[diagnostic] == index:
+                instruction.diagnostics.append(Diagnostic(
+                    self.__codes[diagnostic], line, self.__columns[diagnostic],
+                    self.__operands[diagnostic]))
+                diagnostic += 1
+        return instruction
+
+
+class MappedLines:
+    """
+    Original lines of a memory mapped ASCII MAL program.  Lines are decoded from
+    the mapping only when they are used, and for checking, comment lines are
+    skipped and comments are left out without being decoded.  The offset of
+    each line is only found if a line is looked up by its index.  Line endings
+    are read the same way as in text mode: "\\r\\n", "\\r" and "\\n" each end
+    a line.
+    """
+    __slots__ = ("__mapping", "__view", "__starts", "__crlf")
 
-        # Check each line in program
-        for line in stripped:
-            error = None
-
-            # Add stripped program line to evaluated lines dictionary
-            evaluated.update({line: stripped[line]})
-
-            # Check the first item in the stripped program line
-            first_token = stripped[line].split()[0]
-            if ':' in first_token:
-                # First item in line is a label
-                label = first_token.replace(':', '')
-
-                # Check for errors in label
-                error = self.__evaluate_identifier(label)
-                if error:
-                    error = "ill-formed label" + error
-                    error_line = stripped[line] + '\n' + ERRORS[error].format(label)
-                    evaluated.update({line: error_line})
-
-                # Check if there is an instruction on same line as label
-                elif len(stripped[line].split()) > 1 \
-                    and stripped[line].split()[1].upper() in MAL:
-                    instruction = stripped[line].replace(first_token, '')
-                    evaluated_line = self.__evaluate_instruction(instruction)
-                    evaluated.update({line: first_token + evaluated_line})
-
-            # Check if first item is a valid opcode
-            elif first_token.upper() in MAL:
-                evaluated_line = self.__evaluate_instruction(stripped[line])
-                evaluated.update({line: evaluated_line})
-            
-            # First item is not a label or valid opcode
+    # Number of bytes split into lines at a time
+    CHUNK_BYTES = 1 << 20
+
+    def __init__(self, mapping):
+        self.__mapping = mapping  # mmap of the ASCII program file
+        self.__view = memoryview(mapping)
+        # Whether any line ends with "\r", so line ends need to be checked
+        self.__crlf = mapping.find(b'\r') != -1
+        # Offset of the start of each line and of the end of the file, or None
+        # until a line is looked up by its index
+        self.__starts = None
+
+    def __chunks(self):
+        """
+        Generate the lines of the program a chunk at a time, as bytes without
+        their line endings.  Each chunk ends at a line ending, and only one
+        chunk is copied out of the mapping at a time.
+            Output: iter((int(first_index), list(bytes(line))))
+        """
+        mapping = self.__mapping
+        size = len(mapping)
+        window = self.CHUNK_BYTES
+        position = 0
+        index = 0
+        while position < size:
+            end = position + window
+            if end < size:
+                # End the chunk after its last line ending, which is never the
+                # "\r" of a "\r\n"
+                cut = mapping.rfind(b'\n', position, end)
+                if cut == -1 and self.__crlf:
+                    cut = mapping.rfind(b'\r', position, end - 1)
+                if cut == -1:
+                    # A line longer than the chunk
+                    window *= 2
+                    continue
+                end = cut + 1
             else:
-                error = "invalid opcode"
-                error_line = stripped[line] + \
-                    (ERRORS[error]).format(first_token)
-                evaluated.update({line: error_line})
-            if error:
-                self.__increment_count(self.__error_count, error)
+                end = size
+            chunk = mapping[position:end]
+            if self.__crlf:
+                lines = NEWLINE_BYTES.split(chunk)
+            else:
+                lines = chunk.split(b'\n')
+            # Drop the empty string after the chunk's last line ending
+            if lines[-1] == b'':
+                lines.pop()
+            yield index, lines
+            index += len(lines)
+            position = end
+            window = self.CHUNK_BYTES
+
+    def __offsets(self):
+        """
+        Get the offset of the start of each line and of the end of the file,
+        finding them the first time.
+            Output: array(int(offset))
+        """
+        if self.__starts is None:
+            size = len(self.__mapping)
+            starts = array('I' if size < 1 << 32 else 'Q', [0])
+            if self.__crlf:
+                starts.extend(match.end()
+                              for match in NEWLINE_BYTES.finditer(self.__mapping))
+            else:
+                position = 0
+                for _, lines in self.__chunks():
+                    # Each line starts one byte after the end of the line before it
+                    starts.extend(islice(accumulate(map(add, map(len, lines),
+                                                        repeat(1)), initial=position),
+                                         1, None))
+                    position = starts[-1]
+            # The last line has no line ending, or the file ends with one
+            if starts[-1] > size:
+                starts[-1] = size
+            elif starts[-1] != size:
+                starts.append(size)
+            self.__starts = starts
+        return self.__starts
+
+    def __len__(self):
+        return len(self.__offsets()) - 1
+
+    def line_view(self, index):
+        """
+        Get the bytes of a line, without its line ending and without copying it.
+            Input: int(index)
+            Output: memoryview
+        """
+        starts = self.__offsets()
+        start = starts[index]
+        end = starts[index + 1]
+        mapping = self.__mapping
+        if end > start and mapping[end - 1] == ord('\n'):
+            end -= 1
+        if end > start and mapping[end - 1] == ord('\r'):
+            end -= 1
+        return self.__view[start:end]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("line index out of range")
+        return str(self.line_view(index), 'latin-1')
+
+    def __iter__(self):
+        for _, lines in self.__chunks():
+            yield from (str(line, 'latin-1') for line in lines)
+
+    def iter_stripped(self):
+        """
+        Generate the stripped lines of the program, as iter_stripped does.
+        Lines that start with a comment are skipped and the rest of each line
+        from its first semicolon is never decoded.
+            Output: iter((int(line_num), str(stripped_line)))
+        """
+        for first_index, lines in self.__chunks():
+            for line_num, line in enumerate(lines, first_index + 1):
+                if not line or line[0] == SEMICOLON:
+                    continue
+                comment = line.find(b';')
+                if comment != -1:
+                    # Keep the semicolon, which strip_line needs to drop the comment
+                    line = line[:comment + 1]
+                stripped_line = strip_line(str(line, 'latin-1'))
+                if stripped_line != '':
+                    yield line_num, stripped_line
+
+
+class Program:
+    """
+    A checked MAL program: its original lines and an Instruction record for each
+    line left after stripping blank lines and comments.
+    """
+    __slots__ = ("original", "instructions")
+
+    def __init__(self, original, instructions):
+        self.original = original  # Iterable of str(original_line)
+        self.instructions = instructions  # Iterable of Instruction
+
+    def diagnostics(self):
+        """
+        Generate the errors and warnings of the program, in line order.
+            Output: iter(Diagnostic)
+        """
+        for instruction in self.instructions:
+            if instruction.diagnostics:
+                yield from instruction.diagnostics
+
+
+class Instruction:
+    """
+    Compact record of one stripped MAL program line and its evaluation.  The
+    opcode and operands are filled in by the SyntaxChecker when it evaluates the
+    instruction on the line.
+    """
+    __slots__ = ("line", "text", "label", "opcode", "operands", "diagnostics")
+
+    def __init__(self, line, text, label=None, opcode=None, operands=(),
+                 diagnostics=None):
+        self.line = line  # Line number in the original program
+        self.text = text  # Stripped line
+        self.label = label  # Label definition as written, with its colon
+        self.opcode = opcode  # Index of the opcode in OPCODES
+        self.operands = operands  # Operands as written, without commas
+        self.diagnostics = diagnostics  # Diagnostic records, or None
+
+    @property
+    def label_name(self):
+        """
+        Name of the label defined on the line, or None.
+        """
+        if self.label is None:
+            return None
+        return self.label.replace(':', '')
 
-        # Check if any labels were not branched to
-        evaluated = self.__evaluate_label_references(evaluated)
+    @property
+    def opcode_name(self):
+        """
+        Name of the opcode of the instruction, or None.
+        """
+        if self.opcode is None:
+            return None
+        return OPCODES[self.opcode]
 
-        return evaluated
+    def add_diagnostic(self, key, operand, column=None):
+        """
+        Add an error or warning to the line.  Its message is only made when it
+        is needed.  Without a column, the column is that of the last operand
+        token written the same as the operand.
+            Input: str(key) of ERRORS or WARNINGS, str(operand) the message is about,
+                   int(column) of the operand in the stripped line or None
+        """
+        if column is None:
+            column = self.operand_column(operand)
+        if self.diagnostics is None:
+            self.diagnostics = list()
+        self.diagnostics.append(Diagnostic(DIAGNOSTIC_CODES[key], self.line, column,
+                                           operand))
+
+    def opcode_position(self):
+        """
+        Find the opcode of the line as written and its column.
+            Output: str(opcode), int(column) counted from 1
+        """
+        # The opcode comes after the label, if there is one
+        index = 0 if self.label is None else 1
+        return LEXER.tokenize(self.text)[index].text, LEXER.token_columns(self.text)[index]
 
-    def __evaluate_instruction(self, instruction):
+    def has_error(self):
         """
-        Evaluate an instruction for errors.
-            Input: str(instruction)
+        Checks if the line has an error, rather than only warnings.
+            Output: True if it has an error, else False
+        """
+        return bool(self.diagnostics) and any(diagnostic.severity == ERROR
+                                              for diagnostic in self.diagnostics)
+
+    def operand_column(self, operand):
+        """
+        Find the column of the last operand token of the line written the same
+        as the operand.  Branch labels are the last operand, and registers that
+        are read come after the register written.
+            Input: str(operand)
+            Output: int(column) counted from 1, or 0 if no token matches
+        """
+        tokens = LEXER.tokenize(self.text)
+        for index in range(len(tokens) - 1, 0, -1):
+            if tokens[index].text == operand:
+                return LEXER.token_columns(self.text)[index]
+        return 0
+
+    def evaluated_text(self):
+        """
+        Get the evaluated line, which has its errors and warnings below it.
             Output: str(evaluated_line)
         """
-        error = None
-        evaluated_line = instruction
+        text = self.text
+        if self.label is not None and self.opcode is not None:
+            # Every copy of the label was dropped from the instruction
+            text = self.label + text.replace(self.label, '')
+        if self.diagnostics:
+            text += ''.join('\n' + diagnostic.message
+                            for diagnostic in self.diagnostics)
+        return text
+
+
+class Diagnostic:
+    """
+    Compact record of one error or warning found on a MAL program line.  The
+    message is made from the code and operand only when it is asked for, so
+    callers that only need codes or counts never format a message.
+    """
+    __slots__ = ("code", "line", "column", "operand")
 
-        # Separate opcode from instruction as a string
-        opcode = instruction.split()[0].upper()
+    def __init__(self, code, line, column, operand):
+        self.code = code  # Index of the error or warning in DIAGNOSTICS
+        self.line = line  # Line number in the original program
+        self.column = column  # Column of the operand in the stripped line, or 0
+        self.operand = operand  # Operand, label, or opcode the message is about
 
-        # Separate operands into a list
-        operands = instruction.replace(',', '').split()[1:]
+    def __repr__(self):
+        return ("Diagnostic({!r}, line={}, column={}, operand={!r})").format(
+            self.key, self.line, self.column, self.operand)
 
-        # Check for valid number of operands
-        valid_length = len(MAL[opcode])
-        if len(operands) < valid_length:
-            error = "too few operands"
-        elif len(operands) > valid_length:
-            error = "too many operands"
-        if error:
-            self.__increment_count(self.__error_count, error)
+    @property
+    def key(self):
+        """
+        Name of the error or warning, a key of ERRORS or WARNINGS.
+        """
+        return DIAGNOSTICS[self.code]
+
+    @property
+    def severity(self):
+        """
+        ERROR or WARNING.
+        """
+        return ERROR if self.code < len(ERRORS) else WARNING
+
+    @property
+    def message(self):
+        """
+        Error or warning message, as it appears in the report.
+        """
+        key = DIAGNOSTICS[self.code]
+        if key in OPERAND_COUNT_ERRORS:
+            # The operand is the opcode as written
+            opcode = self.operand.upper()
+            valid_length = len(MAL[opcode])
+            template = ERRORS[key]
             if valid_length == 1:
                 # Replace "operands" with "operand" in error message if there should
                 # only be a single operand for this opcode
-                evaluated_line += (ERRORS[error].replace(
-                    "operands", "operand", 2).replace(
-                        "operand", "operands", 1)).format(valid_length, opcode)
-            else:
-                evaluated_line += (ERRORS[error]).format(valid_length, opcode)
+                template = template.replace("operands", "operand", 2).replace(
+                    "operand", "operands", 1)
+            return template.format(valid_length, opcode).lstrip('\n')
+        template = ERRORS[key] if self.code < len(ERRORS) else WARNINGS[key]
+        return template.format(self.operand).lstrip('\n')
 
-        # Check for other operand errors or warnings
-        else:
-            operand_errors, operand_warnings = self.__evaluate_operands(opcode, operands)
 
-            # If there were operand errors, add them to the evaluated line
-            if len(operand_errors) > 0:
-                for operand_error in operand_errors:
-                    evaluated_line += '\n' + operand_error
+class LabelTable:
+    """
+    Symbol table of the labels in a MAL program.  Labels are case insensitive, so
+    entries are keyed by the casefolded label name, which gives constant time
+    lookup of definitions and reference counts.  Branches to labels that are not
+    defined (yet) are counted too, so references can be resolved after the fact.
+    """
+
+    def __init__(self):
+        self.__symbols = dict()  # {str(casefolded_name): LabelSymbol}
 
-            # If there were operand warnings, but no errors, add to evaluated line
-            elif len(operand_warnings) > 0:
-                for operand_warning in operand_warnings:
-                    evaluated_line += '\n' + operand_warning
+    def __contains__(self, label):
+        return self.is_defined(label)
 
-        return evaluated_line
+    def __len__(self):
+        return sum(len(symbol.definitions) for symbol in self.__symbols.values())
 
-    def __evaluate_operands(self, opcode, operands):
+    def __symbol(self, label):
         """
-        Evaluate an operand for valid syntax.
-            Input: str(opcode), list(operands)
-            Output: list(operand_errors), list(operand_warnings)
+        Get the symbol for a label, adding an empty one if it is not in the table.
+            Input: str(label)
+            Output: LabelSymbol
+        """
+        key = label.casefold()
+        symbol = self.__symbols.get(key)
+        if symbol is None:
+            symbol = LabelSymbol()
+            self.__symbols[key] = symbol
+        return symbol
+
+    def define(self, label, line_num):
+        """
+        Add a label definition.  A later definition of the same label replaces the
+        line number of an earlier one.
+            Input: str(label), str(line_num)
+        """
+        symbol = self.__symbol(label)
+        symbol.definitions[label] = line_num
+        symbol.definition_count += 1
+
+    def reference(self, label):
+        """
+        Count a branch to a label.
+            Input: str(label)
+            Output: True if the label is defined, else False
+        """
+        symbol = self.__symbol(label)
+        symbol.references += 1
+        return symbol.definition_count > 0
+
+    def is_defined(self, label):
+        """
+        Checks if a label is defined, ignoring case.
+            Input: str(label)
+            Output: True if defined, else False
+        """
+        symbol = self.__symbols.get(label.casefold())
+        return symbol is not None and symbol.definition_count > 0
+
+    def is_duplicate(self, label):
+        """
+        Checks if a label is defined more than once, ignoring case.
+            Input: str(label)
+            Output: True if defined more than once, else False
+        """
+        symbol = self.__symbols.get(label.casefold())
+        return symbol is not None and symbol.definition_count > 1
+
+    def definition_line(self, label):
+        """
+        Get the line number of the last definition of a label, matching case.
+            Input: str(label)
+            Output: str(line_num) or None
+        """
+        symbol = self.__symbols.get(label.casefold())
+        if symbol is None:
+            return None
+        return symbol.definitions.get(label)
+
+    def reference_count(self, label):
+        """
+        Get the number of branches to a label, ignoring case.
+            Input: str(label)
+            Output: int(reference_count)
+        """
+        symbol = self.__symbols.get(label.casefold())
+        if symbol is None:
+            return 0
+        return symbol.references
+
+    def definitions(self):
+        """
+        Generate the defined labels in the order they were first defined.
+            Output: iter((str(label), str(line_num)))
+        """
+        for symbol in self.__symbols.values():
+            yield from symbol.definitions.items()
+
+    def merge(self, other):
+        """
+        Add the definitions of and branches to the labels in the table of a later
+        part of the same program.
+            Input: LabelTable
+        """
+        for key, other_symbol in other.__symbols.items():
+            symbol = self.__symbols.get(key)
+            if symbol is None:
+                symbol = LabelSymbol()
+                self.__symbols[key] = symbol
+            symbol.definitions.update(other_symbol.definitions)
+            symbol.definition_count += other_symbol.definition_count
+            symbol.references += other_symbol.references
+
+
+class LabelSymbol:
+    """
+    Label table entry for every spelling of a casefolded label name.
+    """
+
+    def __init__(self):
+        self.definitions = dict()  # Last line of each spelling, {str(label): str(line_num)}
+        self.definition_count = 0  # Number of lines that define the label
+        self.references = 0  # Number of branches to the label
+
+
+class CheckContext:
+    """
+    State of one check of a MAL program.  A SyntaxChecker keeps only its rules,
+    and makes a new context for each check, so one checker can be used by many
+    threads at once.
+    """
+    __slots__ = ("labels", "pending", "shared", "error_count", "warning_count")
+
+    def __init__(self):
+        self.labels = LabelTable()  # Stores labels in the MAL program
+        self.pending = None  # Branches to labels not defined yet, or None
+        self.shared = None  # Repeated line text and operands, {value: value}, or None
+        # Copy keys from ERRORS dictionary and set each count to 0
+        self.error_count = {key: 0 for key in ERRORS}
+        # Copy keys from WARNINGS dictionary and set each count to 0
+        self.warning_count = {key: 0 for key in WARNINGS}
+
+
+class InstructionEvaluation:
+    """
+    The part of an instruction's evaluation that depends only on its tokens, so
+    it can be remembered and shared by every line with the same tokens.
+    """
+    __slots__ = ("opcode", "operands", "error", "error_operand", "error_token",
+                 "branch_label")
+
+    def __init__(self, opcode, operands, error=None, error_operand=None,
+                 error_token=0, branch_label=None):
+        self.opcode = opcode  # Index of the opcode in OPCODES
+        self.operands = operands  # Operands as written, without commas
+        self.error = error  # Key of the first error in ERRORS, or None
+        self.error_operand = error_operand  # Operand or opcode the error is about
+        self.error_token = error_token  # Index of that token, the opcode's is 0
+        self.branch_label = branch_label  # Label branched to, or None
+
+
+class SyntaxChecker:
+    """
+    Syntax Checker that evaluates a MAL program file for syntax errors and warnings.
+    The checker holds no state of its own between checks; everything found while
+    checking a program is kept in the CheckContext of that check, so one checker
+    can check programs in many threads at once.  All it keeps is a bounded memo
+    of instruction evaluations, keyed by token sequence, which do not depend on
+    any program.  The memo and the line table of the lexer every checker shares
+    are both locked while they are changed.
+    """
+
+    def __init__(self, dataflow=False, memo_size=MEMO_SIZE):
+        self.__dataflow = dataflow  # Whether valid programs get data flow warnings
+        # Least recently used evaluations of instructions, keyed by their tokens,
+        # since programs repeat the same instructions many times
+        self.__memo = lru_cache(maxsize=memo_size)(self.__evaluate_tokens)
+
+    def memo_info(self):
+        """
+        Get the hits, misses, maximum size, and current size of the memo of
+        instruction evaluations.
+            Output: namedtuple(hits, misses, maxsize, currsize)
+        """
+        return self.__memo.cache_info()
+
+    def __evaluate_program(self, context, stripped, labels_complete):
+        """
+        Evaluate a stream of stripped MAL program lines line by line, generating
+        an Instruction record with the errors and warnings for each line.  If the
+        label table is not complete yet, labels are defined as they are found and
+        branches to labels that are not defined yet are kept in the pending list.
+            Input: CheckContext, iter((int(line_num), str(stripped_line))),
+                   bool(labels_complete)
+            Output: iter(Instruction)
+        """
+        evaluate_line = self.evaluate_line
+
+        # Check each line in program
+        for line, stripped_line in stripped:
+            if context.shared is not None:
+                stripped_line = context.shared.setdefault(stripped_line, stripped_line)
+            instruction, label, branch_label = evaluate_line(line, stripped_line)
+            if instruction.diagnostics:
+                # A line has at most one error of its own
+                self.__increment_count(context.error_count,
+                                       instruction.diagnostics[0].key)
+            if context.shared is not None and instruction.operands:
+                instruction.operands = context.shared.setdefault(instruction.operands,
+                                                                instruction.operands)
+
+            # A label is defined before the line's own branch is counted
+            if label is not None and not labels_complete:
+                context.labels.define(label, line)
+            if branch_label is not None:
+                self.__evaluate_branch(context, instruction, branch_label,
+                                       labels_complete)
+
+            yield instruction
+
+    def __stream_program(self, context, stripped):
+        """
+        Evaluate a stream of stripped MAL program lines once the label table is
+        complete, resolving the deferred label warnings as each line is generated.
+        The error and warning counts are reset first, so they always describe the
+        most recent pass over the program.
+            Input: CheckContext, iter((int(line_num), str(stripped_line)))
+            Output: iter(Instruction)
+        """
+        context.error_count.update({key: 0 for key in ERRORS})
+        context.warning_count.update({key: 0 for key in WARNINGS})
+        for instruction in self.__evaluate_program(context, stripped, True):
+            if instruction.label is not None:
+                self.__evaluate_label_reference(context, instruction.label_name,
+                                                instruction)
+            yield instruction
+
+    def evaluate_line(self, line, stripped_line):
         """
-        operand_errors = list()
-        operand_warnings = list()
+        Evaluate one stripped MAL program line on its own, for the errors that do
+        not depend on the rest of the program.  The errors of an instruction are
+        looked up in the memo.  Whether the line's label is branched to, and
+        whether its branch is to a missing label, depend on the program, so the
+        labels are given back to be resolved by the caller.
+            Input: int(line_num), str(stripped_line)
+            Output: Instruction, str(label) defined or None,
+                    str(branch_label) branched to or None
+        """
+        tokens = LEXER.tokenize(stripped_line)
+        instruction = Instruction(line, stripped_line)
+        label = None
+        evaluation = None
+
+        # Check the first token in the stripped program line
+        first_token = tokens[0]
+        if first_token.kind is LABEL_DEF:
+            # First item in line is a label
+            label = first_token.value
+            instruction.label = first_token.text
+
+            # Check for errors in label
+            error = self.__evaluate_identifier(label)
+            if error:
+                instruction.add_diagnostic("ill-formed label" + error, label, 1)
+
+            # Check if there is an instruction on same line as label
+            elif len(tokens) > 1 and tokens[1].kind is OPCODE:
+                evaluation = self.__memo(tokens[1:])
+
+        # Check if first item is a valid opcode
+        elif first_token.kind is OPCODE:
+            evaluation = self.__memo(tokens)
+
+        # First item is not a label or valid opcode
+        else:
+            instruction.add_diagnostic("invalid opcode", first_token.text, 1)
+
+        if evaluation is None:
+            return instruction, label, None
+        instruction.opcode = evaluation.opcode
+        instruction.operands = evaluation.operands
+        if evaluation.error:
+            # The tokens of the evaluation come after the label, if there is one
+            column = LEXER.token_columns(stripped_line)[
+                evaluation.error_token + (label is not None)]
+            instruction.add_diagnostic(evaluation.error, evaluation.error_operand,
+                                       column)
+        return instruction, label, evaluation.branch_label
+
+    def __evaluate_branch(self, context, instruction, label, labels_complete):
+        """
+        Count a branch to a label, and check if the label is missing.  Only the
+        first error, or if there are no errors the first warning, is included
+        in the instruction.
+            Input: CheckContext, Instruction, str(label), bool(labels_complete)
+        """
+        if not context.labels.reference(label) and not instruction.diagnostics:
+            warning = "branch to missing label"
+            if labels_complete:
+                instruction.add_diagnostic(warning, label)
+                self.__increment_count(context.warning_count, warning)
+            elif context.pending is not None:
+                # The label may still be defined further down the program
+                context.pending.append((instruction, label))
+
+    def __evaluate_tokens(self, tokens):
+        """
+        Evaluate the tokens of an instruction for the errors that do not depend
+        on the rest of the program.
+            Input: tuple(tokens) starting with the opcode
+            Output: InstructionEvaluation
+        """
+        # Normalized opcode
+        opcode = tokens[0].value
+
+        # Separate operands into a list, with the index of each in the tokens
+        positions = [index for index in range(1, len(tokens))
+                     if tokens[index].kind is not COMMA]
+        operands = [tokens[index] for index in positions]
+        evaluation = InstructionEvaluation(
+            OPCODE_IDS[opcode], tuple(operand.text for operand in operands))
+
+        # Check for valid number of operands
+        valid_length = len(MAL[opcode])
+        if len(operands) < valid_length:
+            evaluation.error = "too few operands"
+        elif len(operands) > valid_length:
+            evaluation.error = "too many operands"
+        if evaluation.error:
+            evaluation.error_operand = tokens[0].text
 
-        # Get list of valid operands from MAL dictionary
-        valid_operands = MAL[opcode]
+        # Check for other operand errors
+        else:
+            self.__evaluate_operands(evaluation, operands, positions)
+        return evaluation
 
-        # Evaluate each operand in the list of operands
-        for index, valid_operand in enumerate(valid_operands):
-            operand = operands[index]
-            error, warning = self.__evaluate_operand(valid_operand, operand)
+    def __evaluate_operands(self, evaluation, operands, positions):
+        """
+        Evaluate the operands of an instruction for valid syntax.  Only the first
+        error is kept, and the label of a branch is kept if it is reached.
+            Input: InstructionEvaluation, list(operand_tokens),
+                   list(int(token_index)) of each operand
+        """
+        # Evaluate each operand against the kind of operand the opcode expects
+        for operand_kind, operand, position in zip(
+                OPERAND_KINDS[OPCODES[evaluation.opcode]], operands, positions):
+            if operand_kind is LABEL:
+                evaluation.branch_label = operand.text
+            error = self.__evaluate_operand(operand_kind, operand)
             if error:
-                operand_errors.append((ERRORS[error]).format(operand))
-                self.__increment_count(self.__error_count, error)
-                # Only increment and include first error in the instruction
+                evaluation.error = error
+                evaluation.error_operand = operand.text
+                evaluation.error_token = position
+                # Only include first error in the instruction
                 break
-            elif warning:
-                operand_warnings.append((WARNINGS[warning]).format(operand))
-                self.__increment_count(self.__warning_count, warning)
-                # Only increment and include first warning in the instruction
-                break
-        return operand_errors, operand_warnings
 
-    def __evaluate_operand(self, valid_operand, operand):
+    def __evaluate_operand(self, operand_kind, operand):
         """
         Evaluate an operand for valid syntax.
-            Input: str(valid_operand), str(operand)
-            Output: str(error), str(warning)
+            Input: str(operand_kind), Token(operand)
+            Output: str(error) or None
         """
         operand_error = None
-        operand_warning = None
 
         # Register
-        if 'R' in valid_operand:
-            if operand.upper() not in REGISTERS:
+        if operand_kind is REGISTER:
+            if operand.kind is not REGISTER:
                 operand_error = "ill-formed register"
 
         # Literal value
-        elif 'V' in valid_operand:
-            if not is_octal_number(operand):
+        elif operand_kind is LITERAL:
+            if not is_octal_number(operand.text):
                 operand_error = "ill-formed literal"
 
         # Identifier
-        elif 'S' in valid_operand or 'D' in valid_operand:
-            identifier_error = self.__evaluate_identifier(operand)
+        elif operand_kind is IDENTIFIER:
+            identifier_error = self.__evaluate_identifier(operand.text)
             if identifier_error:
                 operand_error = "ill-formed identifier" + identifier_error
 
         # Label
-        elif 'LAB' in valid_operand:
-            identifier_error = self.__evaluate_identifier(operand)
+        else:
+            identifier_error = self.__evaluate_identifier(operand.text)
             if identifier_error:
                 operand_error = "ill-formed label" + identifier_error
 
-            # Check if label is not in label reference dictionary
-            if operand.casefold() not in [label.casefold() for label in self.__labels]:
-                operand_warning = "branch to missing label"
-            else:
-                self.__increment_reference_count(operand)
-
-        return operand_error, operand_warning
+        return operand_error
 
     def __evaluate_identifier(self, identifier):
         """
@@ -351,30 +1319,74 @@ class SyntaxChecker:
         else:
             return None
 
-    def __evaluate_label_references(self, evaluated_lines):
+    def __evaluate_pending_branches(self, context):
+        """
+        Adds warnings for branches to labels that were still not defined once the
+        whole program was evaluated.
+            Input: CheckContext
+        """
+        warning = "branch to missing label"
+        for instruction, label in context.pending:
+            if not context.labels.is_defined(label):
+                instruction.add_diagnostic(warning, label)
+                self.__increment_count(context.warning_count, warning)
+        context.pending = None
+
+    def __evaluate_label_references(self, context, label_lines):
         """
         Checks if there are labels that are not branched to by checking the 
         number of times they were referenced throughout the program.
-            Input: str(label)
-            Output: str(error) or None
+            Input: CheckContext, dict({int(line_num): Instruction}) of lines
+                   with labels
         """
-        # Check each label in the label reference dictionary
-        for label in self.__labels:
-            warning = None
-
-            # Add warning to evaluated line if the label is not branched to and
-            # if the evaluated line does not already contain an error
-            label_reference_count = self.__labels[label][1]
-            if label_reference_count == 0 \
-                and "error" not in evaluated_lines[self.__labels[label][0]]:
-                warning = "label not branched to"
-                new_line = evaluated_lines[self.__labels[label]
-                                           [0]] + WARNINGS[warning].format(label)
-                evaluated_lines.update({self.__labels[label][0]: new_line})
-                self.__increment_count(self.__warning_count, warning)
-
-        return evaluated_lines
+        # Check each label in the label table
+        for label, line in context.labels.definitions():
+            self.__evaluate_label_reference(context, label, label_lines[line])
 
+    def __evaluate_label_reference(self, context, label, instruction):
+        """
+        Checks if a label defined on a line is not branched to.
+            Input: CheckContext, str(label), Instruction
+        """
+        warning = None
+
+        # Add warning to the line if the label is not branched to and if the
+        # line does not already have an error.  Only the last definition of a
+        # duplicated label is checked.
+        if context.labels.definition_line(label) == instruction.line \
+            and context.labels.reference_count(label) == 0 \
+            and not instruction.has_error():
+            warning = "label not branched to"
+            instruction.add_diagnostic(warning, label, 1)
+            self.__increment_count(context.warning_count, warning)
+
+    def __evaluate_control_flow(self, context, instructions, label_lines):
+        """
+        Adds the warnings found from the control flow graph of a valid program,
+        which is built once: labels that are not branched to, instructions that
+        can never be run, registers that may be read before they are written,
+        and stored values that are overwritten before they are read.
+            Input: CheckContext, list(Instruction), dict({int(line_num):
+                   Instruction}) of lines with labels
+        """
+        # Imported here since the control flow graph and the data flow analysis
+        # are built on this module
+        from mal_cfg import ControlFlowGraph
+        from mal_dataflow import find_warnings
+
+        graph = ControlFlowGraph(instructions)
+        unreachable, unbranched = graph.findings()
+        warning = "label not branched to"
+        for label, line in unbranched:
+            label_lines[line].add_diagnostic(warning, label, 1)
+            self.__increment_count(context.warning_count, warning)
+        warning = "unreachable instruction"
+        for instruction in unreachable:
+            instruction.add_diagnostic(warning, *instruction.opcode_position())
+            self.__increment_count(context.warning_count, warning)
+        for instruction, warning, operand in find_warnings(instructions, graph):
+            instruction.add_diagnostic(warning, operand)
+            self.__increment_count(context.warning_count, warning)
 
     def __increment_count(self, count_dict, key):
         """
@@ -384,58 +1396,212 @@ class SyntaxChecker:
         count = count_dict[key]
         count_dict.update({key: count + 1})
 
-    def __increment_reference_count(self, label):
+    def check(self, mal_file, stream=False, stats=False, mapped=False, workers=None,
+              memory=False):
         """
-        Increment the reference count for a label in the label reference dictionary.
-            Input: str(label)
+        Check syntax of MAL program and output results.  In stream mode the
+        original lines and instructions are LazyListings that re-read the file on
+        each pass, and only the label table is kept; the counts are filled in once
+        the instructions have been iterated.  Data flow checks need the whole
+        program, so a checker with data flow checks never streams.  With stats,
+        the time of each phase of the check is measured and returned as well;
+        measuring a phase needs it to finish, so the check never streams.  With
+        memory as well, the check is run a second time with memory allocations
+        traced, to measure the peak memory of each phase without slowing down
+        the run that is timed.
+        In mapped mode the file is memory mapped with read_mapped rather than
+        read, unless the check streams.  With workers, a program of more than
+        PARALLEL_LINES lines is evaluated in chunks by that many worker
+        processes, and never streams.
+            Input: str(mal_file), bool(stream), bool(stats), bool(mapped),
+                   int(workers) or None, bool(memory)
+            Output: Program, tuple(counts), and CheckStats if stats
         """
-        # Look for the label in the labels reference dictionary
-        for label_index, key in enumerate(self.__labels.keys()):
-
-            # Check if the label name and dictionary key are equal (case insensitive)
-            # and increment reference count if they are
-            if label.casefold() == key.casefold():
-                keys = [key for key in self.__labels]
-                label_key = keys[label_index]
-
-                # Get label reference info, list(line_num, reference count)
-                label_reference_list = self.__labels[label_key]
-
-                # Increment reference count
-                label_reference_list[1] += 1
-                self.__labels.update(
-                    {label_key: label_reference_list})
+        read = read_mapped if mapped else read_source
+        if stats:
+            check_stats = CheckStats(mal_file, memory)
+            with check_stats.phase("read"):
+                original_lines = read(mal_file)
+            program, counts = self.__check_lines(original_lines, check_stats, workers)
+            if memory:
+                check_stats.start_memory()
+                try:
+                    with check_stats.phase("read"):
+                        original_lines = read(mal_file)
+                    self.__check_lines(original_lines, check_stats, workers,
+                                       count=False)
+                finally:
+                    check_stats.stop_memory()
+            return program, counts, check_stats
+        if stream and not self.__dataflow and workers is None:
+            return self.__check_stream(mal_file)
+        return self.__check_lines(read(mal_file), workers=workers)
+
+    def check_lines(self, original_lines, workers=None):
+        """
+        Check syntax of MAL program lines that have already been read and output
+        results.
+            Input: iter(str(original_line)), such as SourceLines or a list,
+                   int(workers) or None to check in this process
+            Output: Program, tuple(counts)
+        """
+        return self.__check_lines(original_lines, workers=workers)
 
-    def check(self, mal_file):
+    def evaluate_chunk(self, original_lines):
+        """
+        Evaluate a chunk of the lines of a MAL program on its own.  Its
+        labels are defined and the branches to them counted, but the branches to
+        labels the chunk does not define are left pending, to be resolved once the
+        chunks of the whole program have been merged.
+            Input: iter((int(line_num), str(original_line)))
+            Output: list(Instruction), CheckContext of the chunk
+        """
+        context = CheckContext()
+        context.pending = list()
+        context.shared = dict()
+        instructions = list(self.__evaluate_program(
+            context, iter_stripped(original_lines), False))
+        context.shared = None
+        context.pending = [(instruction, label) for instruction, label in context.pending
+                           if not context.labels.is_defined(label)]
+        return instructions, context
+
+    def __evaluate_chunks(self, context, original_lines, workers):
+        """
+        Evaluate a MAL program in chunks of lines in a pool of worker processes,
+        generating the Instruction records in line order.  The labels, pending
+        branches, and error counts of each chunk are merged into the context as
+        the chunk's results arrive, while the workers evaluate later chunks.
+            Input: CheckContext, SourceLines or MappedLines, int(workers)
+            Output: iter(Instruction)
+        """
+        chunk_lines = max(MIN_CHUNK_LINES,
+                          -(-len(original_lines) // (workers * CHUNKS_PER_WORKER)))
+        # The records sent back have no reference cycles, so rather than letting
+        # the garbage collector search the millions of new objects for them over
+        # and over, it is paused until every chunk has been merged
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for packed, chunk_context in executor.map(
+                        check_chunk, iter_chunks(original_lines, chunk_lines)):
+                    instructions = unpack_instructions(packed)
+                    context.labels.merge(chunk_context.labels)
+                    context.pending.extend((instructions[index], label)
+                                           for index, label in chunk_context.pending)
+                    for key, count in chunk_context.error_count.items():
+                        context.error_count[key] += count
+                    yield from instructions
+        finally:
+            if collecting:
+                gc.enable()
+
+    def __check_lines(self, original_lines, stats=None, workers=None, count=True):
+        """
+        Check syntax of MAL program lines, measuring each phase if there are stats
+        to fill in.  The stripped lines are only held in a list when they are
+        measured, since otherwise they are stripped as they are evaluated.  With
+        workers, a program of more than PARALLEL_LINES lines is stripped and
+        evaluated in chunks by that many worker processes, and the branches and
+        labels of the whole program are resolved once the chunks are merged.
+        Without count, the phases are measured but nothing is counted, for a
+        second run that only measures memory.
+            Input: iter(str(original_line)), CheckStats or None, int(workers) or None,
+                   bool(count)
+            Output: Program, tuple(counts)
+        """
+        if workers is not None and len(original_lines) <= PARALLEL_LINES:
+            workers = None
+        phase = no_phase if stats is None else stats.phase
+
+        # Make a new context for this mal program.  Labels are defined as they
+        # are found, so branches to labels further down the program are
+        # resolved once the whole program has been evaluated.
+        context = CheckContext()
+        context.pending = list()
+
+        # Repeated lines share one copy of their text and operands
+        context.shared = dict()
+
+        # Remove blank lines and comments
+        if isinstance(original_lines, MappedLines):
+            stripped = original_lines.iter_stripped()
+        else:
+            stripped = iter_stripped(enumerate(original_lines, 1))
+        if stats is not None and workers is None:
+            with phase("strip"):
+                stripped = list(stripped)
+
+        # Evaluate the syntax in the program lines with no blank lines or comments
+        if workers is None:
+            evaluated = self.__evaluate_program(context, stripped, False)
+        else:
+            evaluated = self.__evaluate_chunks(context, original_lines, workers)
+        instructions = list()
+        label_lines = dict()
+        with phase("evaluate"):
+            for instruction in evaluated:
+                instructions.append(instruction)
+                if instruction.label is not None:
+                    label_lines[instruction.line] = instruction
+
+        context.shared = None
+
+        # Valid programs checked for data flow have their labels checked from the
+        # control flow graph, along with the rest of the program's structure
+        control_flow = self.__dataflow and sum(context.error_count.values()) == 0
+
+        # Check for branches to missing labels and labels not branched to
+        with phase("labels"):
+            self.__evaluate_pending_branches(context)
+            if not control_flow:
+                self.__evaluate_label_references(context, label_lines)
+
+        # Check for labels not branched to, unreachable instructions, uninitialized
+        # registers, and dead stores in valid programs
+        if control_flow:
+            with phase("dataflow"):
+                self.__evaluate_control_flow(context, instructions, label_lines)
+
+        # Package output, with the instructions packed into columns
+        program = Program(original_lines, InstructionTable(instructions))
+        counts = (context.error_count, context.warning_count)
+
+        if stats is not None and count:
+            # Counted after the phases, so counting does not add to their times
+            tokenize = LEXER.tokenize
+            stats.count("lines", len(original_lines))
+            stats.count("instructions", len(instructions))
+            stats.count("tokens", sum(len(tokenize(instruction.text))
+                                      for instruction in instructions))
+            stats.count("labels", len(context.labels))
+            stats.add_counts(counts)
+
+        return program, counts
+
+    def __check_stream(self, mal_file):
         """
-        Check syntax of MAL program and output results.
+        Check syntax of MAL program without holding it in memory.
             Input: str(mal_file)
-            Output: tuple(lines), tuple(counts)
+            Output: Program, tuple(counts)
         """
-        # Copy keys from ERRORS dictionary and set each count to 0
-        self.__error_count = {key: 0 for key in ERRORS}
-
-        # Copy keys from WARNINGS dictionary and set each count to 0
-        self.__warning_count = {key: 0 for key in WARNINGS}
-
-        # Read MAL program file and generate list of original program
-        # lines and list with no blank lines or comments.
-        original_lines = read_file(mal_file)
-        stripped_lines = strip_program(original_lines)
-
-        # Make a new dictionary of labels for this mal program
-        self.__labels = dict()
-        self.__labels.update({value: [key, 0] \
-            for (key, value) in find_labels(stripped_lines).items()})
+        # Branches may refer to labels further down the program, so the labels
+        # are defined and the label references are counted in a first pass, and
+        # the label warnings are deferred to the pass that generates the listing.
+        # The listing keeps the context, so each check streams its own program.
+        context = CheckContext()
+        for _ in self.__evaluate_program(context, iter_stripped(iter_file(mal_file)),
+                                         False):
+            pass
 
-        # Evaluate the syntax in the stripped program lines
-        evaluated_lines = self.__evaluate_program(stripped_lines)
+        original_lines = LazyListing(lambda: (line for _, line in iter_file(mal_file)))
+        instructions = LazyListing(
+            lambda: self.__stream_program(context, iter_stripped(iter_file(mal_file))))
+        program = Program(original_lines, instructions)
+        counts = (context.error_count, context.warning_count)
 
-        # Package output into tuples
-        lines = (original_lines, stripped_lines, evaluated_lines)
-        counts = (self.__error_count, self.__warning_count)
-
-        return lines, counts
+        return program, counts
 
 
 class SyntaxReport:
@@ -447,33 +1613,56 @@ class SyntaxReport:
     def __init__(self, mal_file, checker_output):
         self.__mal_file = mal_file
         self.__report_file = mal_file.replace(".mal".casefold(), ".log")
-        self.__sections, self.__counts = checker_output
-        self.__report = self.__make_report()
+        # Checker output may have CheckStats after the counts
+        self.__program, self.__counts = checker_output[:2]
 
     def __make_report(self):
         """
-        Makes syntax report.
-            Output: str(report)
+        Makes syntax report one piece at a time, so the report never has to be
+        held in memory as a single string.
+            Output: iter(str(report_piece))
         """
-        report = str()
         divider = "\n-------------\n\n"
-        # Make header section and add to
-        report += self.__make_header()
+        # Make header section
+        yield self.__make_header()
         # Add original, stripped, and error report sections to report
         section_names = ["original MAL program listing:",
                          "stripped MAL program listing:",
                          "error report listing:"]
-        for index, section in enumerate(self.__sections):
-            report += divider + section_names[index] + "\n\n"
-            for line in section:
-                report += line
-                if int(line) < 10:
-                    report += '.  ' + section[line] + '\n'
+        sections = (self.__original_listing, self.__stripped_listing,
+                    self.__evaluated_listing)
+        for index, section in enumerate(sections):
+            yield divider + section_names[index] + "\n\n"
+            for line, text in section():
+                if line < 10:
+                    yield str(line) + '.  ' + text + '\n'
                 else:
-                    report += '. ' + section[line] + '\n'
-        report += divider + self.__make_footer()
+                    yield str(line) + '. ' + text + '\n'
+        yield divider
+        yield from self.__make_footer()
 
-        return report
+    def __original_listing(self):
+        """
+        Generates the original program lines.
+            Output: iter((int(line_num), str(line)))
+        """
+        return enumerate(self.__program.original, 1)
+
+    def __stripped_listing(self):
+        """
+        Generates the program lines with no blank lines or comments.
+            Output: iter((int(line_num), str(line)))
+        """
+        for instruction in self.__program.instructions:
+            yield instruction.line, instruction.text
+
+    def __evaluated_listing(self):
+        """
+        Generates the program lines with their errors and warnings.
+            Output: iter((int(line_num), str(line)))
+        """
+        for instruction in self.__program.instructions:
+            yield instruction.line, instruction.evaluated_text()
 
     def __make_header(self):
         """
@@ -489,57 +1678,66 @@ class SyntaxReport:
     def __make_footer(self):
         """
         Makes report file footer using error and warning count dictionaries.
-            Output: str(footer)
+            Output: iter(str(footer_piece))
         """
-        footer = str()
         error_counts, warning_counts = self.__counts
 
-        # Calculate line count from stripped_lines section
-        line_count = len(self.__sections[1])
-        footer += ("line count = {}\n\n").format(line_count)
+        # Calculate line count from the stripped program lines
+        line_count = len(self.__program.instructions)
+        yield ("line count = {}\n\n").format(line_count)
 
         # Calculate total errors and warnings
-        total_errors = sum([value for value in error_counts.values()])
-        total_warnings = sum([value for value in warning_counts.values()])
+        total_errors = sum(error_counts.values())
+        total_warnings = sum(warning_counts.values())
 
         # Add list of errors to footer
-        footer += ("total errors = {}\n").format(total_errors)
+        yield ("total errors = {}\n").format(total_errors)
         valid_program = True
         if total_errors > 0:
             valid_program = False
             for error in error_counts:
                 error_count = error_counts[error]
                 if error_count > 0:
-                    footer += ("   {} {}\n").format(error_count, error)
-            footer += "\n"
+                    yield ("   {} {}\n").format(error_count, error)
+            yield "\n"
 
         # Add list of warnings to footer
-        footer += ("total warnings = {}\n").format(total_warnings)
+        yield ("total warnings = {}\n").format(total_warnings)
         if total_warnings > 0:
             for warning in warning_counts:
                 warning_count = warning_counts[warning]
                 if warning_count > 0:
-                    footer += ("   {} {}\n").format(warning_count, warning)
+                    yield ("   {} {}\n").format(warning_count, warning)
 
         if valid_program:
-            footer += "\nProcessing complete - MAL program is valid."
+            yield "\nProcessing complete - MAL program is valid."
         else:
-            footer += "\nProcessing complete - MAL program is not valid."
+            yield "\nProcessing complete - MAL program is not valid."
 
-        return footer
+    def render_to(self, stream):
+        """
+        Render syntax report to any writable text stream, such as an open file,
+        sys.stdout, or a pipe, without building the whole report first.
+            Input: stream with a write(str) method
+        """
+        write = stream.write
+        for piece in self.__make_report():
+            write(piece)
 
     def write_to_file(self):
         """
         Write syntax report to .log file.
         """
-        with open(self.__report_file, 'w') as file:
-            file.write(self.__report)
+        with open(self.__report_file, 'w', buffering=REPORT_BUFFER_SIZE) as file:
+            self.render_to(file)
 
     def print_to_console(self):
         """
         Print syntax report to console.
         """
-        print(self.__report)
+        for piece in self.__make_report():
+            print(piece, end='')
+        print()
 
 
 #########################################################################################
@@ -552,6 +1750,23 @@ if __name__ == "__main__":
     import sys
 
     if len(sys.argv) > 1:
-        main(sys.argv[1])
+        options = sys.argv[2:]
+        prometheus_file = None
+        output_format = LOG_FORMAT
+        workers = None
+        for option in options:
+            if option.startswith("--prometheus="):
+                prometheus_file = option.split('=', 1)[1]
+            elif option.startswith("--format="):
+                output_format = option.split('=', 1)[1]
+            elif option.startswith("--workers="):
+                workers = int(option.split('=', 1)[1])
+        if output_format in OUTPUT_FORMATS:
+            main(sys.argv[1], "--stream" in options, "--dataflow" in options,
+                 "--stats" in options, prometheus_file, "--mmap" in options,
+                 output_format, workers, "--memory" in options)
+        else:
+            print(("** error: Unknown output format {}, expected one of {} **").format(
+                output_format, ", ".join(OUTPUT_FORMATS)))
     else:
         print("** error: Missing MAL filename argument **")
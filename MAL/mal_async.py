@@ -0,0 +1,274 @@
+"""
+MAL Asynchronous Syntax Checker
+
+An asyncio front end for checking many MAL programs at once from a service's
+event loop.  Files are read in threads, so the event loop never waits on the
+disk, and checked in a pool of worker processes.  Results are generated as they
+complete.  Only a bounded number of checks are in flight at a time, and no new
+check is started until a result has been taken, so a slow consumer holds back
+the reading and checking rather than letting results pile up.  Each file can be
+given a timeout, counted from when a worker starts its check, and a check that
+runs out of time is stopped in its worker so the files after it are not held
+up.  Closing the generator or cancelling its task cancels the checks still in
+flight.
+"""
+__author__ = "Kenneth Berry"
+
+import argparse
+import asyncio
+import io
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from mal import SourceLines, SyntaxChecker, SyntaxReport
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Most checks in flight at a time
+DEFAULT_CONCURRENCY = 2 * (os.cpu_count() or 1)
+
+# Status of a CheckResult
+OK = "ok"
+FAILED = "failed"
+TIMED_OUT = "timed out"
+
+# Checkers used by every check in a worker process, so their memos of instruction
+# evaluations carry over from one program to the next, {bool(dataflow): SyntaxChecker}
+CHECKERS = {dataflow: SyntaxChecker(dataflow) for dataflow in (False, True)}
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def main(args=None):
+    """
+    Main function.  Checks MAL programs concurrently, printing each result as it
+    completes and writing a .log report for each program.
+        Input: list(args) or None for sys.argv
+        Output: int(exit_status), 1 if any program is not valid or not checked
+    """
+    parser = argparse.ArgumentParser(
+        description="Check the syntax of many MAL programs concurrently.")
+    parser.add_argument("paths", nargs='+', help="MAL files to check")
+    parser.add_argument("-j", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="checks in flight at a time (default: %(default)s)")
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                        help="seconds allowed for each file (default: no limit)")
+    parser.add_argument("--dataflow", action="store_true",
+                        help="check valid programs for data flow warnings")
+    parser.add_argument("--no-log", action="store_true",
+                        help="do not write a .log report for each program")
+    options = parser.parse_args(args)
+    return asyncio.run(check_and_print(options.paths, options.concurrency,
+                                       options.timeout, options.dataflow,
+                                       not options.no_log))
+
+
+async def check_and_print(paths, concurrency, timeout, dataflow, write_log):
+    """
+    Check MAL programs, printing a line for each one and writing its report.
+        Input: list(str(mal_file)), int(concurrency), float(timeout) or None,
+               bool(dataflow), bool(write_log)
+        Output: int(exit_status)
+    """
+    status = 0
+    async for result in check_many(paths, concurrency, timeout, dataflow,
+                                   report=write_log):
+        print(result)
+        if result.status != OK or sum(result.counts[0].values()) > 0:
+            status = 1
+        if result.status == OK and write_log:
+            await asyncio.to_thread(result.write_to_file)
+    return status
+
+
+async def check_many(paths, concurrency=DEFAULT_CONCURRENCY, timeout=None,
+                     dataflow=False, report=True, executor=None):
+    """
+    Check MAL programs concurrently, generating a CheckResult for each program
+    in the order the checks complete.  A program that cannot be read, or whose
+    check takes longer than the timeout, gets a result with its status and
+    message rather than stopping the batch.  The timeout of a file starts when a
+    worker starts its check.  A check in the main thread of a worker process is
+    stopped when it runs out of time; in other workers, such as the threads of a
+    ThreadPoolExecutor, it runs to its end and is then reported as timed out.
+        Input: iter(str(mal_file)) or async iter, int(concurrency),
+               float(timeout) or None, bool(dataflow), bool(report) to make
+               each report's text, Executor or None for a process pool of
+               this function's own
+        Output: async iter(CheckResult)
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=min(concurrency, os.cpu_count() or 1))
+    if hasattr(paths, "__aiter__"):
+        paths = paths.__aiter__()
+    else:
+        paths = aiter_paths(paths)
+    in_flight = set()
+    more_paths = True
+
+    async def fill():
+        nonlocal more_paths
+        while more_paths and len(in_flight) < concurrency:
+            try:
+                path = await paths.__anext__()
+            except StopAsyncIteration:
+                more_paths = False
+                break
+            in_flight.add(asyncio.ensure_future(
+                check_path(path, timeout, dataflow, report, executor)))
+
+    try:
+        await fill()
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                in_flight.discard(task)
+                yield task.result()
+            await fill()
+    finally:
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def aiter_paths(paths):
+    """
+    Generate paths from an ordinary iterable as an async iterator.
+        Input: iter(str(mal_file))
+        Output: async iter(str(mal_file))
+    """
+    for path in paths:
+        yield path
+
+
+async def check_path(mal_file, timeout, dataflow, report, executor):
+    """
+    Read and check one MAL program, within the timeout.  Any error in reading or
+    checking the program gives a FAILED result for the program only.
+        Input: str(mal_file), float(timeout) or None, bool(dataflow),
+               bool(report), Executor
+        Output: CheckResult
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        text = await asyncio.to_thread(read_text, mal_file)
+        return await loop.run_in_executor(executor, check_text_within, mal_file,
+                                          text, dataflow, report, timeout)
+    except Exception as error:
+        return CheckResult(mal_file, status=FAILED,
+                           message=("{}: {}").format(type(error).__name__, error))
+
+
+def read_text(mal_file):
+    """
+    Read a MAL program file, the same way read_source does.
+        Input: str(mal_file)
+        Output: str(text) with newlines translated to '\n'
+    """
+    with open(mal_file, 'r') as file:
+        return file.read()
+
+
+def check_text_within(mal_file, text, dataflow=False, report=True, timeout=None):
+    """
+    Check the text of a MAL program in a worker, giving up once the check has
+    taken longer than the timeout.  In the main thread of a process the check is
+    stopped by an interval timer; elsewhere it is only timed.
+        Input: str(mal_file), str(text), bool(dataflow), bool(report),
+               float(timeout) or None
+        Output: CheckResult
+    """
+    if timeout is None:
+        return check_text(mal_file, text, dataflow, report)
+    timed_out = CheckResult(mal_file, status=TIMED_OUT,
+                            message=("took more than {} seconds").format(timeout))
+    if not hasattr(signal, "setitimer") \
+            or threading.current_thread() is not threading.main_thread():
+        start = time.perf_counter()
+        result = check_text(mal_file, text, dataflow, report)
+        return timed_out if time.perf_counter() - start > timeout else result
+
+    def stop_check(signal_number, frame):
+        raise CheckTimeout()
+
+    previous_handler = signal.signal(signal.SIGALRM, stop_check)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, max(timeout, 1e-6))
+        try:
+            return check_text(mal_file, text, dataflow, report)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except CheckTimeout:
+        return timed_out
+    finally:
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def check_text(mal_file, text, dataflow=False, report=True):
+    """
+    Check the text of a MAL program, in a worker process.
+        Input: str(mal_file), str(text), bool(dataflow), bool(report)
+        Output: CheckResult
+    """
+    program, counts = CHECKERS[dataflow].check_lines(SourceLines(text))
+    report_text = None
+    if report:
+        buffer = io.StringIO()
+        SyntaxReport(mal_file, (program, counts)).render_to(buffer)
+        report_text = buffer.getvalue()
+    return CheckResult(mal_file, counts, report_text)
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class CheckTimeout(Exception):
+    """
+    Raised in a worker to stop a check that has run out of time.
+    """
+
+
+class CheckResult:
+    """
+    Result of checking one MAL program with check_many.
+    """
+    __slots__ = ("mal_file", "counts", "report", "status", "message")
+
+    def __init__(self, mal_file, counts=None, report=None, status=OK, message=None):
+        self.mal_file = mal_file
+        self.counts = counts  # Error and warning counts, or None if not checked
+        self.report = report  # Text of the SyntaxReport, or None
+        self.status = status  # OK, FAILED, or TIMED_OUT
+        self.message = message  # Why the program was not checked, or None
+
+    def write_to_file(self):
+        """
+        Write the report to the program's .log file.
+        """
+        with open(self.mal_file.replace(".mal".casefold(), ".log"), 'w') as file:
+            file.write(self.report)
+
+    def __str__(self):
+        if self.status != OK:
+            return ("{}: ** error: {} **").format(self.mal_file, self.message)
+        return ("{}: {} errors, {} warnings").format(
+            self.mal_file, sum(self.counts[0].values()), sum(self.counts[1].values()))
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    sys.exit(main())
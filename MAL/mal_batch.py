@@ -0,0 +1,307 @@
+"""
+MAL Batch Syntax Checker
+
+Checks every MAL program in one or more directory trees using a pool of worker
+processes, or a pool of threads sharing one SyntaxChecker, writes a .log report
+for each program, and prints a summary.  The results of every program can also
+be written to one file of ndjson or binary records (see mal_emit).
+"""
+__author__ = "Kenneth Berry"
+
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from mal import ERRORS, LOG_FORMAT, OUTPUT_FORMATS, WARNINGS, SyntaxChecker, SyntaxReport
+from mal_cache import CacheStats, ResultCache
+from mal_emit import BINARY_HEADER, EMITTERS
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Number of files handed to a worker process at a time
+DEFAULT_CHUNK_SIZE = 16
+
+# Result cache opened by each worker process, {str(path): ResultCache}
+CACHES = dict()
+
+# Checker shared by every check in a process, which is safe from any thread
+CHECKER = SyntaxChecker()
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def main(args=None):
+    """
+    Main function.  Checks the MAL programs found in the given paths and prints
+    a summary.
+        Input: list(args) or None for sys.argv
+        Output: int(exit_status), 1 if any program is not valid or could not be
+                checked, else 0
+    """
+    parser = argparse.ArgumentParser(
+        description="Check the syntax of every MAL program in directory trees.")
+    parser.add_argument("paths", nargs='*', default=[os.curdir],
+                        help="MAL files or directories to search (default: .)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of worker processes or threads "
+                             "(default: CPU count)")
+    parser.add_argument("-T", "--threads", action="store_true",
+                        help="check in threads sharing one checker rather than in "
+                             "processes; parallel on free-threaded Python 3.13+")
+    parser.add_argument("-c", "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="files sent to a worker at a time")
+    parser.add_argument("--no-log", action="store_true",
+                        help="do not write a .log report for each program")
+    parser.add_argument("--cache", metavar="PATH", default=None,
+                        help="reuse results of unchanged programs from this cache file")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default=LOG_FORMAT,
+                        help="also write the records of every program in this format "
+                             "to the output file (default: %(default)s, none)")
+    parser.add_argument("-o", "--output", metavar="PATH", default=None,
+                        help="file for the records of the ndjson or binary format")
+    options = parser.parse_args(args)
+
+    if options.threads and options.cache is not None:
+        print("** error: --cache can not be used with --threads **")
+        return 2
+    if options.format != LOG_FORMAT and options.output is None:
+        print("** error: --format ndjson or binary needs an --output file **")
+        return 2
+    if options.format == LOG_FORMAT and options.output is not None:
+        print("** error: --output needs --format ndjson or binary **")
+        return 2
+
+    output = None
+    if options.format != LOG_FORMAT:
+        emitter_class = EMITTERS[options.format]
+        if emitter_class.binary:
+            output = open(options.output, 'wb')
+            # Each program's records are made without the stream header
+            output.write(BINARY_HEADER)
+        else:
+            output = open(options.output, 'w', encoding="utf-8")
+
+    start = time.perf_counter()
+    try:
+        if options.threads:
+            summary = check_files_threaded(find_mal_files(options.paths),
+                                           options.workers, not options.no_log,
+                                           options.format, output)
+        else:
+            summary = check_files(find_mal_files(options.paths), options.workers,
+                                  options.chunk_size, not options.no_log, options.cache,
+                                  options.format, output)
+    finally:
+        if output is not None:
+            output.close()
+    summary.elapsed = time.perf_counter() - start
+    print(summary)
+    return 0 if summary.invalid_count == 0 and not summary.failed_files else 1
+
+
+def find_mal_files(paths):
+    """
+    Find MAL program files, searching directories recursively.
+        Input: list(paths)
+        Output: iter(str(mal_file))
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, files in os.walk(path):
+                subdirectories.sort()
+                for file in sorted(files):
+                    if file.lower().endswith(".mal"):
+                        yield os.path.join(directory, file)
+        else:
+            yield path
+
+
+def check_file(mal_file, write_log=True, cache_path=None, output_format=LOG_FORMAT):
+    """
+    Check one MAL program, optionally writing its .log report, and making its
+    records in a machine readable output format.  A program that can not be
+    read or checked, such as one that is not valid UTF-8, gives the message of
+    its error rather than stopping the batch.
+        Input: str(mal_file), bool(write_log), str(cache_path) or None,
+               str(output_format)
+        Output: tuple(str(mal_file), dict(error_count), dict(warning_count),
+                      CacheStats or None, str or bytes(records) or None,
+                      str(failure) or None), with no counts if it failed
+    """
+    try:
+        return check_file_or_raise(mal_file, write_log, cache_path, output_format)
+    except Exception as error:
+        return (mal_file, None, None, None, None,
+                ("{}: {}").format(type(error).__name__, error))
+
+
+def check_file_or_raise(mal_file, write_log, cache_path, output_format):
+    """
+    Check one MAL program for check_file, raising any error.
+        Input: str(mal_file), bool(write_log), str(cache_path) or None,
+               str(output_format)
+        Output: tuple, as check_file gives for a program that was checked
+    """
+    cache_stats = None
+    if cache_path is None:
+        program, counts = CHECKER.check(mal_file)
+    else:
+        if cache_path not in CACHES:
+            CACHES[cache_path] = ResultCache(cache_path)
+        cache = CACHES[cache_path]
+        cache.stats = CacheStats()
+        program, counts = cache.check(mal_file)
+        cache_stats = cache.stats
+    if write_log:
+        SyntaxReport(mal_file, (program, counts)).write_to_file()
+    records = None
+    if output_format != LOG_FORMAT:
+        emitter_class = EMITTERS[output_format]
+        if emitter_class.binary:
+            buffer = io.BytesIO()
+            emitter_class(buffer, header=False).emit(mal_file, (program, counts))
+        else:
+            buffer = io.StringIO()
+            emitter_class(buffer).emit(mal_file, (program, counts))
+        records = buffer.getvalue()
+    error_count, warning_count = counts
+    return mal_file, error_count, warning_count, cache_stats, records, None
+
+
+def check_files(mal_files, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                write_log=True, cache_path=None, output_format=LOG_FORMAT, output=None):
+    """
+    Check MAL programs in a pool of worker processes.  The records of each
+    program are written to the output as its result arrives, in the order of
+    the programs.
+        Input: iter(str(mal_file)), int(workers), int(chunk_size), bool(write_log),
+               str(cache_path) or None, str(output_format), file or None
+        Output: BatchSummary
+    """
+    summary = BatchSummary()
+    mal_files = list(mal_files)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(check_file, mal_files, [write_log] * len(mal_files),
+                               [cache_path] * len(mal_files),
+                               [output_format] * len(mal_files), chunksize=chunk_size)
+        for mal_file, error_count, warning_count, cache_stats, records, failure \
+                in results:
+            if failure is not None:
+                summary.add_failure(mal_file, failure)
+                continue
+            summary.add(mal_file, error_count, warning_count)
+            if records is not None:
+                output.write(records)
+            if cache_stats is not None:
+                if summary.cache_stats is None:
+                    summary.cache_stats = CacheStats()
+                summary.cache_stats.add(cache_stats)
+    return summary
+
+
+def check_files_threaded(mal_files, workers=None, write_log=True,
+                         output_format=LOG_FORMAT, output=None):
+    """
+    Check MAL programs in a pool of threads that share one SyntaxChecker.  With
+    the GIL, threads only overlap reading and writing files; on free-threaded
+    Python 3.13 and later they check programs in parallel.
+        Input: iter(str(mal_file)), int(workers), bool(write_log),
+               str(output_format), file or None
+        Output: BatchSummary
+    """
+    summary = BatchSummary()
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for mal_file, error_count, warning_count, _, records, failure in executor.map(
+                lambda mal_file: check_file(mal_file, write_log, None, output_format),
+                mal_files):
+            if failure is not None:
+                summary.add_failure(mal_file, failure)
+                continue
+            summary.add(mal_file, error_count, warning_count)
+            if records is not None:
+                output.write(records)
+    return summary
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class BatchSummary:
+    """
+    Totals of the errors and warnings found in a batch of MAL programs.
+    """
+
+    def __init__(self):
+        self.file_count = 0
+        self.invalid_files = list()  # MAL files with at least one error
+        # MAL files that could not be checked, list((str(mal_file), str(failure)))
+        self.failed_files = list()
+        self.error_count = {key: 0 for key in ERRORS}
+        self.warning_count = {key: 0 for key in WARNINGS}
+        self.elapsed = 0.0  # Seconds taken to check the batch
+        self.cache_stats = None  # CacheStats when a result cache is used
+
+    @property
+    def invalid_count(self):
+        """
+        Number of MAL programs that are not valid.
+        """
+        return len(self.invalid_files)
+
+    def add(self, mal_file, error_count, warning_count):
+        """
+        Add the error and warning counts of one MAL program to the totals.
+            Input: str(mal_file), dict(error_count), dict(warning_count)
+        """
+        self.file_count += 1
+        for error, count in error_count.items():
+            self.error_count[error] = self.error_count.get(error, 0) + count
+        for warning, count in warning_count.items():
+            self.warning_count[warning] = self.warning_count.get(warning, 0) + count
+        if sum(error_count.values()) > 0:
+            self.invalid_files.append(mal_file)
+
+    def add_failure(self, mal_file, failure):
+        """
+        Add a MAL program that could not be checked.
+            Input: str(mal_file), str(failure) message of its error
+        """
+        self.failed_files.append((mal_file, failure))
+
+    def __str__(self):
+        summary = ("files checked = {}\n").format(self.file_count)
+        if self.elapsed > 0:
+            summary += ("files per second = {:.1f}\n").format(
+                self.file_count / self.elapsed)
+        summary += ("invalid programs = {}\n").format(self.invalid_count)
+        if self.failed_files:
+            summary += ("files not checked = {}\n").format(len(self.failed_files))
+            for mal_file, failure in self.failed_files:
+                summary += ("   {}: ** error: {} **\n").format(mal_file, failure)
+        summary += "\n"
+        summary += ("total errors = {}\n").format(sum(self.error_count.values()))
+        for error, count in self.error_count.items():
+            if count > 0:
+                summary += ("   {} {}\n").format(count, error)
+        summary += ("\ntotal warnings = {}\n").format(sum(self.warning_count.values()))
+        for warning, count in self.warning_count.items():
+            if count > 0:
+                summary += ("   {} {}\n").format(count, warning)
+        if self.cache_stats is not None:
+            summary += "\n" + str(self.cache_stats)
+        return summary.rstrip('\n')
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    sys.exit(main())
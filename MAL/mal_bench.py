@@ -0,0 +1,281 @@
+"""
+MAL Syntax Checker Benchmarks
+
+Measures the lines per second and peak memory of SyntaxChecker.check and of
+making and writing a SyntaxReport, on generated programs of several shapes from
+10 lines up to 10 million lines.  Each case runs in a fresh process so its peak
+memory is its own.  The results are written as JSON with a description of the
+machine, and compared with a saved baseline; a case that is slower or uses more
+memory than the baseline by more than the threshold fails the run.  Timings only
+compare on the same machine, so no baseline is shipped, and a run with no
+baseline fails until one is saved with --update-baseline.
+
+Everything runs offline: python mal_bench.py --update-baseline, then
+python mal_bench.py after each change
+"""
+__author__ = "Kenneth Berry"
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from mal import SyntaxChecker, SyntaxReport, __version__
+from mal_corpus import ProgramGenerator
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Program lengths measured, in lines
+SIZES = [10, 1000, 100000, 1000000, 10000000]
+
+# Program shapes measured, {str(shape): dict(ProgramGenerator options)}
+SHAPES = {"comment-heavy": {"label_density": 0.02, "fan_out": 1,
+                            "comment_ratio": 0.6, "error_rate": 0.0},
+          "label-heavy": {"label_density": 0.2, "fan_out": 2,
+                          "comment_ratio": 0.05, "error_rate": 0.0},
+          "error-heavy": {"label_density": 0.02, "fan_out": 2,
+                          "comment_ratio": 0.1, "error_rate": 0.3}}
+
+# Seed of every generated program, so each run measures the same programs
+SEED = 3210
+
+# Default baseline file, next to this module
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "bench_baseline.json")
+
+# Default percentage a case may be slower or larger than the baseline
+DEFAULT_THRESHOLD = 10.0
+
+# Programs this long or longer are only measured once
+SINGLE_RUN_LINES = 1000000
+
+# Programs this long or longer are checked in stream mode, so they fit in memory
+STREAM_LINES = 10000000
+
+# Shortest time a timing sample may take, in seconds
+MIN_SAMPLE_SECONDS = 0.1
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def main(args=None):
+    """
+    Main function.  Runs the benchmarks, writes the results, and compares them
+    with the baseline.
+        Input: list(args) or None for sys.argv
+        Output: int(exit_status), 1 if any case regressed or there is no
+                baseline, else 0
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the MAL syntax checker and report.")
+    parser.add_argument("-o", "--output", default="bench_results.json",
+                        help="file to write the results to (default: %(default)s)")
+    parser.add_argument("-b", "--baseline", default=BASELINE_FILE,
+                        help="baseline results to compare with (default: %(default)s)")
+    parser.add_argument("-t", "--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed regression in percent (default: %(default)s)")
+    parser.add_argument("--max-lines", type=int, default=SIZES[-1],
+                        help="largest program to measure (default: %(default)s)")
+    parser.add_argument("--shape", action="append", choices=list(SHAPES),
+                        help="shape to measure, repeatable (default: all)")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="runs of each case, the best is kept (default: 3)")
+    parser.add_argument("--stream", action="store_true",
+                        help="check every program in stream mode (default: only "
+                             "programs of {} lines or more)".format(STREAM_LINES))
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="save the results as the new baseline")
+    options = parser.parse_args(args)
+
+    sizes = [size for size in SIZES if size <= options.max_lines]
+    shapes = options.shape or list(SHAPES)
+    results = {"machine": machine_info(), "threshold": options.threshold,
+               "cases": run_benchmarks(sizes, shapes, options.repeat, options.stream)}
+    with open(options.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(("results written to {}").format(options.output))
+
+    if options.update_baseline:
+        with open(options.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(("baseline saved to {}").format(options.baseline))
+        return 0
+    if not os.path.exists(options.baseline):
+        print(("** error: no baseline at {}, save one with --update-baseline **"
+               ).format(options.baseline))
+        return 1
+    with open(options.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(baseline["cases"], results["cases"], options.threshold)
+    for regression in regressions:
+        print(("** REGRESSION: {} **").format(regression))
+    if regressions:
+        print(("** {} regressions over {}% against {} **").format(
+            len(regressions), options.threshold, options.baseline))
+        return 1
+    print(("no regressions over {}% against {}").format(options.threshold,
+                                                      options.baseline))
+    return 0
+
+
+def machine_info():
+    """
+    Describe the machine and software the benchmarks run on.
+        Output: dict(info)
+    """
+    return {"platform": platform.platform(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "checker_version": __version__,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def run_benchmarks(sizes, shapes, repeat, stream=False):
+    """
+    Generate the programs and measure each case in its own process.
+        Input: list(int(lines)), list(str(shape)), int(repeat), bool(stream)
+        Output: list(dict(case))
+    """
+    cases = list()
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        for shape in shapes:
+            for size in sizes:
+                mal_file = os.path.join(directory, ("{}_{}.mal").format(shape, size))
+                ProgramGenerator(size, SEED, **SHAPES[shape]).write(mal_file)
+                runs = 1 if size >= SINGLE_RUN_LINES else repeat
+                stream_case = stream or size >= STREAM_LINES
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    case = executor.submit(measure, mal_file, size, runs,
+                                           stream_case).result()
+                case.update({"shape": shape, "lines": size, "stream": stream_case})
+                cases.append(case)
+                print(("{:>13} {:>9} lines: check {:>10.0f} lines/s {:>7.1f} MB, "
+                       "report {:>10.0f} lines/s {:>7.1f} MB").format(
+                           shape, size, case["check_lines_per_sec"],
+                           case["check_peak_bytes"] / 2 ** 20,
+                           case["report_lines_per_sec"],
+                           case["report_peak_bytes"] / 2 ** 20))
+                os.remove(mal_file)
+    return cases
+
+
+def peak_memory():
+    """
+    Get the peak resident memory of this process.
+        Output: int(bytes)
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives kilobytes and macOS gives bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(mal_file, lines, runs, stream=False):
+    """
+    Measure checking a program and making and writing its report.  The memory
+    of each phase is how much its first run raises the process's peak memory
+    from where it was when the phase started.  In stream mode most of the
+    checking happens while the report is written.
+        Input: str(mal_file), int(lines), int(runs), bool(stream)
+        Output: dict(case)
+    """
+    start_peak = peak_memory()
+    start = time.perf_counter()
+    checker_output = SyntaxChecker().check(mal_file, stream)
+    check_time = time.perf_counter() - start
+    check_peak = peak_memory() - start_peak
+
+    start_peak = peak_memory()
+    start = time.perf_counter()
+    SyntaxReport(mal_file, checker_output).write_to_file()
+    report_time = time.perf_counter() - start
+    report_peak = peak_memory() - start_peak
+
+    if runs > 1:
+        check_time = min(check_time, best_time(
+            lambda: SyntaxChecker().check(mal_file, stream), runs))
+        report_time = min(report_time, best_time(
+            lambda: SyntaxReport(mal_file, checker_output).write_to_file(), runs))
+    os.remove(mal_file.replace(".mal", ".log"))
+    return {"check_seconds": check_time,
+            "check_lines_per_sec": lines / check_time,
+            "check_peak_bytes": check_peak,
+            "report_seconds": report_time,
+            "report_lines_per_sec": lines / report_time,
+            "report_peak_bytes": report_peak}
+
+
+def best_time(function, runs):
+    """
+    Time a function, calling it enough times in a row for each sample to take at
+    least MIN_SAMPLE_SECONDS, so small programs are not lost in timer noise.
+        Input: function() to time, int(runs) samples
+        Output: float(seconds) per call, the best of the samples
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(runs - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def compare(baseline_cases, cases, threshold):
+    """
+    Find the cases that are slower, or use more memory, than the same case in
+    the baseline by more than the threshold.  Programs too small to measure
+    memory on are only compared by speed.
+        Input: list(dict(case)) baseline, list(dict(case)) current,
+               float(threshold) in percent
+        Output: list(str(regression))
+    """
+    baseline = {(case["shape"], case["lines"], case.get("stream", False)): case
+                for case in baseline_cases}
+    allowed = threshold / 100
+    regressions = list()
+    for case in cases:
+        old = baseline.get((case["shape"], case["lines"], case["stream"]))
+        if old is None:
+            continue
+        name = ("{} {} lines").format(case["shape"], case["lines"])
+        for phase in ("check", "report"):
+            speed, old_speed = (case[phase + "_lines_per_sec"],
+                                old[phase + "_lines_per_sec"])
+            if speed < old_speed * (1 - allowed):
+                regressions.append(("{} {}: {:.0f} lines/s, baseline {:.0f}").format(
+                    name, phase, speed, old_speed))
+            peak, old_peak = case[phase + "_peak_bytes"], old[phase + "_peak_bytes"]
+            if old_peak >= 2 ** 20 and peak > old_peak * (1 + allowed):
+                regressions.append(("{} {}: {} bytes peak, baseline {}").format(
+                    name, phase, peak, old_peak))
+    return regressions
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    sys.exit(main())
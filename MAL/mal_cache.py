@@ -0,0 +1,229 @@
+"""
+MAL Syntax Checker Result Cache
+
+Stores SyntaxChecker results in a SQLite database keyed by a hash of the MAL
+program's contents, the checker version, and the rule set, so programs that have
+not changed are never checked again.
+"""
+__author__ = "Kenneth Berry"
+
+import hashlib
+import io
+import json
+import sqlite3
+import time
+import zlib
+import mal
+from mal import ERRORS, MAL, REGISTERS, WARNINGS, Diagnostic, Instruction, \
+    InstructionTable, Program, SourceLines, SyntaxChecker
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Default limit on the size of the stored results in the cache, in bytes
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Hash of everything, other than the program itself, that determines the result
+RULES_HASH = hashlib.sha256(
+    repr((mal.__version__, MAL, REGISTERS, ERRORS, WARNINGS)).encode()).hexdigest()
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def cache_key(content):
+    """
+    Make the cache key for the contents of a MAL program file.
+        Input: bytes(content)
+        Output: str(key)
+    """
+    content_hash = hashlib.sha256(content)
+    content_hash.update(RULES_HASH.encode())
+    return content_hash.hexdigest()
+
+
+def decode_lines(content):
+    """
+    Read original MAL program lines from the contents of a file, the same way
+    read_source does.
+        Input: bytes(content)
+        Output: SourceLines
+    """
+    return SourceLines(io.TextIOWrapper(io.BytesIO(content)).read())
+
+
+def encode_result(program, counts):
+    """
+    Pack the instructions and counts of a checked program for the cache.
+        Input: Program, tuple(counts)
+        Output: bytes(result)
+    """
+    instructions = [[instruction.line, instruction.text, instruction.label,
+                     instruction.opcode, instruction.operands,
+                     instruction.diagnostics and [
+                         [diagnostic.code, diagnostic.column, diagnostic.operand]
+                         for diagnostic in instruction.diagnostics]]
+                    for instruction in program.instructions]
+    return zlib.compress(json.dumps([instructions, counts[0], counts[1]]).encode())
+
+
+def decode_result(original_lines, result):
+    """
+    Unpack the instructions and counts of a checked program from the cache.
+        Input: SourceLines, bytes(result)
+        Output: Program, tuple(counts)
+    """
+    instructions, error_count, warning_count = json.loads(zlib.decompress(result))
+    instructions = [Instruction(line, text, label, opcode, tuple(operands),
+                                diagnostics and [Diagnostic(code, line, column, operand)
+                                                 for code, column, operand in diagnostics])
+                    for line, text, label, opcode, operands, diagnostics in instructions]
+    program = Program(original_lines, InstructionTable(instructions))
+    return program, (error_count, warning_count)
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class ResultCache:
+    """
+    On-disk cache of SyntaxChecker results, with least recently used entries
+    evicted once the stored results grow past a size limit.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.__connection = sqlite3.connect(path, timeout=30)
+        # The total size of the results is kept up to date by triggers, so every
+        # process using the cache sees the same total without adding up the sizes.
+        # It is made in one transaction, so no result is stored before it is.
+        self.__connection.executescript(
+            "BEGIN IMMEDIATE;"
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, result BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);"
+            "CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY CHECK (id = 0), "
+            "size INTEGER NOT NULL);"
+            "INSERT OR IGNORE INTO total SELECT 0, COALESCE(SUM(size), 0) FROM results;"
+            "CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results "
+            "BEGIN UPDATE total SET size = size + NEW.size; END;"
+            "CREATE TRIGGER IF NOT EXISTS results_update AFTER UPDATE OF size ON results "
+            "BEGIN UPDATE total SET size = size - OLD.size + NEW.size; END;"
+            "CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results "
+            "BEGIN UPDATE total SET size = size - OLD.size; END;"
+            "COMMIT;")
+        self.__max_bytes = max_bytes
+        self.__checker = SyntaxChecker()
+        self.stats = CacheStats()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Close the cache database.
+        """
+        self.__connection.close()
+
+    def check(self, mal_file):
+        """
+        Check syntax of MAL program, using the cached result if the program has
+        been checked before.
+            Input: str(mal_file)
+            Output: Program, tuple(counts), the same as SyntaxChecker.check
+        """
+        with open(mal_file, 'rb') as file:
+            content = file.read()
+        original_lines = decode_lines(content)
+        key = cache_key(content)
+
+        row = self.__connection.execute(
+            "SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.stats.hits += 1
+            self.stats.bytes_saved += len(content)
+            with self.__connection:
+                self.__connection.execute(
+                    "UPDATE results SET last_used = ? WHERE key = ?",
+                    (time.time(), key))
+            return decode_result(original_lines, row[0])
+
+        self.stats.misses += 1
+        program, counts = self.__checker.check_lines(original_lines)
+        result = encode_result(program, counts)
+        with self.__connection:
+            # Not INSERT OR REPLACE, whose deletes do not fire triggers
+            self.__connection.execute(
+                "INSERT INTO results VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE "
+                "SET result = excluded.result, size = excluded.size, "
+                "last_used = excluded.last_used",
+                (key, result, len(result), time.time()))
+        self.__evict()
+        return program, counts
+
+    def size(self):
+        """
+        Get the total size of the stored results.
+            Output: int(bytes)
+        """
+        return self.__connection.execute("SELECT size FROM total").fetchone()[0]
+
+    def __evict(self):
+        """
+        Remove least recently used results until the cache fits its size limit.
+        """
+        excess = self.size() - self.__max_bytes
+        if excess <= 0:
+            return
+        evicted = list()
+        for key, size in self.__connection.execute(
+                "SELECT key, size FROM results ORDER BY last_used"):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        with self.__connection:
+            self.__connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+        self.stats.evictions += len(evicted)
+
+
+class CacheStats:
+    """
+    Counts of cache hits and misses, and the bytes of MAL programs that did not
+    have to be checked again.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        """
+        Fraction of lookups that were found in the cache.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def add(self, other):
+        """
+        Add the counts from another CacheStats to these counts.
+            Input: CacheStats
+        """
+        self.hits += other.hits
+        self.misses += other.misses
+        self.bytes_saved += other.bytes_saved
+        self.evictions += other.evictions
+
+    def __str__(self):
+        return ("cache hits = {}, misses = {}, hit rate = {:.1%}, bytes saved = {}, "
+                "evictions = {}").format(self.hits, self.misses, self.hit_rate,
+                                         self.bytes_saved, self.evictions)
@@ -0,0 +1,294 @@
+"""
+MAL Control Flow Graph
+
+Splits a checked MAL program into basic blocks at labels and branches, links
+the blocks by their successor and predecessor edges, and finds the blocks that
+can be reached from the first instruction and their dominators.  Every step
+takes time in proportion to the size of the program, so the graph can be built
+for programs of a million instructions.
+"""
+__author__ = "Kenneth Berry"
+
+import sys
+from mal import LABEL, OPCODE_IDS, OPERAND_KINDS, SyntaxChecker
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Instructions that never continue to the next instruction
+JUMPS = (OPCODE_IDS["BR"], OPCODE_IDS["END"])
+
+# Position of the label operand of each branch and its operand count,
+# {int(opcode): (int(position), int(operand_count))}
+LABEL_OPERANDS = {OPCODE_IDS[opcode]: (kinds.index(LABEL), len(kinds))
+                  for opcode, kinds in OPERAND_KINDS.items() if LABEL in kinds}
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def main(mal_file):
+    """
+    Main function.  Prints the basic blocks of a MAL program, and the
+    unreachable instructions and labels not branched to.
+        Input: str(mal_file)
+    """
+    if ".mal" not in mal_file.lower():
+        mal_file += ".mal"
+    program, _ = SyntaxChecker().check(mal_file)
+    graph = ControlFlowGraph(program.instructions)
+
+    for block in graph.blocks:
+        print(("block {}: lines {}-{} -> {}").format(
+            block.index, block.instructions[0].line, block.instructions[-1].line,
+            ', '.join(str(successor) for successor in block.successors) or "exit"))
+    unreachable, unbranched = graph.findings()
+    for instruction in unreachable:
+        print(("line {}: unreachable instruction {}").format(
+            instruction.line, instruction.text))
+    for label, line in unbranched:
+        print(("line {}: label {} is not branched to").format(line, label))
+
+
+def branch_label(instruction):
+    """
+    Get the label an instruction branches to.
+        Input: Instruction
+        Output: str(label) or None if the instruction is not a well-formed branch
+    """
+    branch = LABEL_OPERANDS.get(instruction.opcode)
+    if branch is None or len(instruction.operands) != branch[1]:
+        return None
+    return instruction.operands[branch[0]]
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class BasicBlock:
+    """
+    A run of instructions that is only entered at its first instruction and only
+    left after its last.  The instructions are a range of the graph's code list,
+    so a block holds no list of its own.
+    """
+    __slots__ = ("index", "code", "start", "end", "labels", "successors",
+                 "predecessors", "exits")
+
+    def __init__(self, index, code, start):
+        self.index = index  # Position of the block in the graph
+        self.code = code  # Executable Instruction records of the whole program
+        self.start = start  # Index of the first instruction in the code
+        self.end = start  # Index after the last instruction in the code
+        self.labels = ()  # Labels that refer to the first instruction, as written
+        self.successors = ()  # Indices of the blocks run next
+        self.predecessors = list()  # Indices of the blocks run just before
+        self.exits = False  # Whether the program can stop after this block
+
+    @property
+    def instructions(self):
+        """
+        Instruction records of the block, in program order.
+        """
+        return self.code[self.start:self.end]
+
+
+class ControlFlowGraph:
+    """
+    Control flow graph of the instructions of a checked MAL program.  Lines with
+    only a label, or with no instruction, belong to the block of the next
+    instruction.
+    """
+
+    def __init__(self, instructions):
+        self.code = list()  # Executable Instruction records, in program order
+        self.blocks = list()  # BasicBlock records, the first one is the entry
+        # Line of the last definition of each spelling of each label,
+        # {str(casefolded_label): {str(label): int(line_num)}}
+        self.labels = dict()
+        self.references = dict()  # Branches to each label, {str(casefolded): int}
+        self.__build(instructions)
+
+    def __build(self, instructions):
+        """
+        Split instructions into basic blocks and link the blocks.  Branch targets
+        are only known once every label is defined, so instructions are split in
+        one pass and the edges are added in a second pass over the blocks.
+            Input: iter(Instruction)
+        """
+        code = self.code
+        blocks = self.blocks
+        label_blocks = dict()  # Block each label refers to, {str(casefolded): int}
+        block = None
+        waiting_labels = list()  # Labels on lines before the next instruction
+        for instruction in instructions:
+            if instruction.label is not None:
+                label = instruction.label_name
+                self.labels.setdefault(label.casefold(), dict())[label] = instruction.line
+                waiting_labels.append(label)
+                # A label starts a new block
+                block = None
+            opcode = instruction.opcode
+            if opcode is None:
+                continue
+            if block is None:
+                block = BasicBlock(len(blocks), code, len(code))
+                blocks.append(block)
+                if waiting_labels:
+                    block.labels = waiting_labels
+                    for label in waiting_labels:
+                        label_blocks[label.casefold()] = block.index
+                    waiting_labels = list()
+            code.append(instruction)
+            block.end += 1
+            # A branch or END ends the block
+            if opcode in JUMPS or opcode in LABEL_OPERANDS:
+                block = None
+
+        for label in waiting_labels:
+            # Labels after the last instruction refer to the exit
+            label_blocks[label.casefold()] = None
+
+        references = self.references
+        block_count = len(blocks)
+        for block in blocks:
+            last = code[block.end - 1]
+            target = None
+            label = branch_label(last)
+            if label is not None:
+                key = label.casefold()
+                references[key] = references.get(key, 0) + 1
+                target = label_blocks.get(key)
+            fall_through = None
+            if last.opcode not in JUMPS and block.index + 1 < block_count:
+                fall_through = block.index + 1
+            if target is not None and target != fall_through:
+                block.successors = (target,) if fall_through is None \
+                    else (target, fall_through)
+            elif fall_through is not None:
+                block.successors = (fall_through,)
+            # END, running off the end, and branches to labels after the last
+            # instruction or to missing labels all stop the program
+            block.exits = last.opcode == OPCODE_IDS["END"] or not block.successors \
+                or (last.opcode not in JUMPS and fall_through is None) \
+                or (label is not None and target is None)
+            for successor in block.successors:
+                blocks[successor].predecessors.append(block.index)
+
+    def reachable(self):
+        """
+        Find the blocks that can be run, starting from the entry block, using a
+        worklist.
+            Output: list(bool) for each block
+        """
+        reached = [False] * len(self.blocks)
+        if not self.blocks:
+            return reached
+        reached[0] = True
+        worklist = [0]
+        while worklist:
+            for successor in self.blocks[worklist.pop()].successors:
+                if not reached[successor]:
+                    reached[successor] = True
+                    worklist.append(successor)
+        return reached
+
+    def reverse_postorder(self):
+        """
+        Order the reachable blocks so each block comes before its successors,
+        except along loops, without recursion.
+            Output: list(int(block_index))
+        """
+        if not self.blocks:
+            return list()
+        blocks = self.blocks
+        visited = [False] * len(blocks)
+        visited[0] = True
+        # Number of successors of each block already followed
+        followed = [0] * len(blocks)
+        postorder = list()
+        stack = [0]
+        while stack:
+            index = stack[-1]
+            successors = blocks[index].successors
+            if followed[index] < len(successors):
+                successor = successors[followed[index]]
+                followed[index] += 1
+                if not visited[successor]:
+                    visited[successor] = True
+                    stack.append(successor)
+            else:
+                stack.pop()
+                postorder.append(index)
+        postorder.reverse()
+        return postorder
+
+    def dominators(self):
+        """
+        Find the immediate dominator of each block, iterating over the blocks in
+        reverse postorder until nothing changes.  This usually takes two or three
+        passes.
+            Output: list(int(block_index) or None) for each block; the entry
+                    block is its own dominator and unreachable blocks have None
+        """
+        order = self.reverse_postorder()
+        position = [None] * len(self.blocks)
+        for number, index in enumerate(order):
+            position[index] = number
+        dominator = [None] * len(self.blocks)
+        if not order:
+            return dominator
+        dominator[0] = 0
+
+        changed = True
+        while changed:
+            changed = False
+            for index in order[1:]:
+                new_dominator = None
+                for predecessor in self.blocks[index].predecessors:
+                    if dominator[predecessor] is None:
+                        continue
+                    if new_dominator is None:
+                        new_dominator = predecessor
+                        continue
+                    # Walk both blocks up the dominator tree until they meet
+                    other = predecessor
+                    while other != new_dominator:
+                        while position[other] > position[new_dominator]:
+                            other = dominator[other]
+                        while position[new_dominator] > position[other]:
+                            new_dominator = dominator[new_dominator]
+                if dominator[index] != new_dominator:
+                    dominator[index] = new_dominator
+                    changed = True
+        return dominator
+
+    def findings(self):
+        """
+        Find the instructions that can never be run and the labels that are never
+        branched to, from the graph rather than by scanning the program again.
+        A label is given at the last definition of each of its spellings.
+            Output: list(Instruction) unreachable,
+                    list((str(label), int(line_num))) not branched to
+        """
+        reached = self.reachable()
+        unreachable = list()
+        for block in self.blocks:
+            if not reached[block.index]:
+                unreachable.extend(block.instructions)
+        unbranched = [(label, line) for key, spellings in self.labels.items()
+                      if key not in self.references for label, line in spellings.items()]
+        return unreachable, unbranched
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1])
+    else:
+        print("** error: Missing MAL filename argument **")
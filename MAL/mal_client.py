@@ -0,0 +1,115 @@
+"""
+MAL Syntax Checker Client
+
+Checks a MAL program with a running checker daemon and writes the report to a
+.log file, just as mal.py does, without paying for starting the checker.  Only
+the standard library needed to talk to the daemon is imported.  If no daemon is
+running, or the socket is not owned by this user, the program is checked in
+this process instead.
+
+python mal_client.py program.mal [--stream] [--dataflow]
+"""
+__author__ = "Kenneth Berry"
+
+import json
+import os
+import socket
+import stat
+import sys
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Directory only this user can use, made by the daemon if it does not exist
+SOCKET_DIRECTORY = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(
+    "/tmp", "mal-checker-{}".format(os.getuid()))
+
+# Socket the daemon listens on, unless MAL_SOCKET names another
+DEFAULT_SOCKET = os.environ.get("MAL_SOCKET") or os.path.join(SOCKET_DIRECTORY,
+                                                              "mal-checker.sock")
+
+# Size of the reads from the socket and of the .log file's write buffer
+BUFFER_SIZE = 1 << 16
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def main(arg, stream=False, dataflow=False, socket_path=DEFAULT_SOCKET):
+    """
+    Main function.  Takes mal file argument, has the daemon check the mal
+    program's syntax, and writes the detailed report it sends back.
+        Input: str(arg), bool(stream), bool(dataflow), str(socket_path)
+    """
+    if ".mal" not in arg.lower():
+        # ADD .mal suffix to ARG
+        arg += ".mal"
+    try:
+        connection = connect(socket_path)
+    except OSError:
+        # No daemon, so check the program here
+        import mal
+        mal.main(arg, stream, dataflow)
+        return
+
+    with connection:
+        reader = send(connection, {"file": os.path.abspath(arg), "name": arg,
+                                   "stream": stream, "dataflow": dataflow,
+                                   "reply": "report"})
+        header = json.loads(reader.readline() or '{"status": "no reply"}')
+        if header["status"] != "ok":
+            print(("** error: {} **").format(header.get("message", header["status"])))
+            return
+        with open(arg.replace(".mal".casefold(), ".log"), 'w',
+                  buffering=BUFFER_SIZE) as file:
+            while True:
+                piece = reader.read(BUFFER_SIZE)
+                if not piece:
+                    break
+                file.write(piece)
+
+
+def connect(socket_path=DEFAULT_SOCKET):
+    """
+    Connect to the checker daemon.  The socket must belong to this user, so
+    that programs are not sent to a daemon someone else is running.
+        Input: str(socket_path)
+        Output: socket.socket
+    """
+    status = os.lstat(socket_path)
+    if not stat.S_ISSOCK(status.st_mode) or status.st_uid != os.getuid():
+        raise PermissionError("{} is not a socket owned by this user".format(
+            socket_path))
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+
+def send(connection, request):
+    """
+    Send one request to the daemon.  The reply is a line with a JSON header,
+    then the report text or one JSON line for each diagnostic, up to the end of
+    the connection.
+        Input: socket.socket, dict(request)
+        Output: text file reading the reply
+    """
+    connection.sendall((json.dumps(request) + '\n').encode("utf-8"))
+    connection.shutdown(socket.SHUT_WR)
+    return connection.makefile('r', encoding="utf-8", newline='')
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1], "--stream" in sys.argv[2:], "--dataflow" in sys.argv[2:])
+    else:
+        print("** error: Missing MAL filename argument **")
@@ -0,0 +1,325 @@
+"""
+MAL Compiler
+
+Compiles checked MAL programs to Python functions for running long loops as fast
+as possible.  The program is split into basic blocks, and each block becomes one
+branch of a state machine in a while loop, with the registers and memory held in
+local variables.  Runs of neighboring blocks are grouped into regions, each with
+a loop of its own that stays in the region until a branch leaves it, so a loop
+within a region never goes back through the other blocks.  The region of a block
+is found by a balanced tree of if statements on the block number, so leaving a
+region takes time in proportion to the log of the number of blocks.  The most
+recently used compiled functions are cached by a hash of the program.
+"""
+__author__ = "Kenneth Berry"
+
+import hashlib
+import sys
+import time
+from collections import OrderedDict
+from mal import MAL, OPCODES, REGISTERS, SyntaxChecker
+from mal_vm import DEFAULT_MAX_STEPS, MALMachine, RunResult, register_index, \
+    resolve_labels
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Instructions that end a basic block
+BRANCHES = ("BEQ", "BLT", "BGT", "BR", "END")
+
+# Comparison made by each conditional branch
+CONDITIONS = {"BEQ": "==", "BLT": "<", "BGT": ">"}
+
+# Most compiled programs kept in the cache
+CACHE_SIZE = 64
+
+# Compiled programs, least recently used first, {str(program_hash): CompiledProgram}
+CACHE = OrderedDict()
+
+# Most blocks in a region
+REGION_BLOCKS = 8
+
+# Block number that stops the program
+EXIT_BLOCK = -1
+
+# Statement that stops a program that has run too many instructions
+STEP_LIMIT_ERROR = ("raise RuntimeError(('MAL program did not stop after {} "
+                    "instructions').format(steps))")
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def main(args):
+    """
+    Main function.  Runs a MAL program both compiled and in the virtual machine,
+    checks that the results are the same, and prints the time each took.
+        Input: list(args), the MAL file followed by NAME=value memory values
+    """
+    mal_file = args[0]
+    if ".mal" not in mal_file.lower():
+        mal_file += ".mal"
+    memory = dict()
+    for arg in args[1:]:
+        name, value = arg.split('=')
+        memory[name] = int(value)
+
+    program, counts = SyntaxChecker().check(mal_file)
+    if sum(counts[0].values()) > 0:
+        print(("** error: {} is not a valid MAL program **").format(mal_file))
+        return
+
+    results = list()
+    for name, runner in (("virtual machine", MALMachine(program.instructions)),
+                         ("compiled", compile_program(program.instructions))):
+        start = time.perf_counter()
+        result = runner.run(memory)
+        elapsed = time.perf_counter() - start
+        results.append(result)
+        print(("{}: {} instructions in {:.6f} s ({:.0f} instructions/sec)").format(
+            name, result.steps, elapsed, result.steps / elapsed if elapsed > 0 else 0))
+    interpreted, compiled = results
+    if vars(interpreted) == vars(compiled):
+        print("results match")
+    else:
+        print("** error: results do not match **")
+
+
+def compile_program(instructions):
+    """
+    Compile the instructions of a checked MAL program, reusing an earlier
+    compilation of the same program.  Once the cache holds CACHE_SIZE programs,
+    the least recently used one is dropped.
+        Input: iter(Instruction)
+        Output: CompiledProgram
+    """
+    code, labels = resolve_labels(instructions)
+    program_hash = hash_program(code, labels)
+    compiled = CACHE.get(program_hash)
+    if compiled is None:
+        compiled = CompiledProgram(code, labels)
+        CACHE[program_hash] = compiled
+        if len(CACHE) > CACHE_SIZE:
+            CACHE.popitem(last=False)
+    else:
+        CACHE.move_to_end(program_hash)
+    return compiled
+
+
+def hash_program(code, labels):
+    """
+    Hash the executable instructions and label targets of a program.
+        Input: list(Instruction), dict(labels)
+        Output: str(program_hash)
+    """
+    program_hash = hashlib.sha256()
+    for instruction in code:
+        program_hash.update(repr((instruction.opcode, instruction.operands)).encode())
+    program_hash.update(repr(sorted(labels.items())).encode())
+    return program_hash.hexdigest()
+
+
+def find_blocks(code, labels):
+    """
+    Split the executable instructions into basic blocks.  A block starts at the
+    first instruction, at each branch target, and after each branch or END.
+        Input: list(Instruction), dict(labels)
+        Output: list(int(start_index)) of the blocks, in order
+    """
+    leaders = {0} if code else set()
+    leaders.update(target for target in labels.values() if target < len(code))
+    for index, instruction in enumerate(code):
+        if OPCODES[instruction.opcode] in BRANCHES and index + 1 < len(code):
+            leaders.add(index + 1)
+    return sorted(leaders)
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class CompiledProgram:
+    """
+    A MAL program compiled to a Python function.
+    """
+
+    def __init__(self, code, labels):
+        self.__slots = dict()  # Memory slot of each identifier, {str(name): int}
+        self.__names = list()  # Identifier of each memory slot, as first written
+        self.source = self.__generate(code, labels)
+        namespace = dict()
+        exec(compile(self.source, "<mal>", "exec"), namespace)
+        self.__function = namespace["run"]
+
+    def __slot(self, name):
+        """
+        Get the local variable for an identifier, adding one if it is new.
+            Input: str(name)
+            Output: str(variable)
+        """
+        key = name.casefold()
+        if key not in self.__slots:
+            self.__slots[key] = len(self.__names)
+            self.__names.append(name)
+        return "m" + str(self.__slots[key])
+
+    def __generate(self, code, labels):
+        """
+        Generate the Python source of the compiled program.
+            Input: list(Instruction), dict(labels)
+            Output: str(source)
+        """
+        starts = find_blocks(code, labels)
+        block_ids = {start: block_id for block_id, start in enumerate(starts)}
+        blocks = list()
+        for block_id, start in enumerate(starts):
+            end = starts[block_id + 1] if block_id + 1 < len(starts) else len(code)
+            blocks.append(self.__generate_block(code[start:end], block_id, end, labels,
+                                                block_ids))
+
+        registers = ["r" + str(index) for index in range(len(REGISTERS))]
+        lines = ["def run(memory, max_steps):",
+                 "    " + " = ".join(registers) + " = 0"]
+        lines += [("    m{} = memory[{}]").format(slot, slot)
+                  for slot in range(len(self.__names))]
+        lines += ["    steps = 0",
+                  ("    block = {}").format(0 if blocks else EXIT_BLOCK),
+                  ("    while block != {}:").format(EXIT_BLOCK)]
+        if blocks:
+            self.__generate_tree(lines, blocks, 0, len(blocks), "        ")
+        else:
+            lines.append("        pass")
+        # A program that stops part way through a block may have run too many
+        lines += ["    if steps > max_steps:",
+                  "        " + STEP_LIMIT_ERROR,
+                  ("    return [{}], [{}], steps").format(
+                      ", ".join("m" + str(slot) for slot in range(len(self.__names))),
+                      ", ".join(registers))]
+        return "\n".join(lines) + "\n"
+
+    def __generate_tree(self, lines, blocks, low, high, indent, region=False):
+        """
+        Generate the balanced tree of if statements that runs the block with the
+        current block number, for the blocks numbered from low up to high.  Once
+        the blocks left are few enough to be a region, the rest of the tree is in
+        a loop that runs until a branch leaves the region.
+            Input: list(str(line)) to add to, list(list(str(statement))),
+                   int(low), int(high), str(indent), bool(region) if the tree is
+                   in the loop of a region
+        """
+        if not region and high - low <= REGION_BLOCKS:
+            lines.append(("{}while {} <= block < {}:").format(indent, low, high))
+            self.__generate_tree(lines, blocks, low, high, indent + "    ", True)
+            return
+        if high - low == 1:
+            lines += [indent + line for line in blocks[low]]
+            return
+        middle = (low + high) // 2
+        lines.append(("{}if block < {}:").format(indent, middle))
+        self.__generate_tree(lines, blocks, low, middle, indent + "    ", region)
+        lines.append(indent + "else:")
+        self.__generate_tree(lines, blocks, middle, high, indent + "    ", region)
+
+    def __generate_block(self, block, block_id, end, labels, block_ids):
+        """
+        Generate the Python statements of a basic block.  A program can only run
+        on without end through a branch back to an earlier block or to itself, so
+        only blocks that can branch back stop a program that has run too many
+        instructions.  A block that ends with a conditional branch to itself is a
+        loop of its own, and is run in a while loop of its own.
+            Input: list(Instruction), int(block_id), int(end_index), dict(labels),
+                   dict(block_ids)
+            Output: list(str(statement))
+        """
+        statements = list()
+        loop_condition = None
+        branches_back = False
+        # The block after this one, or the exit if there is none
+        fall_through = block_ids.get(end, EXIT_BLOCK)
+        next_block = str(fall_through)
+        for instruction in block:
+            opcode = OPCODES[instruction.opcode]
+            operands = instruction.operands
+            kinds = MAL[opcode]
+            values = [("r" + str(register_index(operand))) if 'R' in kind else operand
+                      for kind, operand in zip(kinds, operands)]
+            if opcode == "LOAD":
+                statements.append(("{} = {}").format(values[0], self.__slot(operands[1])))
+            elif opcode == "LOADI":
+                statements.append(("{} = {}").format(values[0], int(operands[1], 8)))
+            elif opcode == "STORE":
+                statements.append(("{} = {}").format(self.__slot(operands[1]), values[0]))
+            elif opcode == "ADD":
+                statements.append(("{} = {} + {}").format(*values))
+            elif opcode == "SUB":
+                statements.append(("{} = {} - {}").format(*values))
+            elif opcode == "INC":
+                statements.append(("{} += 1").format(values[0]))
+            elif opcode == "DEC":
+                statements.append(("{} -= 1").format(values[0]))
+            elif opcode in CONDITIONS:
+                target = self.__target_block(labels, block_ids, operands[2])
+                condition = ("{} {} {}").format(values[0], CONDITIONS[opcode], values[1])
+                if target == block_id:
+                    loop_condition = condition
+                branches_back = EXIT_BLOCK != target <= block_id
+                next_block = ("{} if {} else {}").format(target, condition, fall_through)
+            elif opcode == "BR":
+                target = self.__target_block(labels, block_ids, operands[0])
+                branches_back = EXIT_BLOCK != target <= block_id
+                next_block = str(target)
+            elif opcode == "END":
+                next_block = str(EXIT_BLOCK)
+        statements.append(("steps += {}").format(len(block)))
+        step_limit = ["if steps >= max_steps:", "    " + STEP_LIMIT_ERROR]
+        if fall_through == EXIT_BLOCK and loop_condition is None:
+            # The program may have stopped on the last instruction it may run
+            step_limit[0] = ("if steps >= max_steps and block != {}:").format(EXIT_BLOCK)
+        if loop_condition is not None:
+            return (["while True:"] + ["    " + statement for statement in statements]
+                    + [("    if not {}:").format(loop_condition), "        break"]
+                    + ["    " + statement for statement in step_limit]
+                    + [("block = {}").format(fall_through)])
+        statements.append(("block = {}").format(next_block))
+        if branches_back:
+            statements += step_limit
+        return statements
+
+    def __target_block(self, labels, block_ids, label):
+        """
+        Get the block a branch to a label goes to.
+            Input: dict(labels), dict(block_ids), str(label)
+            Output: int(block_id)
+        """
+        try:
+            target = labels[label.casefold()]
+        except KeyError:
+            raise ValueError(("branch to missing label {}").format(label)) from None
+        # A label after the last instruction goes to the exit
+        return block_ids.get(target, EXIT_BLOCK)
+
+    def run(self, memory=None, max_steps=DEFAULT_MAX_STEPS):
+        """
+        Run the compiled program.
+            Input: dict({str(name): int(value)}) initial memory, int(max_steps)
+            Output: RunResult
+        """
+        initial = [0] * len(self.__names)
+        for name, value in (memory or dict()).items():
+            if name.casefold() in self.__slots:
+                initial[self.__slots[name.casefold()]] = value
+        final, registers, steps = self.__function(initial, max_steps)
+        return RunResult(dict(zip(self.__names, final)), registers, steps)
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1:])
+    else:
+        print("** error: Missing MAL filename argument **")
@@ -0,0 +1,274 @@
+"""
+MAL Corpus Generator
+
+Writes synthetic MAL programs for testing the syntax checker at scale.  The
+length, label density, branch fan-out, comment ratio, and the mix of errors and
+warnings of the programs can all be set, and the same seed always gives the same
+programs.  Programs are written one line at a time, so they can be much larger
+than memory.
+"""
+__author__ = "Kenneth Berry"
+
+import argparse
+import os
+import random
+from mal import ERRORS, WARNINGS
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Number of five letter label names
+LABEL_NAMES = 26 ** 5
+
+# Memory identifiers used by the generated instructions
+IDENTIFIERS = ["COUNT", "TOTAL", "A", "B", "C", "X", "Y", "SUM", "LIMIT", "INDEX"]
+
+# Words used in the generated comments
+COMMENT_WORDS = ["load", "store", "the", "count", "loop", "add", "value", "next",
+                 "check", "branch", "total", "register", "result", "end"]
+
+# Line making each error or warning the generator can put in a program, with
+# {label} filled in by a label name
+PROBLEMS = {"invalid opcode": "MOVE R1, R2",
+            "ill-formed literal": "LOADI R1, 78",
+            "ill-formed identifier (too long)": "LOAD R1, COUNTER",
+            "ill-formed identifier (contains non-letter)": "STORE R1, X2",
+            "ill-formed register": "INC R8",
+            "ill-formed label (too long)": "{label}Z: NOOP",
+            "ill-formed label (contains non-letter)": "{label:.4}1: NOOP",
+            "too few operands": "ADD R1, R2",
+            "too many operands": "INC R1, R2",
+            "branch to missing label": "BR {label}",
+            "label not branched to": "{label}: NOOP"}
+
+# Kinds of generated lines
+INSTRUCTION = "instruction"
+LABELLED = "labelled"
+BRANCH = "branch"
+COMMENT = "comment"
+PROBLEM = "problem"
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def label_name(number):
+    """
+    Make a five letter label name from a number.
+        Input: int(number)
+        Output: str(label)
+    """
+    letters = str()
+    for _ in range(5):
+        number, letter = divmod(number, 26)
+        letters += chr(ord('A') + letter)
+    return letters
+
+
+def main(args=None):
+    """
+    Main function.  Writes a corpus of generated MAL programs to a directory.
+        Input: list(args) or None for sys.argv
+    """
+    parser = argparse.ArgumentParser(
+        description="Write synthetic MAL programs for scale testing.")
+    parser.add_argument("directory", help="directory to write the programs to")
+    parser.add_argument("-n", "--count", type=int, default=1,
+                        help="number of programs (default: 1)")
+    parser.add_argument("-l", "--length", type=int, default=1000,
+                        help="lines in each program (default: 1000)")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+                        help="seed of the first program (default: 0)")
+    parser.add_argument("--label-density", type=float, default=0.05,
+                        help="fraction of lines that define a label (default: 0.05)")
+    parser.add_argument("--fan-out", type=int, default=2,
+                        help="branches to each label, 0 for labels that are never "
+                             "branched to (default: 2)")
+    parser.add_argument("--comment-ratio", type=float, default=0.2,
+                        help="fraction of lines that are comments (default: 0.2)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of lines with an error or warning (default: 0)")
+    parser.add_argument("--error", action="append", default=None,
+                        metavar="CATEGORY[:WEIGHT]",
+                        help="error or warning to include, repeatable (default: all)")
+    options = parser.parse_args(args)
+
+    error_mix = None
+    if options.error:
+        error_mix = dict()
+        for error in options.error:
+            category, _, weight = error.partition(':')
+            error_mix[category] = float(weight) if weight else 1.0
+
+    os.makedirs(options.directory, exist_ok=True)
+    for number in range(options.count):
+        seed = options.seed + number
+        generator = ProgramGenerator(options.length, seed, options.label_density,
+                                     options.fan_out, options.comment_ratio,
+                                     options.error_rate, error_mix)
+        mal_file = os.path.join(options.directory, ("corpus_{}.mal").format(seed))
+        generator.write(mal_file)
+        print(("{}: {} lines, {} errors, {} warnings").format(
+            mal_file, options.length, sum(generator.error_count.values()),
+            sum(generator.warning_count.values())))
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class ProgramGenerator:
+    """
+    Generates the lines of one synthetic MAL program, and the error and warning
+    counts the syntax checker should find in it.
+
+    Every label defined by the program is branched to fan_out times, so a
+    program with no error rate is valid and has no warnings unless fan_out is 0,
+    when each label is counted as a label not branched to.  The kinds of lines
+    are drawn without replacement from their exact counts, so the program has
+    exactly the requested mix however long it is, without holding it in memory.
+    """
+
+    def __init__(self, length, seed=0, label_density=0.05, fan_out=2,
+                 comment_ratio=0.2, error_rate=0.0, error_mix=None):
+        if error_mix is None:
+            error_mix = {category: 1.0 for category in PROBLEMS}
+        for category in error_mix:
+            if category not in PROBLEMS:
+                raise ValueError(("cannot generate {!r}").format(category))
+        if fan_out < 0:
+            raise ValueError("fan-out cannot be negative")
+        self.length = length
+        self.seed = seed
+        self.comment_ratio = comment_ratio
+        self.error_mix = error_mix
+        self.error_count = {key: 0 for key in ERRORS}
+        self.warning_count = {key: 0 for key in WARNINGS}
+
+        # Exact number of lines of each kind, with the END line left over
+        self.label_count = round(length * label_density)
+        self.branch_count = self.label_count * fan_out if self.label_count else 0
+        self.kinds = {LABELLED: self.label_count,
+                      BRANCH: self.branch_count,
+                      COMMENT: round(length * comment_ratio),
+                      PROBLEM: round(length * error_rate) if error_mix else 0}
+        self.kinds[INSTRUCTION] = length - 1 - sum(self.kinds.values())
+        if self.kinds[INSTRUCTION] < 0:
+            raise ValueError(("{} lines are too few for the requested mix").format(
+                length))
+
+    def write(self, mal_file):
+        """
+        Write the program to a MAL file.
+            Input: str(mal_file)
+        """
+        with open(mal_file, 'w') as file:
+            file.writelines(line + '\n' for line in self.lines())
+
+    def lines(self):
+        """
+        Generate the lines of the program.  The counts are reset and filled in as
+        the lines are generated.
+            Output: iter(str(line))
+        """
+        rng = random.Random(self.seed)
+        self.error_count = {key: 0 for key in ERRORS}
+        self.warning_count = {key: 0 for key in WARNINGS}
+        remaining = dict(self.kinds)
+        total = sum(remaining.values())
+        kinds = list(remaining)
+        categories = list(self.error_mix)
+        weights = [self.error_mix[category] for category in categories]
+        labels_defined = 0
+        branches = 0
+        # Labels for problems count down from the last name, clear of the labels
+        # the program defines
+        problem_labels = 0
+
+        while total:
+            # Draw a kind in proportion to the lines of that kind left
+            pick = rng.randrange(total)
+            for kind in kinds:
+                if pick < remaining[kind]:
+                    break
+                pick -= remaining[kind]
+            remaining[kind] -= 1
+            total -= 1
+
+            if kind == COMMENT:
+                yield "; " + self.__comment(rng)
+                continue
+            if kind == INSTRUCTION:
+                line = self.__instruction(rng)
+            elif kind == LABELLED:
+                line = label_name(labels_defined) + ": " + self.__instruction(rng)
+                labels_defined += 1
+                if not self.branch_count:
+                    self.warning_count["label not branched to"] += 1
+            elif kind == BRANCH:
+                line = self.__branch(rng, label_name(branches % self.label_count))
+                branches += 1
+            else:
+                category = rng.choices(categories, weights)[0]
+                problem_labels += 1
+                line = PROBLEMS[category].format(
+                    label=label_name(LABEL_NAMES - problem_labels))
+                if category in ERRORS:
+                    self.error_count[category] += 1
+                else:
+                    self.warning_count[category] += 1
+            if rng.random() < self.comment_ratio:
+                # A space before the semicolon, which is dropped with the comment
+                line += " ; " + self.__comment(rng)
+            yield line
+        yield "END"
+
+    def __instruction(self, rng):
+        """
+        Make a valid instruction that does not branch.
+            Input: random.Random
+            Output: str(instruction)
+        """
+        opcode = rng.choice(("LOAD", "LOADI", "STORE", "ADD", "SUB", "INC", "DEC",
+                             "NOOP"))
+        register = "R" + str(rng.randrange(8))
+        if opcode in ("LOAD", "STORE"):
+            return ("{} {}, {}").format(opcode, register, rng.choice(IDENTIFIERS))
+        if opcode == "LOADI":
+            return ("LOADI {}, {:o}").format(register, rng.randrange(512))
+        if opcode in ("ADD", "SUB"):
+            return ("{} {}, R{}, R{}").format(opcode, register, rng.randrange(8),
+                                             rng.randrange(8))
+        if opcode in ("INC", "DEC"):
+            return ("{} {}").format(opcode, register)
+        return opcode
+
+    def __branch(self, rng, label):
+        """
+        Make a branch to a label.
+            Input: random.Random, str(label)
+            Output: str(instruction)
+        """
+        opcode = rng.choice(("BEQ", "BLT", "BGT", "BR"))
+        if opcode == "BR":
+            return "BR " + label
+        return ("{} R{}, R{}, {}").format(opcode, rng.randrange(8), rng.randrange(8),
+                                         label)
+
+    def __comment(self, rng):
+        """
+        Make the text of a comment.
+            Input: random.Random
+            Output: str(comment)
+        """
+        return ' '.join(rng.choice(COMMENT_WORDS) for _ in range(rng.randint(1, 6)))
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    main()
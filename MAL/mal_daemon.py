@@ -0,0 +1,296 @@
+"""
+MAL Syntax Checker Daemon
+
+A long-lived checker process that answers check requests over a local Unix
+domain socket, so that editor hooks and grading scripts do not pay for starting
+Python and importing the checker for every file.  Checking keeps no state on
+the SyntaxChecker, so one warm checker of each kind answers every request.  The
+socket is made in a directory only this user can use, and only this user can
+connect to it.
+
+A request is one JSON line:
+    {"file": path, "name": path as typed, "stream": bool, "dataflow": bool,
+     "reply": "report" or "diagnostics"}
+or {"command": "ping"} or {"command": "shutdown"}.  The reply is a JSON header
+line with the status, then either the report text, or one JSON line for each
+line with errors or warnings and a last line with the error and warning counts,
+up to the end of the connection.
+
+python mal_daemon.py serve        start the daemon
+python mal_daemon.py stop         stop it
+python mal_daemon.py bench FILE   compare its latency with starting mal.py
+"""
+__author__ = "Kenneth Berry"
+
+import argparse
+import io
+import json
+import os
+import socketserver
+import statistics
+import subprocess
+import sys
+import time
+from mal import REPORT_BUFFER_SIZE, SyntaxChecker, SyntaxReport
+import mal_client
+from mal_client import DEFAULT_SOCKET, connect, send
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Replies the daemon can send after the header
+REPLIES = ("report", "diagnostics")
+
+# Seconds to wait for a new daemon to start listening
+START_TIMEOUT = 10.0
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def main(args=None):
+    """
+    Main function.  Starts or stops the daemon, or benchmarks it.
+        Input: list(args) or None for sys.argv
+        Output: int(exit_status)
+    """
+    parser = argparse.ArgumentParser(description="Serve MAL syntax checks over a "
+                                                 "Unix domain socket.")
+    parser.add_argument("-s", "--socket", default=DEFAULT_SOCKET,
+                        help="socket path (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("serve", help="run the daemon")
+    commands.add_parser("stop", help="stop a running daemon")
+    bench_parser = commands.add_parser("bench", help="compare the latency of the "
+                                                     "daemon with cold starts")
+    bench_parser.add_argument("mal_file", help="MAL program to check")
+    bench_parser.add_argument("-n", "--runs", type=int, default=100,
+                              help="checks of each kind (default: %(default)s)")
+    options = parser.parse_args(args)
+
+    if options.command == "serve":
+        serve(options.socket)
+    elif options.command == "stop":
+        try:
+            request(options.socket, {"command": "shutdown"})
+        except OSError:
+            print(("** error: no daemon listening on {} **").format(options.socket))
+            return 1
+    else:
+        benchmark(options.mal_file, options.runs, options.socket)
+    return 0
+
+
+def serve(socket_path=DEFAULT_SOCKET):
+    """
+    Run the daemon until it is asked to shut down or is interrupted.  The
+    directory of the socket is made private to this user if it does not exist.
+        Input: str(socket_path)
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), mode=0o700,
+                exist_ok=True)
+    if os.path.lexists(socket_path):
+        try:
+            connect(socket_path).close()
+        except PermissionError as error:
+            print(("** error: {} **").format(error))
+            return
+        except OSError:
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(socket_path)
+        else:
+            print(("** error: a daemon is already listening on {} **").format(
+                socket_path))
+            return
+    server = CheckerServer(socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+def request(socket_path, message):
+    """
+    Send a request to the daemon and read the header of the reply.
+        Input: str(socket_path), dict(message)
+        Output: dict(header)
+    """
+    with connect(socket_path) as connection:
+        return json.loads(send(connection, message).readline())
+
+
+def percentile(times, percent):
+    """
+    Get a percentile of some times.
+        Input: list(float(seconds)), int(percent)
+        Output: float(seconds)
+    """
+    if len(times) < 2:
+        return times[0]
+    return statistics.quantiles(times, n=100, method="inclusive")[percent - 1]
+
+
+def benchmark(mal_file, runs, socket_path=DEFAULT_SOCKET):
+    """
+    Print the p50 and p99 latency of checking a program and writing its report
+    by starting mal.py, by starting the thin client, and by a request from an
+    already running client.  A daemon is started for the benchmark if none is
+    running.
+        Input: str(mal_file), int(runs), str(socket_path)
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    daemon = None
+    try:
+        request(socket_path, {"command": "ping"})
+    except OSError:
+        daemon = subprocess.Popen([sys.executable, os.path.join(here, "mal_daemon.py"),
+                                   "--socket", socket_path, "serve"])
+        deadline = time.monotonic() + START_TIMEOUT
+        while True:
+            try:
+                request(socket_path, {"command": "ping"})
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    daemon.kill()
+                    raise
+                time.sleep(0.05)
+
+    environment = dict(os.environ, MAL_SOCKET=socket_path)
+    kinds = {"cold start (mal.py)":
+             lambda: subprocess.run([sys.executable, os.path.join(here, "mal.py"),
+                                     mal_file], check=True),
+             "client start (mal_client.py)":
+             lambda: subprocess.run([sys.executable, os.path.join(here, "mal_client.py"),
+                                     mal_file], check=True, env=environment),
+             "warm request":
+             lambda: mal_client.main(mal_file, socket_path=socket_path)}
+    try:
+        for kind, run in kinds.items():
+            times = list()
+            for _ in range(runs):
+                start = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - start)
+            print(("{:<30} p50 {:>8.2f} ms   p99 {:>8.2f} ms").format(
+                kind, percentile(times, 50) * 1000, percentile(times, 99) * 1000))
+    finally:
+        if daemon is not None:
+            request(socket_path, {"command": "shutdown"})
+            daemon.wait()
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class CheckerServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Unix domain socket server that answers each connection in its own thread,
+    with a warm SyntaxChecker for each kind of check shared by every request.
+    The socket is only readable and writable by this user.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        # {bool(dataflow): SyntaxChecker}
+        self.checkers = {dataflow: SyntaxChecker(dataflow) for dataflow in (False, True)}
+        for checker in self.checkers.values():
+            # Check a tiny program so everything a check needs is loaded
+            checker.check_lines(["END"])
+        super().__init__(socket_path, CheckRequestHandler)
+
+    def server_bind(self):
+        # Bind with the socket made mode 0600, so no one else can ever connect
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+
+class CheckRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answers one request sent to a CheckerServer.
+    """
+    wbufsize = REPORT_BUFFER_SIZE
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline())
+        except ValueError:
+            self.__reply_header({"status": "error", "message": "bad request"})
+            return
+        command = message.get("command", "check")
+        if command == "ping":
+            self.__reply_header({"status": "ok"})
+        elif command == "shutdown":
+            self.__reply_header({"status": "ok"})
+            self.wfile.flush()
+            # shutdown() waits for serve_forever to stop, so it is run from
+            # this thread and not the thread serving
+            self.server.shutdown()
+        elif command == "check":
+            self.__check(message)
+        else:
+            self.__reply_header({"status": "error",
+                                 "message": "unknown command " + str(command)})
+
+    def __reply_header(self, header):
+        """
+        Send the header line of a reply.
+            Input: dict(header)
+        """
+        self.wfile.write((json.dumps(header) + '\n').encode("utf-8"))
+
+    def __check(self, message):
+        """
+        Check a program and send the reply.  In stream mode the program is
+        checked as the report is made.
+            Input: dict(message)
+        """
+        reply = message.get("reply", "report")
+        if reply not in REPLIES or "file" not in message:
+            self.__reply_header({"status": "error", "message": "bad request"})
+            return
+        checker = self.server.checkers[bool(message.get("dataflow", False))]
+        try:
+            program, counts = checker.check(message["file"],
+                                            bool(message.get("stream", False)))
+        except Exception as error:
+            # Such as a file that is missing or is not valid UTF-8
+            self.__reply_header({"status": "error", "message": str(error)})
+            return
+        self.__reply_header({"status": "ok"})
+        text = io.TextIOWrapper(self.wfile, encoding="utf-8", newline='')
+        if reply == "report":
+            name = message.get("name", message["file"])
+            SyntaxReport(name, (program, counts)).render_to(text)
+        else:
+            for instruction in program.instructions:
+                if instruction.diagnostics:
+                    messages = [diagnostic.message
+                                for diagnostic in instruction.diagnostics]
+                    text.write(json.dumps({"line": instruction.line,
+                                           "text": instruction.text,
+                                           "diagnostics": messages}) + '\n')
+            # In stream mode the counts are only known once the instructions
+            # have been generated
+            text.write(json.dumps({"errors": counts[0], "warnings": counts[1]})
+                       + '\n')
+        text.flush()
+        # Leave the socket file for the handler to close
+        text.detach()
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    sys.exit(main())
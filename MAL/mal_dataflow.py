@@ -0,0 +1,270 @@
+"""
+MAL Data Flow Analysis
+
+Finds registers that may be read before they are written, and values stored in
+memory that are always overwritten before they are read.  Both are solved with
+a worklist over the basic blocks of a ControlFlowGraph, with the facts for a
+block kept in one int bitmask: bit n for register Rn, and one bit after the
+registers for each memory identifier.
+"""
+__author__ = "Kenneth Berry"
+
+import sys
+from mal import OPCODE_IDS, REGISTERS, SyntaxChecker
+from mal_cfg import ControlFlowGraph
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Operand positions each instruction reads and writes,
+# {int(opcode): (tuple(read_positions), tuple(write_positions))}
+EFFECTS = {OPCODE_IDS["LOAD"]: ((1,), (0,)),
+           OPCODE_IDS["LOADI"]: ((), (0,)),
+           OPCODE_IDS["STORE"]: ((0,), (1,)),
+           OPCODE_IDS["ADD"]: ((1, 2), (0,)),
+           OPCODE_IDS["SUB"]: ((1, 2), (0,)),
+           OPCODE_IDS["INC"]: ((0,), (0,)),
+           OPCODE_IDS["DEC"]: ((0,), (0,)),
+           OPCODE_IDS["BEQ"]: ((0, 1), ()),
+           OPCODE_IDS["BLT"]: ((0, 1), ()),
+           OPCODE_IDS["BGT"]: ((0, 1), ()),
+           OPCODE_IDS["BR"]: ((), ()),
+           OPCODE_IDS["NOOP"]: ((), ()),
+           OPCODE_IDS["END"]: ((), ())}
+
+# Bit of each register, {str(register): int(mask)}
+REGISTER_BITS = {register: 1 << index for index, register in enumerate(REGISTERS)}
+
+# Bits of all the registers
+ALL_REGISTERS = (1 << len(REGISTERS)) - 1
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def main(mal_file):
+    """
+    Main function.  Prints the data flow warnings for a MAL program.
+        Input: str(mal_file)
+    """
+    if ".mal" not in mal_file.lower():
+        mal_file += ".mal"
+    program, counts = SyntaxChecker().check(mal_file)
+    if sum(counts[0].values()) > 0:
+        print(("** error: {} is not a valid MAL program **").format(mal_file))
+        return
+    for instruction, warning, operand in find_warnings(program.instructions):
+        print(("line {}: {} {}").format(instruction.line, warning, operand))
+
+
+def find_warnings(instructions, graph=None):
+    """
+    Find the data flow warnings for the instructions of a valid MAL program.
+        Input: iter(Instruction), ControlFlowGraph of the instructions or None to
+               build one
+        Output: list((Instruction, str(warning), str(operand))), in program order
+    """
+    if graph is None:
+        graph = ControlFlowGraph(instructions)
+    analysis = DataFlow(graph)
+    reached = graph.reachable()
+    warnings = list()
+    for block in graph.blocks:
+        if reached[block.index]:
+            warnings += analysis.uninitialized_reads(block)
+            warnings += analysis.dead_stores(block)
+    warnings.sort(key=lambda warning: warning[0].line)
+    return warnings
+
+
+def solve(graph, gen, kill, boundary, forward=True):
+    """
+    Solve a data flow problem over the blocks of a graph, where the facts
+    flowing into a block are the union of the facts flowing out of its
+    neighbours.  Blocks are taken from a worklist, in reverse postorder for a
+    forward problem, until no block's facts change, which takes a few passes
+    over the graph.
+        Input: ControlFlowGraph, list(int(gen_mask)), list(int(kill_mask)) for
+               each block, int(boundary_mask) flowing into the entry block (forward)
+               or out of the blocks the program can stop after (backward),
+               bool(forward)
+        Output: list(int(in_mask)), list(int(out_mask)) for each block
+    """
+    blocks = graph.blocks
+    order = graph.reverse_postorder()
+    if not forward:
+        order.reverse()
+    in_masks = [0] * len(blocks)
+    out_masks = [0] * len(blocks)
+    waiting = [False] * len(blocks)
+    for index in order:
+        waiting[index] = True
+    worklist = order[::-1]
+
+    while worklist:
+        index = worklist.pop()
+        waiting[index] = False
+        block = blocks[index]
+        if forward:
+            sources, targets = block.predecessors, block.successors
+            mask = boundary if index == 0 else 0
+            for source in sources:
+                mask |= out_masks[source]
+            in_masks[index] = mask
+            result = gen[index] | (mask & ~kill[index])
+            if result == out_masks[index]:
+                continue
+            out_masks[index] = result
+        else:
+            sources, targets = block.successors, block.predecessors
+            mask = boundary if block.exits else 0
+            for source in sources:
+                mask |= in_masks[source]
+            out_masks[index] = mask
+            result = gen[index] | (mask & ~kill[index])
+            if result == in_masks[index]:
+                continue
+            in_masks[index] = result
+        for target in targets:
+            if not waiting[target]:
+                waiting[target] = True
+                worklist.append(target)
+    return in_masks, out_masks
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class DataFlow:
+    """
+    Register and memory data flow facts of the blocks of a control flow graph.
+    """
+
+    def __init__(self, graph):
+        self.__graph = graph
+        self.__memory_bits = dict()  # Bit of each identifier, {str(casefolded): int}
+        # Bits read and written by each instruction, {id(Instruction): (int, int)}
+        self.__effects = dict()
+        self.__uninitialized = None  # Registers maybe not written, into each block
+        self.__live = None  # Registers and memory maybe read later, out of each block
+        self.__solve()
+
+    def __bit(self, operand):
+        """
+        Get the bit for a register or memory identifier operand.
+            Input: str(operand)
+            Output: int(mask)
+        """
+        bit = REGISTER_BITS.get(operand.upper())
+        if bit is None:
+            key = operand.casefold()
+            bit = self.__memory_bits.get(key)
+            if bit is None:
+                bit = 1 << (len(REGISTERS) + len(self.__memory_bits))
+                self.__memory_bits[key] = bit
+        return bit
+
+    def effects(self, instruction):
+        """
+        Get the bits an instruction reads and writes.
+            Input: Instruction
+            Output: int(read_mask), int(write_mask)
+        """
+        effect = self.__effects.get(id(instruction))
+        if effect is None:
+            reads, writes = EFFECTS[instruction.opcode]
+            operands = instruction.operands
+            read_mask = 0
+            for position in reads:
+                read_mask |= self.__bit(operands[position])
+            write_mask = 0
+            for position in writes:
+                write_mask |= self.__bit(operands[position])
+            effect = (read_mask, write_mask)
+            self.__effects[id(instruction)] = effect
+        return effect
+
+    def __solve(self):
+        """
+        Solve the uninitialized register and live memory problems.
+        """
+        written = list()  # Bits each block writes
+        exposed = list()  # Bits each block reads before writing them
+        for block in self.__graph.blocks:
+            block_written = 0
+            block_exposed = 0
+            for instruction in block.instructions:
+                reads, writes = self.effects(instruction)
+                block_exposed |= reads & ~block_written
+                block_written |= writes
+            written.append(block_written)
+            exposed.append(block_exposed)
+
+        # Registers that may not have been written yet; every register at the start
+        self.__uninitialized, _ = solve(
+            self.__graph, [0] * len(written), written, ALL_REGISTERS, True)
+        # Registers and memory that may be read later; all of memory is the
+        # program's result
+        all_memory = sum(self.__memory_bits.values())
+        _, self.__live = solve(self.__graph, exposed, written, all_memory, False)
+
+    def live_out(self, block):
+        """
+        Get the registers and memory that may be read after a block.
+            Input: BasicBlock
+            Output: int(mask)
+        """
+        return self.__live[block.index]
+
+    def uninitialized_reads(self, block):
+        """
+        Find the instructions in a block that read a register that may not have
+        been written yet.  Only the first such register of an instruction is given.
+            Input: BasicBlock
+            Output: list((Instruction, str(warning), str(register)))
+        """
+        warnings = list()
+        uninitialized = self.__uninitialized[block.index]
+        for instruction in block.instructions:
+            reads, writes = self.effects(instruction)
+            if reads & uninitialized & ALL_REGISTERS:
+                positions = EFFECTS[instruction.opcode][0]
+                for position in positions:
+                    register = instruction.operands[position]
+                    if REGISTER_BITS.get(register.upper(), 0) & uninitialized:
+                        warnings.append((instruction, "uninitialized register",
+                                         register))
+                        break
+            uninitialized &= ~writes
+        return warnings
+
+    def dead_stores(self, block):
+        """
+        Find the STORE instructions in a block whose value is always overwritten
+        before it is read.
+            Input: BasicBlock
+            Output: list((Instruction, str(warning), str(identifier)))
+        """
+        warnings = list()
+        live = self.__live[block.index]
+        for instruction in reversed(block.instructions):
+            reads, writes = self.effects(instruction)
+            if instruction.opcode == OPCODE_IDS["STORE"] and not writes & live:
+                warnings.append((instruction, "dead store", instruction.operands[1]))
+            live = (live & ~writes) | reads
+        warnings.reverse()
+        return warnings
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1])
+    else:
+        print("** error: Missing MAL filename argument **")
@@ -0,0 +1,197 @@
+"""
+MAL Syntax Checker Output Formats
+
+Machine readable alternatives to the .log report.  Both formats have a record
+for each error and warning, and a summary record for each file with the same
+counts as the footer of its report.  The records of a program are written as
+its instructions are generated, so with a streaming check they are written
+while the check runs.
+
+ndjson: one JSON object per line
+binary: a stream header, then records each prefixed with their length
+
+Binary format, all integers little-endian:
+    stream header   b"MALB", uint8 version
+    record          uint32 payload length, payload
+    payload         uint8 record type, then
+        FILE        file name (UTF-8, rest of the payload)
+        DIAGNOSTIC  uint8 code, uint32 line, uint32 column, operand (UTF-8, rest)
+        SUMMARY     uint32 line count, uint32 count of each code in DIAGNOSTICS
+Codes are indices of DIAGNOSTICS in mal.py.  A DIAGNOSTIC or SUMMARY record
+belongs to the file of the last FILE record.
+"""
+__author__ = "Kenneth Berry"
+
+import json
+import struct
+from mal import DIAGNOSTICS, ERRORS, WARNINGS
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Start of a binary stream, and its version
+BINARY_MAGIC = b"MALB"
+BINARY_VERSION = 1
+BINARY_HEADER = BINARY_MAGIC + bytes((BINARY_VERSION,))
+
+# Binary record types
+FILE = 0
+DIAGNOSTIC = 1
+SUMMARY = 2
+
+# Binary record layouts, without the strings that take up the rest of a payload
+LENGTH = struct.Struct("<I")
+RECORD_TYPE = struct.Struct("<B")
+DIAGNOSTIC_FIELDS = struct.Struct("<BBII")
+SUMMARY_FIELDS = struct.Struct("<B" + "I" * (1 + len(DIAGNOSTICS)))
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def diagnostic_record(mal_file, diagnostic, messages=False):
+    """
+    Make the record of an error or warning.
+        Input: str(mal_file), Diagnostic, bool(messages) to include the message
+        Output: dict(record)
+    """
+    record = {"type": "diagnostic", "file": mal_file, "line": diagnostic.line,
+              "column": diagnostic.column, "code": diagnostic.code,
+              "key": diagnostic.key, "severity": diagnostic.severity,
+              "operand": diagnostic.operand}
+    if messages:
+        record["message"] = diagnostic.message
+    return record
+
+
+def summary_record(mal_file, line_count, counts):
+    """
+    Make the summary record of a file, with the counts of its report's footer.
+        Input: str(mal_file), int(line_count), tuple(counts)
+        Output: dict(record)
+    """
+    error_counts, warning_counts = counts
+    total_errors = sum(error_counts.values())
+    return {"type": "summary", "file": mal_file, "line_count": line_count,
+            "errors": total_errors, "warnings": sum(warning_counts.values()),
+            "error_counts": {key: count for key, count in error_counts.items()
+                             if count > 0},
+            "warning_counts": {key: count for key, count in warning_counts.items()
+                               if count > 0},
+            "valid": total_errors == 0}
+
+
+def read_binary(stream):
+    """
+    Read the records of a binary stream, as the same records the ndjson format
+    has, without messages.
+        Input: binary stream with a read(n) method
+        Output: iter(dict(record))
+    """
+    if stream.read(len(BINARY_HEADER)) != BINARY_HEADER:
+        raise ValueError("not a version {} MAL binary stream".format(BINARY_VERSION))
+    mal_file = None
+    while True:
+        length = stream.read(LENGTH.size)
+        if not length:
+            return
+        payload = stream.read(LENGTH.unpack(length)[0])
+        record_type = payload[0]
+        if record_type == FILE:
+            mal_file = payload[RECORD_TYPE.size:].decode("utf-8")
+        elif record_type == DIAGNOSTIC:
+            _, code, line, column = DIAGNOSTIC_FIELDS.unpack_from(payload)
+            key = DIAGNOSTICS[code]
+            yield {"type": "diagnostic", "file": mal_file, "line": line,
+                   "column": column, "code": code, "key": key,
+                   "severity": "error" if key in ERRORS else "warning",
+                   "operand": payload[DIAGNOSTIC_FIELDS.size:].decode("utf-8")}
+        elif record_type == SUMMARY:
+            fields = SUMMARY_FIELDS.unpack(payload)
+            code_counts = dict(zip(DIAGNOSTICS, fields[2:]))
+            counts = ({key: code_counts[key] for key in ERRORS},
+                      {key: code_counts[key] for key in WARNINGS})
+            yield summary_record(mal_file, fields[1], counts)
+        else:
+            raise ValueError("unknown record type {}".format(record_type))
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class NDJSONEmitter:
+    """
+    Writes checker results as newline-delimited JSON to a text stream.
+    """
+    extension = ".ndjson"
+    binary = False
+
+    def __init__(self, stream, messages=False):
+        self.__write = stream.write
+        self.__messages = messages  # Whether records include the message
+
+    def emit(self, mal_file, checker_output):
+        """
+        Write the records of a checked program.
+            Input: str(mal_file), tuple(Program, counts) from SyntaxChecker.check
+        """
+        program, counts = checker_output[:2]
+        write = self.__write
+        dumps = json.dumps
+        line_count = 0
+        for instruction in program.instructions:
+            line_count += 1
+            if instruction.diagnostics:
+                for diagnostic in instruction.diagnostics:
+                    write(dumps(diagnostic_record(mal_file, diagnostic,
+                                                  self.__messages)) + '\n')
+        # In stream mode the counts are only known once the instructions have
+        # been generated
+        write(dumps(summary_record(mal_file, line_count, counts)) + '\n')
+
+
+class BinaryEmitter:
+    """
+    Writes checker results as length-prefixed binary records to a binary stream.
+    """
+    extension = ".malb"
+    binary = True
+
+    def __init__(self, stream, header=True):
+        self.__write = stream.write
+        if header:
+            self.__write(BINARY_HEADER)
+
+    def __record(self, payload):
+        """
+        Write one record.
+            Input: bytes(payload)
+        """
+        self.__write(LENGTH.pack(len(payload)) + payload)
+
+    def emit(self, mal_file, checker_output):
+        """
+        Write the records of a checked program.
+            Input: str(mal_file), tuple(Program, counts) from SyntaxChecker.check
+        """
+        program, counts = checker_output[:2]
+        self.__record(RECORD_TYPE.pack(FILE) + mal_file.encode("utf-8"))
+        line_count = 0
+        for instruction in program.instructions:
+            line_count += 1
+            if instruction.diagnostics:
+                for diagnostic in instruction.diagnostics:
+                    self.__record(DIAGNOSTIC_FIELDS.pack(
+                        DIAGNOSTIC, diagnostic.code, diagnostic.line,
+                        diagnostic.column) + diagnostic.operand.encode("utf-8"))
+        error_counts, warning_counts = counts
+        code_counts = [error_counts[key] for key in ERRORS] + \
+            [warning_counts[key] for key in WARNINGS]
+        self.__record(SUMMARY_FIELDS.pack(SUMMARY, line_count, *code_counts))
+
+
+# Output formats, {str(name): emitter class}
+EMITTERS = {"ndjson": NDJSONEmitter, "binary": BinaryEmitter}
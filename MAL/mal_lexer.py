@@ -0,0 +1,243 @@
+"""
+MAL Lexer
+
+Splits MAL program lines into typed tokens in a single pass.  Opcodes and
+registers are looked up in a keyword table built once from the instruction set,
+and all normalized token text is interned.  The column each token starts at is
+kept beside the tokens, so tokens stay the same wherever they are on a line.
+"""
+__author__ = "Kenneth Berry"
+
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Token kinds
+LABEL_DEF = "label-def"
+OPCODE = "opcode"
+REGISTER = "register"
+IDENTIFIER = "identifier"
+LITERAL = "literal"
+COMMA = "comma"
+COMMENT = "comment"
+
+# Characters of a decimal literal; whether it is octal is up to the checker
+DIGITS = "0123456789"
+
+# A token: str(kind), str(text) as written, str(value) normalized and interned
+Token = namedtuple("Token", "kind text value")
+
+# Every comma is the same token
+COMMA_TOKEN = Token(COMMA, ',', ',')
+
+# Number of distinct tokenized lines a lexer remembers
+LINE_TABLE_SIZE = 4096
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def split_words(line, dropped=None):
+    """
+    Split a line into words at whitespace, keeping the column of each word.
+    Every copy of the dropped text is taken out of the line before it is split,
+    the way str.replace takes it out, but columns are still those of the line.
+        Input: str(line), str(dropped) or None
+        Output: list((str(word), int(column))) with columns counted from 1
+    """
+    positions = range(len(line))
+    if dropped:
+        # Position in the line of each character left once the copies are dropped
+        positions = list()
+        index = 0
+        while index < len(line):
+            if line.startswith(dropped, index):
+                index += len(dropped)
+            else:
+                positions.append(index)
+                index += 1
+        line = line.replace(dropped, '')
+    words = list()
+    start = 0
+    for word in line.split():
+        start = line.index(word, start)
+        words.append((word, positions[start] + 1))
+        start += len(word)
+    return words
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class Lexer:
+    """
+    Table-driven tokenizer for MAL program lines.
+
+    The tokens follow the way MAL lines have always been read: a label
+    definition is a first word containing a colon, commas are dropped from
+    operands without splitting them, and when a label has an instruction on the
+    same line every other occurrence of the label is dropped from the
+    instruction.
+    """
+
+    def __init__(self, opcodes, registers, line_table_size=LINE_TABLE_SIZE):
+        # Lines already tokenized, least recently used first,
+        # {str(line): (tuple(tokens), tuple(columns))}, since programs repeat the
+        # same lines many times
+        self.__lines = OrderedDict()
+        self.__line_table_size = line_table_size
+        # Held while the line table is read or changed, since threads checking
+        # programs at the same time share the lexer
+        self.__lines_lock = threading.Lock()
+        # Keyword table, {str(upper_word): Token}, with the written text filled
+        # in when a token is made
+        self.__keywords = dict()
+        for opcode in opcodes:
+            self.__keywords[opcode] = Token(OPCODE, opcode, sys.intern(opcode))
+        for register in registers:
+            self.__keywords[register] = Token(REGISTER, register, sys.intern(register))
+
+    def is_opcode(self, word):
+        """
+        Checks if a word is an opcode, ignoring case.
+            Input: str(word)
+            Output: True if opcode, else False
+        """
+        keyword = self.__keywords.get(word.upper())
+        return keyword is not None and keyword.kind is OPCODE
+
+    def tokenize(self, line):
+        """
+        Tokenize a stripped MAL program line, one with no comment or tabs.
+            Input: str(line)
+            Output: tuple(tokens)
+        """
+        return self.__lookup(line)[0]
+
+    def token_columns(self, line):
+        """
+        Get the column each token of a stripped MAL program line starts at.
+            Input: str(line)
+            Output: tuple(int(column)) counted from 1, one for each token
+        """
+        return self.__lookup(line)[1]
+
+    def __lookup(self, line):
+        """
+        Get the tokens of a stripped MAL program line and their columns from the
+        line table, tokenizing the line if it is not there.  Once the table is
+        full, the least recently used line is dropped for each new one.
+            Input: str(line)
+            Output: tuple(tokens), tuple(columns)
+        """
+        lines = self.__lines
+        with self.__lines_lock:
+            entry = lines.get(line)
+            if entry is not None:
+                lines.move_to_end(line)
+                return entry
+        # Tokenized outside the lock; two threads may both tokenize a new line
+        entry = self.__tokenize(line)
+        with self.__lines_lock:
+            lines[line] = entry
+            if len(lines) > self.__line_table_size:
+                lines.popitem(last=False)
+        return entry
+
+    def __tokenize(self, line):
+        """
+        Tokenize a stripped MAL program line that is not in the line table.
+            Input: str(line)
+            Output: tuple(tokens), tuple(columns)
+        """
+        words = split_words(line)
+        first_word = words[0][0]
+        tokens = list()
+        columns = list()
+
+        if ':' in first_word:
+            # First word is a label definition
+            tokens.append(Token(LABEL_DEF, first_word,
+                                sys.intern(first_word.replace(':', ''))))
+            columns.append(words[0][1])
+            if len(words) > 1 and self.is_opcode(words[1][0]):
+                words = split_words(line, first_word)
+            else:
+                for word, column in words[1:]:
+                    self.__add_operand(tokens, columns, word, column)
+                return tuple(tokens), tuple(columns)
+
+        # First word of an instruction, taken as written
+        word, column = words[0]
+        keyword = self.__keywords.get(word) or self.__keywords.get(word.upper())
+        if keyword is not None and keyword.kind is OPCODE:
+            tokens.append(self.__as_written(keyword, word))
+        else:
+            tokens.append(self.__make_operand(word))
+        columns.append(column)
+
+        for word, column in words[1:]:
+            self.__add_operand(tokens, columns, word, column)
+        return tuple(tokens), tuple(columns)
+
+    def tokenize_line(self, line, stripped_line):
+        """
+        Tokenize an original MAL program line, given its stripped text, adding a
+        comment token for any comment on the line.
+            Input: str(line), str(stripped_line)
+            Output: tuple(tokens)
+        """
+        tokens = self.tokenize(stripped_line) if stripped_line else tuple()
+        index = line.find(';')
+        if index >= 0:
+            comment = line[index + 1:]
+            tokens += (Token(COMMENT, comment, comment.strip()),)
+        return tokens
+
+    def __add_operand(self, tokens, columns, word, column):
+        """
+        Add the tokens for an operand word and their columns, dropping commas
+        from the operand.
+            Input: list(tokens), list(columns), str(word), int(column) of the word
+        """
+        if ',' in word:
+            operand = word.replace(',', '')
+            if operand:
+                tokens.append(self.__make_operand(operand))
+                columns.append(column + len(word) - len(word.lstrip(',')))
+            for index, character in enumerate(word):
+                if character == ',':
+                    tokens.append(COMMA_TOKEN)
+                    columns.append(column + index)
+        else:
+            tokens.append(self.__make_operand(word))
+            columns.append(column)
+
+    def __as_written(self, keyword, word):
+        """
+        Get a keyword token with its text as written in the line.
+            Input: Token(keyword), str(word)
+            Output: Token
+        """
+        if keyword.text == word:
+            return keyword
+        return keyword._replace(text=word)
+
+    def __make_operand(self, word):
+        """
+        Make a register, literal, or identifier token for a word.
+            Input: str(word)
+            Output: Token
+        """
+        keyword = self.__keywords.get(word) or self.__keywords.get(word.upper())
+        if keyword is not None and keyword.kind is REGISTER:
+            return self.__as_written(keyword, word)
+        if not word.strip(DIGITS):
+            return Token(LITERAL, word, sys.intern(word))
+        return Token(IDENTIFIER, word, sys.intern(word))
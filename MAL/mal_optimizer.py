@@ -0,0 +1,337 @@
+"""
+MAL Optimizer
+
+Rewrites a valid MAL program as a shorter program that leaves the same values in
+memory.  The passes remove NOOPs, thread branches to branches, remove blocks that
+can never be run, fold constants loaded with LOADI through INC, DEC, ADD and SUB,
+cancel INC and DEC pairs, and remove writes that are never read.  Memory is the
+result of a program; the final register values may differ.
+"""
+__author__ = "Kenneth Berry"
+
+import os
+import sys
+from mal import OPCODE_IDS, OPCODES, REGISTERS, Instruction, SyntaxChecker
+from mal_cfg import ControlFlowGraph, branch_label
+from mal_dataflow import DataFlow
+from mal_vm import MALMachine, resolve_labels
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Most times the passes are repeated, since one pass can make room for another
+MAX_ROUNDS = 10
+
+# Instructions with no effect other than writing their register or memory operand
+WRITES_ONLY = (OPCODE_IDS["LOAD"], OPCODE_IDS["LOADI"], OPCODE_IDS["STORE"],
+               OPCODE_IDS["ADD"], OPCODE_IDS["SUB"], OPCODE_IDS["INC"],
+               OPCODE_IDS["DEC"])
+
+# Opposite of each step instruction
+OPPOSITE = {OPCODE_IDS["INC"]: OPCODE_IDS["DEC"], OPCODE_IDS["DEC"]: OPCODE_IDS["INC"]}
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def main(args):
+    """
+    Main function.  Optimizes a MAL program, writes the optimized program next to
+    it, and prints the instructions saved and, for the given memory values, the
+    instructions run before and after.
+        Input: list(args), the MAL file followed by NAME=value memory values
+    """
+    mal_file = args[0]
+    if ".mal" not in mal_file.lower():
+        mal_file += ".mal"
+    memory = dict()
+    for arg in args[1:]:
+        name, value = arg.split('=')
+        memory[name] = int(value)
+
+    program, counts = SyntaxChecker().check(mal_file)
+    if sum(counts[0].values()) > 0:
+        print(("** error: {} is not a valid MAL program **").format(mal_file))
+        return
+    original = list(program.instructions)
+    optimized = optimize(original)
+    root, extension = os.path.splitext(mal_file)
+    optimized_file = root + "_optimized" + extension
+    if os.path.abspath(optimized_file) == os.path.abspath(mal_file):
+        print(("** error: {} would be written over **").format(mal_file))
+        return
+    write_program(optimized_file, optimized)
+
+    before, after = instruction_count(original), instruction_count(optimized)
+    print(("{} written").format(optimized_file))
+    print(("instructions: {} -> {} ({} saved)").format(before, after, before - after))
+    try:
+        before = MALMachine(original).run(memory).steps
+        after = MALMachine(optimized).run(memory).steps
+    except (RuntimeError, ValueError) as error:
+        print(("** error: {} **").format(error))
+        return
+    print(("cycles: {} -> {} ({} saved)").format(before, after, before - after))
+
+
+def instruction_count(instructions):
+    """
+    Count the instructions of a program, leaving out lines with only a label.
+        Input: iter(Instruction)
+        Output: int(count)
+    """
+    return sum(1 for instruction in instructions if instruction.opcode is not None)
+
+
+def make_instruction(label, opcode, operands):
+    """
+    Make an Instruction record for an optimized line.
+        Input: str(label) with its colon or None, int(opcode) or None,
+               tuple(operands)
+        Output: Instruction
+    """
+    words = list()
+    if label is not None:
+        words.append(label)
+    if opcode is not None:
+        words.append(OPCODES[opcode])
+        if operands:
+            words.append(', '.join(operands))
+    return Instruction(0, ' '.join(words), label, opcode, tuple(operands))
+
+
+def relabel(instruction, label):
+    """
+    Copy an instruction with a different label.
+        Input: Instruction, str(label) with its colon or None
+        Output: Instruction
+    """
+    return make_instruction(label, instruction.opcode, instruction.operands)
+
+
+def drop(instruction):
+    """
+    Remove the instruction from a line, keeping its label.
+        Input: Instruction
+        Output: list(Instruction), with the label on a line by itself or empty
+    """
+    if instruction.label is None:
+        return list()
+    return [make_instruction(instruction.label, None, ())]
+
+
+def write_program(mal_file, instructions):
+    """
+    Write the lines of a program to a MAL file.
+        Input: str(mal_file), iter(Instruction)
+    """
+    with open(mal_file, 'w') as file:
+        for instruction in instructions:
+            file.write(instruction.text + '\n')
+
+
+def optimize(instructions):
+    """
+    Optimize the instructions of a valid MAL program, repeating the passes until
+    the program stops changing.
+        Input: iter(Instruction)
+        Output: list(Instruction) of the optimized program
+    """
+    program = [make_instruction(instruction.label, instruction.opcode,
+                                instruction.operands) for instruction in instructions
+               if instruction.label is not None or instruction.opcode is not None]
+    passes = (remove_noops, thread_branches, remove_dead_blocks, fold_constants,
+              remove_dead_writes, remove_unused_labels)
+    for _ in range(MAX_ROUNDS):
+        before = [instruction.text for instruction in program]
+        for optimization in passes:
+            program = optimization(program)
+        if [instruction.text for instruction in program] == before:
+            break
+    return program
+
+
+def remove_noops(program):
+    """
+    Remove NOOP instructions.
+        Input: list(Instruction)
+        Output: list(Instruction)
+    """
+    optimized = list()
+    for instruction in program:
+        if instruction.opcode == OPCODE_IDS["NOOP"]:
+            optimized += drop(instruction)
+        else:
+            optimized.append(instruction)
+    return optimized
+
+
+def thread_branches(program):
+    """
+    Send branches to a BR straight to where the BR goes, and remove branches to
+    the next instruction.  A branch to a missing label stops the program, as in
+    ControlFlowGraph, so it is left as it is and ends a chain of BRs.
+        Input: list(Instruction)
+        Output: list(Instruction)
+    """
+    code, labels = resolve_labels(program)
+    position = {id(instruction): index for index, instruction in enumerate(code)}
+    optimized = list()
+    for instruction in program:
+        label = branch_label(instruction)
+        if label is None:
+            optimized.append(instruction)
+            continue
+        target = labels.get(label.casefold())
+        if target is None:
+            optimized.append(instruction)
+            continue
+        # Follow the chain of BRs, stopping at a loop or a missing label
+        followed = {target}
+        while target < len(code) and code[target].opcode == OPCODE_IDS["BR"]:
+            next_label = code[target].operands[0]
+            next_target = labels.get(next_label.casefold())
+            if next_target is None or next_target in followed:
+                break
+            label, target = next_label, next_target
+            followed.add(target)
+        if target == position[id(instruction)] + 1:
+            optimized += drop(instruction)
+        else:
+            optimized.append(make_instruction(instruction.label, instruction.opcode,
+                                              instruction.operands[:-1] + (label,)))
+    return optimized
+
+
+def remove_dead_blocks(program):
+    """
+    Remove the instructions in blocks that can never be run.
+        Input: list(Instruction)
+        Output: list(Instruction)
+    """
+    graph = ControlFlowGraph(program)
+    reached = graph.reachable()
+    dead = set()
+    for block in graph.blocks:
+        if not reached[block.index]:
+            dead.update(id(instruction) for instruction in block.instructions)
+    optimized = list()
+    for instruction in program:
+        if id(instruction) in dead:
+            optimized += drop(instruction)
+        else:
+            optimized.append(instruction)
+    return optimized
+
+
+def fold_constants(program):
+    """
+    Replace instructions whose result is known from earlier LOADIs in the same
+    block with a LOADI of the result, and cancel an INC next to a DEC of the same
+    register.  Results below zero cannot be written as a literal and are left.
+        Input: list(Instruction)
+        Output: list(Instruction)
+    """
+    optimized = list()
+    known = dict()  # Value of each register known in the block, {str(R_n): int}
+    for instruction in program:
+        opcode = instruction.opcode
+        if instruction.label is not None:
+            # Other blocks branch here, so nothing is known
+            known = dict()
+        if opcode is None:
+            optimized.append(instruction)
+            continue
+        operands = [operand.upper() if operand.upper() in REGISTERS else operand
+                    for operand in instruction.operands]
+        value = None
+        if opcode == OPCODE_IDS["LOADI"]:
+            value = int(operands[1], 8)
+        elif opcode in OPPOSITE and operands[0] in known:
+            value = known[operands[0]] + (1 if opcode == OPCODE_IDS["INC"] else -1)
+        elif opcode in (OPCODE_IDS["ADD"], OPCODE_IDS["SUB"]) \
+                and operands[1] in known and operands[2] in known:
+            value = known[operands[1]] + (known[operands[2]] if opcode == OPCODE_IDS["ADD"]
+                                          else -known[operands[2]])
+
+        if value is not None and value >= 0:
+            known[operands[0]] = value
+            instruction = make_instruction(instruction.label, OPCODE_IDS["LOADI"],
+                                           (operands[0], format(value, 'o')))
+        elif opcode in WRITES_ONLY and opcode != OPCODE_IDS["STORE"]:
+            known.pop(operands[0], None)
+
+        previous = optimized[-1] if optimized else None
+        if opcode in OPPOSITE and instruction.opcode == opcode \
+                and instruction.label is None and previous is not None \
+                and previous.opcode == OPPOSITE[opcode] \
+                and previous.operands[0].upper() == operands[0]:
+            optimized.pop()
+            optimized += drop(previous)
+            continue
+        optimized.append(instruction)
+    return optimized
+
+
+def remove_dead_writes(program):
+    """
+    Remove instructions that write a register or memory value that is never
+    read before it is written again, or before the program stops in the case of
+    registers.
+        Input: list(Instruction)
+        Output: list(Instruction)
+    """
+    graph = ControlFlowGraph(program)
+    analysis = DataFlow(graph)
+    reached = graph.reachable()
+    dead = set()
+    for block in graph.blocks:
+        if not reached[block.index]:
+            continue
+        live = analysis.live_out(block)
+        for instruction in reversed(block.instructions):
+            reads, writes = analysis.effects(instruction)
+            if instruction.opcode in WRITES_ONLY and not writes & live:
+                dead.add(id(instruction))
+            else:
+                live = (live & ~writes) | reads
+    optimized = list()
+    for instruction in program:
+        if id(instruction) in dead:
+            optimized += drop(instruction)
+        else:
+            optimized.append(instruction)
+    return optimized
+
+
+def remove_unused_labels(program):
+    """
+    Remove labels that are never branched to.
+        Input: list(Instruction)
+        Output: list(Instruction)
+    """
+    used = set()
+    for instruction in program:
+        label = branch_label(instruction)
+        if label is not None:
+            used.add(label.casefold())
+    optimized = list()
+    for instruction in program:
+        if instruction.label is None or instruction.label_name.casefold() in used:
+            optimized.append(instruction)
+        elif instruction.opcode is not None:
+            optimized.append(relabel(instruction, None))
+    return optimized
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1:])
+    else:
+        print("** error: Missing MAL filename argument **")
@@ -0,0 +1,386 @@
+"""
+MAL Syntax Checker Editing Session
+
+Keeps a MAL program and the evaluation of each of its lines between edits, for
+editors that check the program on every keystroke.  An edit replaces a range of
+lines with new text; only the new lines are stripped, tokenized, and evaluated,
+and the label definitions and branches are updated for the lines removed and
+added, so an edit takes time in proportion to its size.  Each line has a
+position that only grows down the program, and new lines take positions in the
+gap between their neighbours, so the definitions of a label are kept in order
+without numbering the lines after an edit.  Only when a gap runs out are all the
+lines numbered again.  Each line keeps its
+Instruction record with its errors and warnings between checks, and a check only
+resolves the label warnings of the labels edited since the last check, so it
+takes time in proportion to the lines those labels are on.  The instructions of
+the checked program are numbered as they are listed.  Unreachable instructions
+and data flow warnings depend on the whole program, so with data flow checks
+on, a valid program is analyzed again on every check.
+"""
+__author__ = "Kenneth Berry"
+
+from bisect import insort
+from operator import attrgetter
+from mal import ERRORS, WARNINGS, LazyListing, Program, SyntaxChecker, strip_line
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Warnings that depend on the labels of the rest of the program
+MISSING_LABEL = "branch to missing label"
+UNUSED_LABEL = "label not branched to"
+
+# Warning of a valid program found from its control flow graph
+UNREACHABLE = "unreachable instruction"
+
+# Gap between the positions of neighbouring lines when they are numbered again
+POSITION_SPACING = 1 << 32
+
+# Key that sorts SessionLines down the program
+POSITION = attrgetter("position")
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def split_lines(text):
+    """
+    Split text into lines the same way read_source does, with "\\r\\n", "\\r" and
+    "\\n" each ending a line.
+        Input: str(text)
+        Output: list(str(line))
+    """
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class CheckSession:
+    """
+    Incremental syntax check of a MAL program that is being edited.  Lines are
+    counted from 0 and ranges of lines are given like slices.  A checked program
+    lists the session's own Instruction records, so it only holds until the next
+    edit.
+    """
+
+    def __init__(self, text='', dataflow=False):
+        self.__checker = SyntaxChecker()
+        self.__dataflow = dataflow  # Whether valid programs get data flow warnings
+        self.__lines = list()  # SessionLine of each original line
+        self.__labels = dict()  # {str(casefolded_label): SessionLabel}
+        self.__edited_labels = set()  # Casefolded labels edited since the last check
+        self.__instruction_count = 0  # Number of lines that are not blank
+        self.__error_count = {key: 0 for key in ERRORS}
+        self.__warning_count = {key: 0 for key in WARNINGS}
+        # Instruction given each control flow warning by the last check
+        self.__control_flow_warnings = list()
+        self.edit(0, 0, text)
+
+    def __len__(self):
+        return len(self.__lines)
+
+    @property
+    def text(self):
+        """
+        Text of the program.
+        """
+        return ''.join(line.original + '\n' for line in self.__lines)
+
+    def edit(self, start, end, text):
+        """
+        Replace lines of the program with new text.  An empty text deletes the
+        lines, and a range with no lines inserts the text before line start.
+            Input: int(start), int(end), str(text) of the new lines
+        """
+        if not 0 <= start <= end <= len(self.__lines):
+            raise IndexError("line range out of range")
+        for line in self.__lines[start:end]:
+            self.__remove(line)
+        new_lines = [self.__evaluate(original_line)
+                     for original_line in split_lines(text)]
+        self.__lines[start:end] = new_lines
+        self.__place(start, len(new_lines))
+        for line in new_lines:
+            self.__add(line)
+
+    def __place(self, start, count):
+        """
+        Give new lines positions between those of the lines before and after
+        them, numbering every line again if there is no room.
+            Input: int(start) of the new lines, int(count) of new lines
+        """
+        end = start + count
+        low = self.__lines[start - 1].position if start > 0 else 0
+        if end < len(self.__lines):
+            high = self.__lines[end].position
+        else:
+            high = low + (count + 1) * POSITION_SPACING
+        step = (high - low) // (count + 1)
+        if step == 0:
+            for line_num, line in enumerate(self.__lines, 1):
+                line.position = line_num * POSITION_SPACING
+            return
+        for line_num in range(start, end):
+            low += step
+            self.__lines[line_num].position = low
+
+    def __evaluate(self, original_line):
+        """
+        Strip and evaluate one original line.  The line number of the
+        Instruction is filled in when the program is listed.
+            Input: str(original_line)
+            Output: SessionLine
+        """
+        line = SessionLine(original_line)
+        # Lines that are only a comment are the most common kind of blank line
+        stripped_line = '' if original_line[:1] == ';' else strip_line(original_line)
+        if stripped_line != '':
+            line.instruction, line.label, line.branch_label = \
+                self.__checker.evaluate_line(0, stripped_line)
+            if line.instruction.diagnostics:
+                # A line has at most one error of its own
+                line.error = line.instruction.diagnostics[0]
+        return line
+
+    def __add(self, line):
+        """
+        Count the instruction and error of a new line, and add its label
+        definition and branch to their labels.
+            Input: SessionLine
+        """
+        if line.instruction is None:
+            return
+        self.__instruction_count += 1
+        if line.error is not None:
+            self.__error_count[line.error.key] += 1
+        if line.label is not None:
+            label = self.__label(line.label)
+            insort(label.definitions.setdefault(line.label, list()), line,
+                   key=POSITION)
+            label.definition_count += 1
+        if line.branch_label is not None:
+            label = self.__label(line.branch_label)
+            label.branches.add(line)
+            label.new_branches.add(line)
+
+    def __remove(self, line):
+        """
+        Take away the instruction, error, and warnings of a deleted line, and its
+        label definition and branch from their labels.  Labels left with no
+        definitions or branches are dropped.
+            Input: SessionLine
+        """
+        if line.instruction is None:
+            return
+        self.__instruction_count -= 1
+        if line.error is not None:
+            self.__error_count[line.error.key] -= 1
+        if line.missing_label:
+            self.__warning_count[MISSING_LABEL] -= 1
+        if line.unused_label:
+            self.__warning_count[UNUSED_LABEL] -= 1
+        if line.label is not None:
+            key = line.label.casefold()
+            label = self.__labels[key]
+            lines = label.definitions[line.label]
+            lines.remove(line)
+            if not lines:
+                del label.definitions[line.label]
+            label.definition_count -= 1
+            self.__edited_labels.add(key)
+            if label.definition_count == 0 and not label.branches:
+                del self.__labels[key]
+        if line.branch_label is not None:
+            key = line.branch_label.casefold()
+            label = self.__labels[key]
+            label.branches.discard(line)
+            label.new_branches.discard(line)
+            self.__edited_labels.add(key)
+            if label.definition_count == 0 and not label.branches:
+                del self.__labels[key]
+
+    def __label(self, label):
+        """
+        Get a label, adding it if it has no definitions or branches yet, and mark
+        it as edited.
+            Input: str(label)
+            Output: SessionLabel
+        """
+        key = label.casefold()
+        self.__edited_labels.add(key)
+        counts = self.__labels.get(key)
+        if counts is None:
+            counts = SessionLabel()
+            self.__labels[key] = counts
+        return counts
+
+    def check(self):
+        """
+        Get the checked program, the same as SyntaxChecker.check_lines gives for
+        the text of the program.
+            Output: Program, tuple(counts)
+        """
+        # Take away the control flow warnings of the last check, which come last
+        for instruction in self.__control_flow_warnings:
+            instruction.diagnostics.pop()
+            if not instruction.diagnostics:
+                instruction.diagnostics = None
+        self.__control_flow_warnings = list()
+
+        for key in self.__edited_labels:
+            if key in self.__labels:
+                self.__resolve_branches(self.__labels[key])
+                self.__resolve_definitions(self.__labels[key])
+        self.__edited_labels = set()
+
+        error_count = dict(self.__error_count)
+        warning_count = dict(self.__warning_count)
+        program = Program(SessionListing(self.__original_lines, len(self.__lines)),
+                          SessionListing(self.__instructions, self.__instruction_count))
+
+        # Check for unreachable instructions, uninitialized registers, and dead
+        # stores in valid programs.  The label warnings of a valid program are
+        # the same as those of its control flow graph.
+        if self.__dataflow and sum(error_count.values()) == 0:
+            # Imported here since the control flow graph and the data flow
+            # analysis are built on mal
+            from mal_cfg import ControlFlowGraph
+            from mal_dataflow import find_warnings
+
+            instructions = list(program.instructions)
+            graph = ControlFlowGraph(instructions)
+            warnings = [(instruction, UNREACHABLE) + instruction.opcode_position()
+                        for instruction in graph.findings()[0]]
+            warnings += [(instruction, warning, operand, None) for instruction, warning,
+                         operand in find_warnings(instructions, graph)]
+            for instruction, warning, operand, column in warnings:
+                instruction.add_diagnostic(warning, operand, column)
+                warning_count[warning] += 1
+                self.__control_flow_warnings.append(instruction)
+        return program, (error_count, warning_count)
+
+    def __resolve_branches(self, label):
+        """
+        Warn about the branches to a label if it is missing.  Only new branches
+        need a look unless the label has gone missing or been defined since the
+        last check.  A line with an error of its own gets no warning.
+            Input: SessionLabel
+        """
+        missing = label.definition_count == 0
+        lines = label.branches if missing != label.missing else label.new_branches
+        label.missing = missing
+        for line in lines:
+            if line.error is None and line.missing_label != missing:
+                line.missing_label = missing
+                self.__warning_count[MISSING_LABEL] += 1 if missing else -1
+                self.__diagnose(line)
+        label.new_branches.clear()
+
+    def __resolve_definitions(self, label):
+        """
+        Warn if a label is not branched to, on only the last definition of each
+        spelling and if the line does not contain an error.
+            Input: SessionLabel
+        """
+        for lines in label.definitions.values():
+            last = lines[-1]
+            for line in lines:
+                if line.unused_label:
+                    line.unused_label = False
+                    self.__warning_count[UNUSED_LABEL] -= 1
+                    self.__diagnose(line)
+                if line is last and not label.branches and line.error is None:
+                    line.unused_label = True
+                    self.__warning_count[UNUSED_LABEL] += 1
+                    self.__diagnose(line)
+
+    def __diagnose(self, line):
+        """
+        Make the errors and warnings of a line's Instruction again from its own
+        error and label warnings.
+            Input: SessionLine
+        """
+        instruction = line.instruction
+        instruction.diagnostics = None if line.error is None else [line.error]
+        if line.missing_label:
+            instruction.add_diagnostic(MISSING_LABEL, line.branch_label)
+        if line.unused_label:
+            instruction.add_diagnostic(UNUSED_LABEL, line.label, 1)
+
+    def __original_lines(self):
+        """
+        Generate the original lines of the program.
+            Output: iter(str(original_line))
+        """
+        for line in self.__lines:
+            yield line.original
+
+    def __instructions(self):
+        """
+        Generate the Instruction records of the program, numbering them and
+        their errors and warnings by the lines they are on now.
+            Output: iter(Instruction)
+        """
+        for line_num, line in enumerate(self.__lines, 1):
+            instruction = line.instruction
+            if instruction is None:
+                continue
+            instruction.line = line_num
+            if instruction.diagnostics:
+                for diagnostic in instruction.diagnostics:
+                    diagnostic.line = line_num
+            yield instruction
+
+
+class SessionListing(LazyListing):
+    """
+    Listing of the lines or instructions of a CheckSession, whose length is
+    known without listing them.
+    """
+
+    def __init__(self, source, length):
+        super().__init__(source)
+        self.__length = length  # Number of lines or instructions
+
+    def __len__(self):
+        return self.__length
+
+
+class SessionLine:
+    """
+    One original line of a program in a CheckSession, with its evaluation.
+    """
+    __slots__ = ("original", "position", "instruction", "label", "branch_label",
+                 "error", "missing_label", "unused_label")
+
+    def __init__(self, original):
+        self.original = original  # Original line, without its line ending
+        self.position = 0  # Number growing down the program, not its line number
+        self.instruction = None  # Instruction with its diagnostics, or None if blank
+        self.label = None  # Label defined on the line, or None
+        self.branch_label = None  # Label branched to, or None
+        self.error = None  # Diagnostic of the line's own error, or None
+        self.missing_label = False  # Whether it warns of a branch to a missing label
+        self.unused_label = False  # Whether it warns its label is not branched to
+
+
+class SessionLabel:
+    """
+    Definitions of and branches to a casefolded label name.
+    """
+    __slots__ = ("definitions", "definition_count", "branches", "new_branches",
+                 "missing")
+
+    def __init__(self):
+        self.definitions = dict()  # Lines defining each spelling in order, {str: list}
+        self.definition_count = 0  # Number of lines that define the label
+        self.branches = set()  # SessionLines that branch to the label
+        self.new_branches = set()  # Branches added since the last check
+        self.missing = None  # Whether the label was missing at the last check
@@ -0,0 +1,240 @@
+"""
+MAL Checker Statistics
+
+Times the phases of a syntax check and counts what the check found.  Each phase
+records its wall clock time and its CPU time.  Tracing memory allocations slows
+a check down several times over, so the peak memory allocated while each phase
+ran is only measured if asked for, in a second run of the phases with tracemalloc
+tracing, and never in the run that is timed.  The statistics can be printed or
+written to a file in the Prometheus text format, for a node exporter's textfile
+collector.
+"""
+__author__ = "Kenneth Berry"
+
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Metric for each phase measurement, {str(field): (str(metric), str(help))}
+PHASE_METRICS = {"wall": ("mal_phase_wall_seconds",
+                          "Wall clock time of each phase of the check."),
+                 "cpu": ("mal_phase_cpu_seconds",
+                         "CPU time of each phase of the check."),
+                 "peak": ("mal_phase_peak_bytes",
+                          "Peak memory allocated during each phase of the check.")}
+
+# Metric for each counter, {str(counter): (str(metric), str(help))}
+COUNTER_METRICS = {"lines": ("mal_lines_total", "Lines in the MAL program."),
+                   "instructions": ("mal_instructions_total",
+                                    "Lines left after removing blank lines and comments."),
+                   "tokens": ("mal_tokens_total", "Tokens in the stripped lines."),
+                   "labels": ("mal_labels_total", "Label definitions.")}
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def no_phase(name):
+    """
+    Stand-in for CheckStats.phase when no statistics are kept.
+        Input: str(name)
+        Output: context manager that does nothing
+    """
+    return nullcontext()
+
+
+def escape_label(value):
+    """
+    Escape a Prometheus label value.
+        Input: str(value)
+        Output: str(escaped_value)
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class PhaseStats:
+    """
+    Measurements of one phase of a check.  A phase run more than once adds up its
+    times and keeps its highest peak.
+    """
+    __slots__ = ("wall", "cpu", "peak")
+
+    def __init__(self):
+        self.wall = 0.0  # Wall clock seconds
+        self.cpu = 0.0  # CPU seconds of this process
+        self.peak = 0  # Most bytes allocated at once, over the memory at the start
+
+
+class CheckStats:
+    """
+    Phase timers and counters of one syntax check.
+
+    Phases are timed, except between start_memory() and stop_memory(), when
+    tracemalloc traces memory allocations and phases only measure their peak
+    memory.  Phases should not be nested while memory is measured, since
+    tracemalloc has one peak for the whole process and each phase resets it.
+    """
+
+    def __init__(self, mal_file=None, memory=False):
+        self.mal_file = mal_file  # Checked file, or None
+        self.memory = memory  # Whether the peak memory of each phase is measured
+        self.phases = dict()  # {str(phase): PhaseStats}, in the order first run
+        self.counters = dict()  # {str(counter): int(count)}
+        self.errors = dict()  # Count of each type of error, {str(error): int}
+        self.warnings = dict()  # Count of each type of warning, {str(warning): int}
+        self.__measuring_memory = False
+        self.__started_tracing = False
+
+    def start_memory(self):
+        """
+        Start measuring the peak memory of phases instead of their times,
+        tracing memory allocations if they are not traced already.
+        """
+        self.__measuring_memory = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracing = True
+
+    def stop_memory(self):
+        """
+        Go back to timing phases, and stop tracing memory allocations if
+        start_memory() started tracing them.
+        """
+        self.__measuring_memory = False
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
+
+    def __phase_stats(self, name):
+        """
+        Get the measurements of a phase, adding them if the phase is new.
+            Input: str(name)
+            Output: PhaseStats
+        """
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = PhaseStats()
+            self.phases[name] = stats
+        return stats
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measure the code run in a with block as a phase of the check.
+            Input: str(name)
+        """
+        if self.__measuring_memory:
+            start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            try:
+                yield
+            finally:
+                peak = tracemalloc.get_traced_memory()[1] - start_memory
+                stats = self.__phase_stats(name)
+                stats.peak = max(stats.peak, peak)
+            return
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            stats = self.__phase_stats(name)
+            stats.wall += wall
+            stats.cpu += cpu
+
+    def count(self, counter, amount=1):
+        """
+        Add to a counter.
+            Input: str(counter), int(amount)
+        """
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def add_counts(self, counts):
+        """
+        Add the error and warning counts of a check.
+            Input: tuple(dict({str(error): int}), dict({str(warning): int}))
+        """
+        for totals, check_counts in zip((self.errors, self.warnings), counts):
+            for key, value in check_counts.items():
+                totals[key] = totals.get(key, 0) + value
+
+    def __str__(self):
+        lines = ["{:<10} {:>10} {:>10}".format("phase", "wall (s)", "cpu (s)")]
+        if self.memory:
+            lines[0] += " {:>12}".format("peak (KiB)")
+        for name, stats in self.phases.items():
+            line = "{:<10} {:>10.4f} {:>10.4f}".format(name, stats.wall, stats.cpu)
+            if self.memory:
+                line += " {:>12.1f}".format(stats.peak / 1024)
+            lines.append(line)
+        lines.append("{:<10} {:>10.4f} {:>10.4f}".format(
+            "total", sum(stats.wall for stats in self.phases.values()),
+            sum(stats.cpu for stats in self.phases.values())))
+        lines.append("")
+        for counter, count in self.counters.items():
+            lines.append("{} = {}".format(counter, count))
+        for severity, counts in (("error", self.errors), ("warning", self.warnings)):
+            for key, count in counts.items():
+                if count > 0:
+                    lines.append("{}: {} = {}".format(severity, key, count))
+        return '\n'.join(lines)
+
+    def to_prometheus(self):
+        """
+        Make the statistics in the Prometheus text exposition format.  Every
+        sample is labelled with the checked file, if there is one.
+            Output: str(metrics)
+        """
+        lines = list()
+
+        def sample(metric, value, **labels):
+            if self.mal_file is not None:
+                labels = dict(file=self.mal_file, **labels)
+            text = ','.join('{}="{}"'.format(name, escape_label(label))
+                            for name, label in labels.items())
+            lines.append("{}{} {}".format(metric, "{" + text + "}" if text else "",
+                                          value))
+
+        for field, (metric, help_text) in PHASE_METRICS.items():
+            if field == "peak" and not self.memory:
+                continue
+            lines.append("# HELP {} {}".format(metric, help_text))
+            lines.append("# TYPE {} gauge".format(metric))
+            for name, stats in self.phases.items():
+                sample(metric, getattr(stats, field), phase=name)
+        for counter, count in self.counters.items():
+            metric, help_text = COUNTER_METRICS.get(
+                counter, ("mal_{}_total".format(counter), "Count of " + counter + "."))
+            lines.append("# HELP {} {}".format(metric, help_text))
+            lines.append("# TYPE {} counter".format(metric))
+            sample(metric, count)
+        metric = "mal_diagnostics_total"
+        lines.append("# HELP {} Errors and warnings of each type.".format(metric))
+        lines.append("# TYPE {} counter".format(metric))
+        for severity, counts in (("error", self.errors), ("warning", self.warnings)):
+            for key, count in counts.items():
+                sample(metric, count, severity=severity, type=key)
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """
+        Write the statistics to a file in the Prometheus text format.  The file
+        is replaced in one step, so a collector never reads half of it.
+            Input: str(path)
+        """
+        temporary = path + ".tmp"
+        with open(temporary, 'w') as file:
+            file.write(self.to_prometheus())
+        os.replace(temporary, path)
@@ -0,0 +1,253 @@
+"""
+MAL Vector Machine
+
+Runs one checked MAL program over many input memories at once.  Registers and
+memory are NumPy arrays with one lane per input, and each lane has its own
+program counter.  Each step runs the instruction at the lowest program counter of
+any running lane for every lane that is at that instruction, so lanes that
+branch apart join up again as soon as their paths meet.
+
+NumPy is optional; it is only needed to run programs in this module.
+"""
+__author__ = "Kenneth Berry"
+
+import sys
+import time
+from mal import OPCODE_IDS, REGISTERS, SyntaxChecker
+from mal_vm import DEFAULT_MAX_STEPS, RunResult, register_index, resolve_labels
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Type of the register and memory values; they wrap around where Python ints would not
+VALUE_TYPE = "int64"
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def main(args):
+    """
+    Main function.  Runs a MAL program over random memories and prints the
+    instructions per second.
+        Input: list(args), the MAL file, the number of memories, and the names
+               of the memory values to fill in
+    """
+    mal_file = args[0]
+    if ".mal" not in mal_file.lower():
+        mal_file += ".mal"
+    lane_count = int(args[1]) if len(args) > 1 else 100000
+    names = args[2:]
+
+    try:
+        if numpy is None:
+            raise RuntimeError("NumPy is needed to run the vector machine")
+        machine = load_file(mal_file)
+        columns = {name: numpy.random.default_rng(0).integers(0, 100, lane_count)
+                   for name in names}
+        start = time.perf_counter()
+        result = machine.run(columns)
+        elapsed = time.perf_counter() - start
+    except (ValueError, RuntimeError) as error:
+        print(("** error: {} **").format(error))
+        return
+
+    for name, values in result.memory.items():
+        print(("{} = {}").format(name, values))
+    instruction_count = int(result.steps.sum())
+    print(("{} instructions over {} memories in {:.6f} s ({:.0f} instructions/sec)")
+          .format(instruction_count, lane_count, elapsed,
+                  instruction_count / elapsed if elapsed > 0 else 0))
+
+
+def load_file(mal_file):
+    """
+    Check a MAL program file and load it into a vector machine.
+        Input: str(mal_file)
+        Output: VectorMachine
+    """
+    program, counts = SyntaxChecker().check(mal_file)
+    error_count, _ = counts
+    if sum(error_count.values()) > 0:
+        raise ValueError(("{} is not a valid MAL program").format(mal_file))
+    return VectorMachine(program.instructions)
+
+
+def run_columns(mal_file, columns, max_steps=DEFAULT_MAX_STEPS):
+    """
+    Run a MAL program file once for each row of the input columns.
+        Input: str(mal_file), dict({str(name): array(values)}), int(max_steps)
+        Output: dict({str(name): array(values)}) final memory columns
+    """
+    return load_file(mal_file).run(columns, max_steps).memory
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class VectorMachine:
+    """
+    Virtual machine loaded with a checked MAL program, running many memories at
+    once.
+    """
+
+    def __init__(self, instructions):
+        if numpy is None:
+            raise RuntimeError("NumPy is needed to run the vector machine")
+        code, labels = resolve_labels(instructions)
+        self.__slots = dict()  # Memory slot of each identifier, {str(name): int}
+        self.__names = list()  # Identifier of each memory slot, as first written
+        self.__size = len(code)
+        # Operands decoded once, indexed by instruction
+        self.__code = list()
+        for index, instruction in enumerate(code):
+            self.__code.append(self.__decode(instruction, labels, index + 1))
+
+    def __slot(self, name):
+        """
+        Get the memory slot for an identifier, adding one if it is new.
+            Input: str(name)
+            Output: int(slot)
+        """
+        key = name.casefold()
+        if key not in self.__slots:
+            self.__slots[key] = len(self.__names)
+            self.__names.append(name)
+        return self.__slots[key]
+
+    def __target(self, labels, label):
+        """
+        Get the instruction index for a branch to a label.
+            Input: dict(labels), str(label)
+            Output: int(index)
+        """
+        try:
+            return labels[label.casefold()]
+        except KeyError:
+            raise ValueError(("branch to missing label {}").format(label)) from None
+
+    def __decode(self, instruction, labels, next_pc):
+        """
+        Decode an instruction into its opcode id and operand indices.
+            Input: Instruction, dict(labels), int(next_pc)
+            Output: tuple(int(opcode), operands..., int(next_pc))
+        """
+        opcode = instruction.opcode
+        operands = instruction.operands
+        if opcode in (OPCODE_IDS["LOAD"], OPCODE_IDS["STORE"]):
+            return opcode, register_index(operands[0]), self.__slot(operands[1]), next_pc
+        if opcode == OPCODE_IDS["LOADI"]:
+            return opcode, register_index(operands[0]), int(operands[1], 8), next_pc
+        if opcode in (OPCODE_IDS["ADD"], OPCODE_IDS["SUB"]):
+            return (opcode,) + tuple(register_index(operand) for operand in operands) \
+                + (next_pc,)
+        if opcode in (OPCODE_IDS["INC"], OPCODE_IDS["DEC"]):
+            return opcode, register_index(operands[0]), next_pc
+        if opcode in (OPCODE_IDS["BEQ"], OPCODE_IDS["BLT"], OPCODE_IDS["BGT"]):
+            return (opcode, register_index(operands[0]), register_index(operands[1]),
+                    self.__target(labels, operands[2]), next_pc)
+        if opcode == OPCODE_IDS["BR"]:
+            return opcode, self.__target(labels, operands[0])
+        if opcode == OPCODE_IDS["END"]:
+            return opcode, self.__size
+        return opcode, next_pc
+
+    def run(self, columns, max_steps=DEFAULT_MAX_STEPS):
+        """
+        Run the program once for each row of the input columns, from the first
+        instruction until END, or until it runs off the end of the program.
+            Input: dict({str(name): array(values)}) initial memory columns,
+                   int(max_steps) for each row
+            Output: RunResult with arrays of final memory and register values and
+                    of the instructions each row ran
+        """
+        lane_count = None
+        for name, values in columns.items():
+            if lane_count is None:
+                lane_count = len(values)
+            elif len(values) != lane_count:
+                raise ValueError(("column {} has {} values, expected {}").format(
+                    name, len(values), lane_count))
+        lane_count = lane_count or 0
+
+        registers = numpy.zeros((len(REGISTERS), lane_count), dtype=VALUE_TYPE)
+        memory = numpy.zeros((len(self.__names), lane_count), dtype=VALUE_TYPE)
+        for name, values in columns.items():
+            if name.casefold() in self.__slots:
+                memory[self.__slots[name.casefold()]] = values
+        pc = numpy.zeros(lane_count, dtype=VALUE_TYPE)
+        steps = numpy.zeros(lane_count, dtype=VALUE_TYPE)
+
+        load, loadi, store, add, sub, inc, dec, beq, blt, bgt = (
+            OPCODE_IDS[opcode] for opcode in ("LOAD", "LOADI", "STORE", "ADD", "SUB",
+                                              "INC", "DEC", "BEQ", "BLT", "BGT"))
+        code = self.__code
+        size = self.__size
+        everything = slice(None)
+        step_count = 0
+        while lane_count:
+            current = int(pc.min())
+            if current >= size:
+                break
+            lanes = pc == current
+            if lanes.all():
+                # Every lane is at this instruction, so no lanes need picking out
+                lanes = everything
+            instruction = code[current]
+            opcode = instruction[0]
+            if opcode == load:
+                registers[instruction[1], lanes] = memory[instruction[2], lanes]
+            elif opcode == loadi:
+                registers[instruction[1], lanes] = instruction[2]
+            elif opcode == store:
+                memory[instruction[2], lanes] = registers[instruction[1], lanes]
+            elif opcode == add:
+                registers[instruction[1], lanes] = (registers[instruction[2], lanes]
+                                                    + registers[instruction[3], lanes])
+            elif opcode == sub:
+                registers[instruction[1], lanes] = (registers[instruction[2], lanes]
+                                                    - registers[instruction[3], lanes])
+            elif opcode == inc:
+                registers[instruction[1], lanes] += 1
+            elif opcode == dec:
+                registers[instruction[1], lanes] -= 1
+
+            if opcode == beq or opcode == blt or opcode == bgt:
+                first = registers[instruction[1], lanes]
+                second = registers[instruction[2], lanes]
+                if opcode == beq:
+                    taken = first == second
+                elif opcode == blt:
+                    taken = first < second
+                else:
+                    taken = first > second
+                pc[lanes] = numpy.where(taken, instruction[3], instruction[4])
+            else:
+                pc[lanes] = instruction[-1]
+            steps[lanes] += 1
+
+            step_count += 1
+            # Lanes that stopped on the last instruction they may run are done
+            if step_count >= max_steps and ((steps >= max_steps) & (pc < size)).any():
+                raise RuntimeError(("MAL program did not stop after {} instructions")
+                                   .format(int(steps.max())))
+
+        return RunResult(dict(zip(self.__names, memory)), registers, steps)
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1:])
+    else:
+        print("** error: Missing MAL filename argument **")
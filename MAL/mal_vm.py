@@ -0,0 +1,310 @@
+"""
+MAL Virtual Machine
+
+Runs MAL programs that have passed the syntax checker.  Labels are resolved to
+instruction indices when a program is loaded, registers and memory are kept in
+flat lists, and each instruction is decoded once into a closure taken from a
+dispatch table indexed by opcode id, so nothing is compared as a string while the
+program runs.
+"""
+__author__ = "Kenneth Berry"
+
+import sys
+import time
+from mal import OPCODE_IDS, REGISTERS, SyntaxChecker
+
+#########################################################################################
+#                                   Module Constants                                    #
+#########################################################################################
+
+# Default limit on the number of instructions run, so loops that never end stop
+DEFAULT_MAX_STEPS = 10 ** 8
+
+# Program counter value that stops the machine
+HALT = -1
+
+#########################################################################################
+#                                   Module Functions                                    #
+#########################################################################################
+
+
+def main(args):
+    """
+    Main function.  Runs a MAL program with the given memory values and prints the
+    final memory and registers, and the instructions per second.
+        Input: list(args), the MAL file followed by NAME=value memory values
+    """
+    mal_file = args[0]
+    if ".mal" not in mal_file.lower():
+        mal_file += ".mal"
+    memory = dict()
+    for arg in args[1:]:
+        name, value = arg.split('=')
+        memory[name] = int(value)
+
+    try:
+        machine = load_file(mal_file)
+        start = time.perf_counter()
+        result = machine.run(memory)
+        elapsed = time.perf_counter() - start
+    except (ValueError, RuntimeError) as error:
+        print(("** error: {} **").format(error))
+        return
+
+    for name, value in result.memory.items():
+        print(("{} = {}").format(name, value))
+    print(' '.join(("{}={}").format(register, value)
+                   for register, value in zip(REGISTERS, result.registers)))
+    print(("{} instructions in {:.6f} s ({:.0f} instructions/sec)").format(
+        result.steps, elapsed, result.steps / elapsed if elapsed > 0 else 0))
+
+
+def load_file(mal_file):
+    """
+    Check a MAL program file and load it into a machine.
+        Input: str(mal_file)
+        Output: MALMachine
+    """
+    program, counts = SyntaxChecker().check(mal_file)
+    error_count, _ = counts
+    if sum(error_count.values()) > 0:
+        raise ValueError(("{} is not a valid MAL program").format(mal_file))
+    return MALMachine(program.instructions)
+
+
+def register_index(register):
+    """
+    Get the index of a register in the register list.
+        Input: str(register)
+        Output: int(index)
+    """
+    return REGISTERS.index(register.upper())
+
+
+def resolve_labels(instructions):
+    """
+    Make the list of executable instructions and find the instruction index each
+    label refers to.  A label on a line by itself refers to the next instruction.
+        Input: iter(Instruction)
+        Output: list(Instruction), dict({str(casefolded_label): int(index)})
+    """
+    code = list()
+    labels = dict()
+    for instruction in instructions:
+        if instruction.label is not None:
+            labels[instruction.label_name.casefold()] = len(code)
+        if instruction.opcode is not None:
+            code.append(instruction)
+    return code, labels
+
+#########################################################################################
+#                                   Module Classes                                      #
+#########################################################################################
+
+
+class MALMachine:
+    """
+    Virtual machine loaded with a checked MAL program.
+    """
+
+    def __init__(self, instructions):
+        code, labels = resolve_labels(instructions)
+        self.__slots = dict()  # Memory slot of each identifier, {str(name): int}
+        self.__names = list()  # Identifier of each memory slot, as first written
+        self.registers = [0] * len(REGISTERS)
+        self.memory = list()
+        dispatch = self.__dispatch_table()
+        self.__code = list()
+        for index, instruction in enumerate(code):
+            self.__code.append(dispatch[instruction.opcode](
+                instruction.operands, labels, index + 1))
+
+    def __slot(self, name):
+        """
+        Get the memory slot for an identifier, adding one if it is new.
+            Input: str(name)
+            Output: int(slot)
+        """
+        key = name.casefold()
+        if key not in self.__slots:
+            self.__slots[key] = len(self.__names)
+            self.__names.append(name)
+            self.memory.append(0)
+        return self.__slots[key]
+
+    def __target(self, labels, label):
+        """
+        Get the instruction index for a branch to a label.
+            Input: dict(labels), str(label)
+            Output: int(index)
+        """
+        try:
+            return labels[label.casefold()]
+        except KeyError:
+            raise ValueError(("branch to missing label {}").format(label)) from None
+
+    def __dispatch_table(self):
+        """
+        Make the table of instruction decoders, indexed by opcode id.  Each decoder
+        takes the operands, the label table, and the index of the next instruction,
+        and returns a closure that runs the instruction and returns the index of
+        the instruction to run after it.
+            Output: list(decoders)
+        """
+        regs = self.registers
+        mem = self.memory
+
+        def load(operands, labels, next_pc):
+            r, s = register_index(operands[0]), self.__slot(operands[1])
+
+            def run():
+                regs[r] = mem[s]
+                return next_pc
+            return run
+
+        def loadi(operands, labels, next_pc):
+            r, value = register_index(operands[0]), int(operands[1], 8)
+
+            def run():
+                regs[r] = value
+                return next_pc
+            return run
+
+        def store(operands, labels, next_pc):
+            r, d = register_index(operands[0]), self.__slot(operands[1])
+
+            def run():
+                mem[d] = regs[r]
+                return next_pc
+            return run
+
+        def add(operands, labels, next_pc):
+            r1, r2, r3 = (register_index(operand) for operand in operands)
+
+            def run():
+                regs[r1] = regs[r2] + regs[r3]
+                return next_pc
+            return run
+
+        def sub(operands, labels, next_pc):
+            r1, r2, r3 = (register_index(operand) for operand in operands)
+
+            def run():
+                regs[r1] = regs[r2] - regs[r3]
+                return next_pc
+            return run
+
+        def inc(operands, labels, next_pc):
+            r = register_index(operands[0])
+
+            def run():
+                regs[r] += 1
+                return next_pc
+            return run
+
+        def dec(operands, labels, next_pc):
+            r = register_index(operands[0])
+
+            def run():
+                regs[r] -= 1
+                return next_pc
+            return run
+
+        def beq(operands, labels, next_pc):
+            r1, r2 = register_index(operands[0]), register_index(operands[1])
+            target = self.__target(labels, operands[2])
+
+            def run():
+                return target if regs[r1] == regs[r2] else next_pc
+            return run
+
+        def blt(operands, labels, next_pc):
+            r1, r2 = register_index(operands[0]), register_index(operands[1])
+            target = self.__target(labels, operands[2])
+
+            def run():
+                return target if regs[r1] < regs[r2] else next_pc
+            return run
+
+        def bgt(operands, labels, next_pc):
+            r1, r2 = register_index(operands[0]), register_index(operands[1])
+            target = self.__target(labels, operands[2])
+
+            def run():
+                return target if regs[r1] > regs[r2] else next_pc
+            return run
+
+        def br(operands, labels, next_pc):
+            target = self.__target(labels, operands[0])
+
+            def run():
+                return target
+            return run
+
+        def noop(operands, labels, next_pc):
+            def run():
+                return next_pc
+            return run
+
+        def end(operands, labels, next_pc):
+            def run():
+                return HALT
+            return run
+
+        decoders = {"LOAD": load, "LOADI": loadi, "STORE": store, "ADD": add,
+                    "SUB": sub, "INC": inc, "DEC": dec, "BEQ": beq, "BLT": blt,
+                    "BGT": bgt, "BR": br, "NOOP": noop, "END": end}
+        table = [None] * len(OPCODE_IDS)
+        for opcode, opcode_id in OPCODE_IDS.items():
+            table[opcode_id] = decoders[opcode]
+        return table
+
+    def run(self, memory=None, max_steps=DEFAULT_MAX_STEPS):
+        """
+        Run the program from the first instruction until END, or until it runs off
+        the end of the program.
+            Input: dict({str(name): int(value)}) initial memory, int(max_steps)
+            Output: RunResult
+        """
+        regs = self.registers
+        mem = self.memory
+        regs[:] = [0] * len(regs)
+        mem[:] = [0] * len(mem)
+        for name, value in (memory or dict()).items():
+            if name.casefold() in self.__slots:
+                mem[self.__slots[name.casefold()]] = value
+
+        code = self.__code
+        size = len(code)
+        pc = 0
+        steps = 0
+        while 0 <= pc < size:
+            pc = code[pc]()
+            steps += 1
+            if steps >= max_steps and 0 <= pc < size:
+                raise RuntimeError(("MAL program did not stop after {} instructions")
+                                   .format(steps))
+        return RunResult(dict(zip(self.__names, mem)), list(regs), steps)
+
+
+class RunResult:
+    """
+    Final memory and registers of a MAL program run, and the number of
+    instructions it ran.
+    """
+
+    def __init__(self, memory, registers, steps):
+        self.memory = memory  # {str(name): int(value)}
+        self.registers = registers  # list(int(value)) for R0-R7
+        self.steps = steps
+
+
+#########################################################################################
+#                                   Main Entry Point                                    #
+#########################################################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1:])
+    else:
+        print("** error: Missing MAL filename argument **")
@@ -0,0 +1,113 @@
+"""
+Tests the MAL Compiler Against the Virtual Machine
+
+Makes random valid MAL programs with loops and branches, runs each one with
+random memory values both in the virtual machine and compiled, and compares the
+memory, registers, and instruction counts of the two runs.  A program the
+virtual machine does not finish within the step limit must not finish within
+the limit when compiled either; the compiled program counts the instructions of
+a whole block at a time, so it may stop a few instructions past the limit.
+Programs that stop are run again with a limit of exactly the instructions they
+ran, which both must allow.
+
+python test_mal_compiler.py [programs] [seed]
+"""
+import random
+import sys
+from mal import SourceLines, SyntaxChecker
+from mal_compiler import compile_program
+from mal_vm import MALMachine
+
+MAX_STEPS = 5000
+
+# Names of the memory values and labels the programs use
+NAMES = ["A", "B", "SUM", "x", "Count"]
+LABELS = ["LOOP", "DONE", "AGAIN", "NEXT", "skip"]
+
+
+def random_program(rng):
+    """
+    Make the text of a random MAL program.  Some programs branch to a label
+    after the last instruction, and labels may be written in other cases where
+    they are branched to.
+        Input: Random
+        Output: str(text)
+    """
+    labels = rng.sample(LABELS, rng.randint(0, len(LABELS)))
+
+    def register():
+        return "R" + str(rng.randint(0, 7))
+
+    def label():
+        name = rng.choice(labels)
+        return name.swapcase() if rng.random() < 0.2 else name
+
+    lines = list()
+    for _ in range(rng.randint(len(LABELS), 30)):
+        opcode = rng.choice(["LOAD", "LOADI", "STORE", "ADD", "SUB", "INC", "DEC",
+                             "NOOP", "BEQ", "BLT", "BGT", "BR", "END"])
+        if opcode in ("LOAD", "STORE"):
+            line = ("{} {}, {}").format(opcode, register(), rng.choice(NAMES))
+        elif opcode == "LOADI":
+            line = ("LOADI {}, {:o}").format(register(), rng.randint(0, 20))
+        elif opcode in ("ADD", "SUB"):
+            line = ("{} {}, {}, {}").format(opcode, register(), register(), register())
+        elif opcode in ("INC", "DEC"):
+            line = ("{} {}").format(opcode, register())
+        elif opcode in ("BEQ", "BLT", "BGT") and labels:
+            line = ("{} {}, {}, {}").format(opcode, register(), register(), label())
+        elif opcode == "BR" and labels:
+            line = ("BR {}").format(label())
+        elif opcode in ("NOOP", "END"):
+            line = opcode
+        else:
+            line = "NOOP"
+        lines.append(line)
+    for name, index in zip(labels, rng.sample(range(len(lines) + 1), len(labels))):
+        if index == len(lines):
+            lines.append(name + ":")
+        else:
+            lines[index] = name + ": " + lines[index]
+    return ''.join(line + '\n' for line in lines)
+
+
+def run(runner, memory, max_steps=MAX_STEPS):
+    """
+    Run a program, catching the error of a program that does not stop.
+        Input: MALMachine or CompiledProgram, dict(memory), int(max_steps)
+        Output: dict(result) or None if the program did not stop
+    """
+    try:
+        return vars(runner.run(memory, max_steps))
+    except RuntimeError:
+        return None
+
+
+if __name__ == "__main__":
+    programs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 3210
+    rng = random.Random(seed)
+    checker = SyntaxChecker()
+    runs = 0
+    problems = 0
+    while runs < programs:
+        program, counts = checker.check_lines(SourceLines(random_program(rng)))
+        if sum(counts[0].values()) > 0:
+            continue
+        instructions = list(program.instructions)
+        memory = {name: rng.randint(-10, 10) for name in NAMES}
+        machine = MALMachine(instructions)
+        compiled_program = compile_program(instructions)
+        interpreted = run(machine, memory)
+        compiled = run(compiled_program, memory)
+        runs += 1
+        if interpreted is not None:
+            steps = interpreted["steps"]
+            problems += compiled != interpreted \
+                or run(machine, memory, steps) != interpreted \
+                or run(compiled_program, memory, steps) != interpreted
+        else:
+            problems += compiled is not None and compiled["steps"] <= MAX_STEPS
+
+    print(problems, "of", runs, "compiled programs differ from the virtual machine")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,123 @@
+"""
+Tests Memory Mapped MAL Programs
+
+Reads programs with read_mapped and with read_source, and compares their lines,
+their line count, each line looked up by index, their stripped lines, and the
+report of checking them.  Programs mix "\\r", "\\n" and "\\r\\n" line endings,
+with and without a line ending at the end of the file, and the mapping is split
+into chunks of only a few bytes, so line endings fall on every side of a chunk
+boundary.  An empty file and the programs in this directory are read as well.
+
+python test_mal_mapped.py [programs] [seed]
+"""
+import io
+import os
+import random
+import sys
+import tempfile
+from mal import (MappedLines, SyntaxChecker, SyntaxReport, iter_stripped, read_mapped,
+                 read_source)
+
+FILES = sorted(file for file in os.listdir() if file[-4:] == ".mal")
+
+# Bytes split into lines at a time, so that chunks end in every part of a line
+CHUNK_BYTES = [1, 2, 3, 5, 8, 13, 64]
+
+# Line endings read the same way as in text mode
+ENDINGS = [b'\n', b'\r', b'\r\n']
+
+# Lines of the generated programs
+LINES = [b'', b'LOAD R1, X', b'; comment', b'L: NOOP ; comment', b'\t', b'  ',
+         b'BR L', b'BR LOOP', b'END', b'ADD R1, R2', b'LOOP:\tINC R1']
+
+# Texts with only line endings, or none
+EDGE_CASES = [b'', b'\n', b'\r', b'\r\n', b'\n\r', b'\r\r\n\n', b'END', b'END\r',
+              b'END\r\n\r']
+
+
+def random_program(rng):
+    """
+    Make a random program, ending with a line ending or not.
+        Input: Random
+        Output: bytes(text)
+    """
+    lines = [rng.choice(LINES) + rng.choice(ENDINGS)
+             for _ in range(rng.randint(1, 30))]
+    if rng.random() < 0.5:
+        lines[-1] = lines[-1].rstrip(b'\r\n')
+    return b''.join(lines)
+
+
+def stripped(lines):
+    """
+    Strip the lines of a program the way a check does.
+        Input: MappedLines or SourceLines
+        Output: list((int(line_num), str(stripped_line)))
+    """
+    if isinstance(lines, MappedLines):
+        return list(lines.iter_stripped())
+    return list(iter_stripped(enumerate(lines, 1)))
+
+
+def report(file, mapped):
+    """
+    Check a program and render its report.
+        Input: str(file), bool(mapped)
+        Output: str(report)
+    """
+    text = io.StringIO()
+    SyntaxReport(file, SyntaxChecker().check(file, mapped=mapped)).render_to(text)
+    return text.getvalue()
+
+
+def differences(file):
+    """
+    Compare a program read with read_mapped and with read_source.
+        Input: str(file)
+        Output: list(str(difference))
+    """
+    mapped = read_mapped(file)
+    source = read_source(file)
+    found = list()
+    if list(mapped) != list(source):
+        found.append("lines")
+    if len(mapped) != len(source):
+        found.append("length")
+    if [mapped[index] for index in range(-len(source), len(source))] != \
+            [source[index] for index in range(-len(source), len(source))]:
+        found.append("lines by index")
+    if stripped(mapped) != stripped(source):
+        found.append("stripped lines")
+    if report(file, True) != report(file, False):
+        found.append("report")
+    return found
+
+
+if __name__ == "__main__":
+    programs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 3210
+    rng = random.Random(seed)
+
+    checks = 0
+    problems = 0
+    with tempfile.TemporaryDirectory() as directory:
+        files = list(FILES)
+        texts = EDGE_CASES + [random_program(rng) for _ in range(programs)]
+        for number, text in enumerate(texts):
+            mal_file = os.path.join(directory, ("program_{}.mal").format(number))
+            with open(mal_file, 'wb') as file:
+                file.write(text)
+            files.append(mal_file)
+
+        for chunk_bytes in CHUNK_BYTES:
+            MappedLines.CHUNK_BYTES = chunk_bytes
+            for file in files:
+                checks += 1
+                found = differences(file)
+                if found:
+                    problems += 1
+                    print(("** {} differs in its {} with {} byte chunks **").format(
+                        file, ", ".join(found), chunk_bytes))
+
+    print(problems, "of", checks, "mapped programs differ from reading them")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,110 @@
+"""
+Tests the MAL Optimizer Against the Virtual Machine
+
+Makes random valid MAL programs with loops and branches, optimizes each one, and
+runs the original and optimized programs in the virtual machine with the same
+random memory values.  The programs use only a few registers and small
+constants, and store often, so that constants are folded, writes are dead, and
+branches lead to branches and past code that can never be run.  Memory is the
+result of a program, so the final value of every memory name must be the same,
+counting a name the optimized program no longer uses as keeping its initial
+value.  The optimized program must stop whenever the original does, and run no
+more instructions.  Programs that do not stop within the step limit are only
+counted.
+
+python test_mal_optimizer.py [programs] [seed]
+"""
+import random
+import sys
+from mal import SourceLines, SyntaxChecker
+from mal_optimizer import optimize
+from mal_vm import MALMachine
+from test_mal_compiler import LABELS, MAX_STEPS, NAMES, run
+
+# Registers the programs use
+REGISTERS = ["R0", "R1", "R2", "r3"]
+
+# Opcodes of the programs, more than once to make them more likely
+OPCODES = ["LOADI"] * 4 + ["ADD", "SUB", "INC", "DEC"] * 3 + ["STORE"] * 4 \
+    + ["LOAD", "NOOP", "BEQ", "BLT", "BGT", "BR", "END"]
+
+
+def random_program(rng):
+    """
+    Make the text of a random MAL program.
+        Input: Random
+        Output: str(text)
+    """
+    labels = rng.sample(LABELS, rng.randint(0, len(LABELS)))
+
+    def register():
+        return rng.choice(REGISTERS)
+
+    lines = list()
+    for _ in range(rng.randint(len(LABELS), 40)):
+        opcode = rng.choice(OPCODES)
+        if opcode in ("LOAD", "STORE"):
+            line = ("{} {}, {}").format(opcode, register(), rng.choice(NAMES))
+        elif opcode == "LOADI":
+            line = ("LOADI {}, {:o}").format(register(), rng.randint(0, 9))
+        elif opcode in ("ADD", "SUB"):
+            line = ("{} {}, {}, {}").format(opcode, register(), register(), register())
+        elif opcode in ("INC", "DEC"):
+            line = ("{} {}").format(opcode, register())
+        elif opcode in ("BEQ", "BLT", "BGT") and labels:
+            line = ("{} {}, {}, {}").format(opcode, register(), register(),
+                                            rng.choice(labels))
+        elif opcode == "BR" and labels:
+            line = ("BR {}").format(rng.choice(labels))
+        elif opcode in ("NOOP", "END"):
+            line = opcode
+        else:
+            line = "NOOP"
+        lines.append(line)
+    for name, index in zip(labels, rng.sample(range(len(lines) + 1), len(labels))):
+        if index == len(lines):
+            lines.append(name + ":")
+        else:
+            lines[index] = name + ": " + lines[index]
+    return ''.join(line + '\n' for line in lines)
+
+
+def final_memory(initial, result):
+    """
+    Get the final value of every memory name, by name in any case.
+        Input: dict({str(name): int(value)}) initial memory, dict(result) of a run
+        Output: dict({str(casefolded_name): int(value)})
+    """
+    memory = {name.casefold(): value for name, value in initial.items()}
+    memory.update((name.casefold(), value) for name, value in result["memory"].items())
+    return memory
+
+
+if __name__ == "__main__":
+    programs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 3210
+    rng = random.Random(seed)
+    checker = SyntaxChecker()
+    runs = 0
+    endless = 0
+    problems = 0
+    while runs < programs:
+        program, counts = checker.check_lines(SourceLines(random_program(rng)))
+        if sum(counts[0].values()) > 0:
+            continue
+        instructions = list(program.instructions)
+        memory = {name: rng.randint(-10, 10) for name in NAMES}
+        original = run(MALMachine(instructions), memory)
+        runs += 1
+        if original is None:
+            endless += 1
+            continue
+        optimized = run(MALMachine(optimize(instructions)), memory)
+        if optimized is None \
+                or final_memory(memory, optimized) != final_memory(memory, original) \
+                or optimized["steps"] > original["steps"]:
+            problems += 1
+
+    print(problems, "of", runs, "optimized programs differ from the original,",
+          endless, "did not stop within", MAX_STEPS, "instructions")
+    sys.exit(1 if problems else 0)
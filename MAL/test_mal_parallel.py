@@ -0,0 +1,85 @@
+"""
+Tests Chunk-Parallel MAL Syntax Checks
+
+Checks programs in chunks in a pool of worker processes, and compares every
+report with the report of checking the same program in this process.  The
+programs are made long enough to be checked in parallel, and the chunks small
+enough that labels, branches, and duplicated labels fall in different chunks
+from each other.  Besides generated programs, all the programs in this directory
+are joined into one, so its duplicated labels and errors are split up as well.
+
+python test_mal_parallel.py [programs] [seed]
+"""
+import io
+import os
+import sys
+import tempfile
+import mal
+from mal import SyntaxChecker, SyntaxReport
+from mal_corpus import ProgramGenerator
+
+FILES = sorted(file for file in os.listdir() if file[-4:] == ".mal")
+
+# Lengths of the generated programs, some not a whole number of chunks
+LENGTHS = [40, 257, 1000]
+
+# Smallest program checked in parallel and fewest lines in a chunk, so that even
+# short programs are split into many chunks
+PARALLEL_LINES = 16
+MIN_CHUNK_LINES = 8
+
+# Worker processes each program is checked with
+WORKERS = [1, 2, 3]
+
+
+def render(checker, file, mapped, workers):
+    """
+    Check a program and render its report.
+        Input: SyntaxChecker, str(file), bool(mapped), int(workers) or None
+        Output: str(report)
+    """
+    report = io.StringIO()
+    SyntaxReport(file, checker.check(file, mapped=mapped, workers=workers)).render_to(
+        report)
+    return report.getvalue()
+
+
+if __name__ == "__main__":
+    programs = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 3210
+    mal.PARALLEL_LINES = PARALLEL_LINES
+    mal.MIN_CHUNK_LINES = MIN_CHUNK_LINES
+
+    checks = 0
+    problems = 0
+    with tempfile.TemporaryDirectory() as directory:
+        files = list()
+        for number in range(programs):
+            for length in LENGTHS:
+                mal_file = os.path.join(directory, ("corpus_{}_{}.mal").format(
+                    number, length))
+                ProgramGenerator(length, seed + number, label_density=0.2,
+                                 error_rate=0.1).write(mal_file)
+                files.append(mal_file)
+        joined_file = os.path.join(directory, "joined.mal")
+        with open(joined_file, 'w') as joined:
+            for file in FILES:
+                with open(file, 'r') as mal_program:
+                    joined.write(mal_program.read())
+        files.append(joined_file)
+
+        for dataflow in (False, True):
+            checker = SyntaxChecker(dataflow)
+            for file in files:
+                for mapped in (False, True):
+                    expected = render(checker, file, mapped, None)
+                    for workers in WORKERS:
+                        checks += 1
+                        if render(checker, file, mapped, workers) != expected:
+                            problems += 1
+                            print(("** {} differs with {} workers, data flow {}, "
+                                   "mapped {} **").format(file, workers, dataflow,
+                                                          mapped))
+
+    print(problems, "of", checks, "parallel checks differ from checking in one process")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,77 @@
+"""
+Tests MAL Syntax Checker Editing Sessions
+
+Makes random sequences of edits to each MAL program in a CheckSession, and after
+every edit compares the report of the session with the report of checking the
+whole edited program again from the start.  Edits insert, delete, and replace
+ranges of lines, drawing new lines from the programs and from lines that define,
+duplicate, and branch to labels, so labels keep gaining and losing definitions
+and branches.
+
+python test_mal_session.py [edits] [seed]
+"""
+import io
+import os
+import random
+import sys
+from mal import SourceLines, SyntaxChecker, SyntaxReport
+from mal_session import CheckSession
+
+FILES = sorted(file for file in os.listdir() if file[-4:] == ".mal")
+
+# Lines that make and break label definitions and branches
+LABEL_LINES = ["LOOP: ADD R1, R2, R3", "loop: NOOP", "BR LOOP", "BR Loop", "DONE:",
+               "DONE: END", "BEQ R1, R2, DONE", "BLT R1, R2, TOOLONG", "BGT R0, R1, L1",
+               "L1: BR L1", "X9: INC R1", "ERROR: DEC R2", "BR ERROR", "BR", "",
+               "; comment", "    LOADI R1, 17 ; comment", "\tSTORE R1, SUM"]
+
+
+def render(mal_file, checker_output):
+    """
+    Render the report of a check.
+        Input: str(mal_file), tuple(checker_output)
+        Output: str(report)
+    """
+    report = io.StringIO()
+    SyntaxReport(mal_file, checker_output).render_to(report)
+    return report.getvalue()
+
+
+def random_text(rng, pool):
+    """
+    Make the text of up to four random lines.
+        Input: Random, list(str(line))
+        Output: str(text)
+    """
+    line_count = rng.choice([0, 1, 1, 1, 2, 4])
+    return ''.join(rng.choice(pool) + '\n' for _ in range(line_count))
+
+
+if __name__ == "__main__":
+    edits = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 3210
+    rng = random.Random(seed)
+    pool = list(LABEL_LINES)
+    for file in FILES:
+        with open(file, 'r') as mal_program:
+            pool.extend(mal_program.read().splitlines())
+
+    checks = 0
+    problems = 0
+    for file in FILES:
+        with open(file, 'r') as mal_program:
+            text = mal_program.read()
+        for dataflow in (False, True):
+            session = CheckSession(text, dataflow)
+            checker = SyntaxChecker(dataflow)
+            for _ in range(edits):
+                start = rng.randint(0, len(session))
+                end = rng.randint(start, min(start + 3, len(session)))
+                session.edit(start, end, random_text(rng, pool))
+                expected = checker.check_lines(SourceLines(session.text))
+                checks += 1
+                if render(file, session.check()) != render(file, expected):
+                    problems += 1
+
+    print(problems, "of", checks, "edited sessions differ from checking again")
+    sys.exit(1 if problems else 0)
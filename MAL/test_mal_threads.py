@@ -0,0 +1,78 @@
+"""
+Stress Tests a Shared MAL Syntax Checker
+
+Runs thousands of checks at once on one SyntaxChecker from a pool of threads,
+and compares every report with the report of the same program checked alone.
+Threads are switched as often as possible so that any state shared between
+checks would be corrupted.  Besides the programs in this directory, generated
+programs with many more distinct lines than the lexer's line table holds are
+checked, so lines are dropped from the shared table while other threads use it.
+
+python test_mal_threads.py [checks] [threads]
+"""
+import io
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from mal import SyntaxChecker, SyntaxReport
+from mal_corpus import ProgramGenerator
+from mal_lexer import LINE_TABLE_SIZE
+
+FILES = sorted(file for file in os.listdir() if file[-4:] == ".mal")
+
+# Generated programs, each with as many lines as the lexer's line table holds
+GENERATED_PROGRAMS = 8
+GENERATED_LINES = LINE_TABLE_SIZE
+
+# Checkers shared by every thread, and the modes each check uses
+CHECKERS = {False: SyntaxChecker(), True: SyntaxChecker(dataflow=True)}
+MODES = [(dataflow, stream) for dataflow in (False, True) for stream in (False, True)]
+
+
+def render(checker, file, stream):
+    """
+    Check a program and render its report.
+        Input: SyntaxChecker, str(file), bool(stream)
+        Output: str(report)
+    """
+    report = io.StringIO()
+    SyntaxReport(file, checker.check(file, stream)).render_to(report)
+    return report.getvalue()
+
+
+def check(number):
+    """
+    Run one check of the stress test.
+        Input: int(number)
+        Output: True if the report is the same as the report checked alone
+    """
+    file = FILES[number % len(FILES)]
+    dataflow, stream = MODES[number // len(FILES) % len(MODES)]
+    try:
+        return render(CHECKERS[dataflow], file, stream) == EXPECTED[file, dataflow]
+    except Exception:
+        # A check that fails part way is as wrong as a different report
+        return False
+
+
+if __name__ == "__main__":
+    checks = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    with tempfile.TemporaryDirectory() as directory:
+        for seed in range(GENERATED_PROGRAMS):
+            mal_file = os.path.join(directory, ("corpus_{}.mal").format(seed))
+            ProgramGenerator(GENERATED_LINES, seed, error_rate=0.05).write(mal_file)
+            FILES.append(mal_file)
+
+        # Reports of each program checked alone, by a checker of its own
+        EXPECTED = {(file, dataflow): render(SyntaxChecker(dataflow), file, False)
+                    for file in FILES for dataflow in (False, True)}
+
+        sys.setswitchinterval(1e-6)
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(check, range(checks)))
+        problems = results.count(False)
+
+    print(problems, "of", checks, "concurrent checks differ from checking alone")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,100 @@
+"""
+Tests the MAL Vector Machine Against the Virtual Machine
+
+Makes random valid MAL programs with loops and branches, runs each one over many
+random memories at once in the vector machine, and compares every lane with a
+run of the virtual machine on that lane's memory: the memory, registers, and
+instruction count must all be the same.  Only memories the virtual machine
+finishes within the step limit are run in the vector machine.
+
+The vector machine keeps its values in int64, so they wrap around where the
+virtual machine's Python ints keep growing.  A program that doubles a value past
+2 ** 63 is run to check that the vector machine gives the wrapped value.
+
+NumPy is optional, and without it the test is skipped.
+
+python test_mal_vector.py [programs] [seed]
+"""
+import random
+import sys
+from mal import SourceLines, SyntaxChecker
+from mal_vector import VectorMachine, numpy
+from mal_vm import MALMachine
+from test_mal_compiler import MAX_STEPS, NAMES, random_program, run
+
+# Memories run at once for each program
+LANES = 16
+
+# Program that doubles a memory value, and the value that it doubles past int64
+DOUBLE_PROGRAM = "LOAD R1, A\nADD R1, R1, R1\nSTORE R1, B\nEND\n"
+DOUBLED_VALUE = 2 ** 62
+
+
+def wrap(value):
+    """
+    Wrap a Python int around to an int64 value.
+        Input: int(value)
+        Output: int(value) from -2 ** 63 to 2 ** 63 - 1
+    """
+    return (value + 2 ** 63) % 2 ** 64 - 2 ** 63
+
+
+def lanes_differ(instructions, memories):
+    """
+    Run a program over memories in the vector machine and one at a time in the
+    virtual machine, with the virtual machine's values wrapped around to int64.
+        Input: list(Instruction), list(dict({str(name): int(value)}))
+        Output: int(lanes) that differ
+    """
+    results = [run(MALMachine(instructions), memory) for memory in memories]
+    memories = [memory for memory, result in zip(memories, results)
+                if result is not None]
+    results = [result for result in results if result is not None]
+    if not memories:
+        return 0
+    columns = {name: numpy.array([memory[name] for memory in memories])
+               for name in NAMES}
+    try:
+        lanes = VectorMachine(instructions).run(columns, MAX_STEPS)
+    except RuntimeError:
+        # Some lane did not stop where the virtual machine did
+        return len(results)
+    differ = 0
+    for lane, result in enumerate(results):
+        differ += any(int(values[lane]) != wrap(result["memory"][name])
+                      for name, values in lanes.memory.items()) \
+            or [int(values[lane]) for values in lanes.registers] \
+            != [wrap(value) for value in result["registers"]] \
+            or int(lanes.steps[lane]) != result["steps"]
+    return differ
+
+
+if __name__ == "__main__":
+    if numpy is None:
+        print("NumPy is not installed, so the vector machine is not tested")
+        sys.exit(0)
+    programs = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 3210
+    rng = random.Random(seed)
+    checker = SyntaxChecker()
+    runs = 0
+    problems = 0
+    while runs < programs:
+        program, counts = checker.check_lines(SourceLines(random_program(rng)))
+        if sum(counts[0].values()) > 0:
+            continue
+        memories = [{name: rng.randint(-10, 10) for name in NAMES}
+                    for _ in range(LANES)]
+        runs += 1
+        problems += lanes_differ(list(program.instructions), memories) > 0
+
+    # The virtual machine doubles past int64 and the vector machine wraps around
+    program, _ = checker.check_lines(SourceLines(DOUBLE_PROGRAM))
+    instructions = list(program.instructions)
+    doubled = run(MALMachine(instructions), {"A": DOUBLED_VALUE})["memory"]["B"]
+    runs += 1
+    problems += doubled != 2 * DOUBLED_VALUE or wrap(doubled) != -2 ** 63 \
+        or lanes_differ(instructions, [{name: DOUBLED_VALUE for name in NAMES}]) > 0
+
+    print(problems, "of", runs, "programs differ in the vector machine")
+    sys.exit(1 if problems else 0)